@@ -0,0 +1,187 @@
+# core/chunk_store.py
+"""
+会话级 chunk 存储：pool 中只保存引用，正文按 chunk_id 只存一份
+
+背景：
+- 每个 sub-goal 的 pool 在 contexts 中保存完整 chunk 正文，evidences 中又以 excerpt 存一份；
+  同一 chunk 被 5 个 sub-goal 召回就在内存、cache/step4_result.pkl、Step 6 prompt 里各复制 5 次
+- 这里改为：正文登记到 SessionChunkStore（按 chunk_id 去重），
+  contexts / evidences 中放 __slots__ 引用记录（ChunkRef / EvidenceRef），
+  读取 "text" / "excerpt" 时才从存储中取正文
+- 引用实现 Mapping 接口：c["text"]、c.get("source")、dict(c) 等旧用法不变
+- 序列化时正文只写一次（pickle 按对象去重；utils/step_cache 单独写正文行），各引用只写 key 与元数据
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sys
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+EXCERPT_CHARS = 300
+
+
+class SessionChunkStore:
+    """一次研究会话一个实例；线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts: Dict[str, str] = {}
+        self.stats = {"interned": 0, "reused": 0}
+
+    # ---------- 正文 ----------
+    def intern(self, text: str, *, chunk_id: str = "") -> str:
+        """
+        登记正文，返回 key：
+        - 原始 chunk 正文以 chunk_id 为 key（同一 chunk 只存一份）
+        - 扩展窗口等派生正文 / 无 chunk_id 时以内容摘要为 key
+        """
+        text = text or ""
+        key = chunk_id or ""
+        with self._lock:
+            existing = self._texts.get(key) if key else None
+            if existing is not None and existing != text:
+                key = ""  # 同一 chunk_id 的派生正文（如扩展窗口）
+            if not key:
+                digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+                key = f"{chunk_id}#{digest}"
+            if key in self._texts:
+                self.stats["reused"] += 1
+            else:
+                self._texts[key] = text
+                self.stats["interned"] += 1
+        return key
+
+    def restore(self, key: str, text: str) -> None:
+        """按已有 key 载入正文（读取缓存文件时使用）"""
+        with self._lock:
+            self._texts.setdefault(key, text)
+
+    def text(self, key: str) -> str:
+        return self._texts.get(key, "")
+
+    # ---------- 引用 ----------
+    def context(self, *, text: str, source: str, doc_id: str = "", chunk_id: str = "") -> "ChunkRef":
+        return ChunkRef(self, self.intern(text, chunk_id=chunk_id), chunk_id, doc_id, sys.intern(source or ""))
+
+    def evidence(
+        self,
+        *,
+        text: str,
+        doc_name: Optional[str],
+        doc_id: str,
+        chunk_id: str,
+        hit_count: int,
+        similarity: float,
+        vector_similarity: float,
+    ) -> "EvidenceRef":
+        return EvidenceRef(
+            self, self.intern(text, chunk_id=chunk_id), chunk_id, doc_id,
+            sys.intern(doc_name) if doc_name else doc_name,
+            hit_count, similarity, vector_similarity,
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "chunks": len(self._texts),
+                "chars": sum(len(t) for t in self._texts.values()),
+            }
+
+    # ---------- 序列化：锁不可 pickle ----------
+    def __getstate__(self):
+        with self._lock:
+            return {"texts": dict(self._texts), "stats": dict(self.stats)}
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self._texts = state["texts"]
+        self.stats = state["stats"]
+
+
+class ChunkRef(Mapping):
+    """
+    context 引用：键为 text / source / doc_id / chunk_id，以及 extra 中的附加字段
+    （rerank_score、expanded 等）。派生新字段用 replace()，不修改原引用。
+    """
+
+    __slots__ = ("store", "key", "chunk_id", "doc_id", "source", "extra")
+
+    def __init__(self, store, key, chunk_id, doc_id, source, extra=None):
+        self.store = store
+        self.key = key
+        self.chunk_id = chunk_id
+        self.doc_id = doc_id
+        self.source = source
+        self.extra = extra
+
+    def _fields(self) -> Dict[str, Any]:
+        return {"source": self.source, "doc_id": self.doc_id, "chunk_id": self.chunk_id, **(self.extra or {})}
+
+    def __getitem__(self, name: str) -> Any:
+        if name == "text":
+            return self.store.text(self.key)
+        return self._fields()[name]
+
+    def __iter__(self) -> Iterator[str]:
+        yield "text"
+        yield from self._fields()
+
+    def __len__(self) -> int:
+        return 1 + len(self._fields())
+
+    def replace(self, **fields) -> "ChunkRef":
+        key = self.key
+        if "text" in fields:
+            key = self.store.intern(fields.pop("text"), chunk_id=self.chunk_id)
+        return ChunkRef(
+            self.store, key, self.chunk_id, self.doc_id,
+            fields.pop("source", self.source), {**(self.extra or {}), **fields} or None,
+        )
+
+    def __repr__(self) -> str:
+        return f"ChunkRef(chunk_id={self.chunk_id!r}, source={self.source!r}, extra={self.extra!r})"
+
+
+class EvidenceRef(Mapping):
+    """evidence 引用：excerpt 取正文前 EXCERPT_CHARS 字"""
+
+    __slots__ = ("store", "key", "chunk_id", "doc_id", "doc_name", "hit_count", "similarity", "vector_similarity")
+
+    _KEYS = ("doc_name", "doc_id", "chunk_id", "hit_count", "similarity", "vector_similarity", "excerpt")
+
+    def __init__(self, store, key, chunk_id, doc_id, doc_name, hit_count, similarity, vector_similarity):
+        self.store = store
+        self.key = key
+        self.chunk_id = chunk_id
+        self.doc_id = doc_id
+        self.doc_name = doc_name
+        self.hit_count = hit_count
+        self.similarity = similarity
+        self.vector_similarity = vector_similarity
+
+    def __getitem__(self, name: str) -> Any:
+        if name == "excerpt":
+            return self.store.text(self.key)[:EXCERPT_CHARS].strip()
+        if name not in self._KEYS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+    def __repr__(self) -> str:
+        return f"EvidenceRef(chunk_id={self.chunk_id!r}, doc_name={self.doc_name!r})"
+
+
+def with_fields(context: Mapping, **fields) -> Mapping:
+    """派生 context（ChunkRef 保持为引用，普通 dict 返回拷贝）"""
+    if isinstance(context, ChunkRef):
+        return context.replace(**fields)
+    return {**context, **fields}
@@ -0,0 +1,327 @@
+# core/doc_text_store.py
+"""
+本地文档全文缓存（按 ragflow_document_id 存储）
+
+背景：
+- TODO：召回 chunk 时获取该 chunk 所在文件全文，并根据目标进行筛选
+- 直接做的话每次命中、每一轮都要从 RAGFlow 拉整篇文档；这里改为
+  解析完成时（parse_status_sync 检测到 parsed）拉取一次全部 chunk，落成本地紧凑文件，
+  之后检索命中时从本地 mmap 切片取相邻 chunk / 同页窗口，无网络开销
+
+存储格式（每个文档两个文件，<root>/<id 前两位>/<id>.txt / .idx）：
+- .txt：按文档顺序（页码 → 页内位置）拼接的 chunk 正文（UTF-8，chunk 间以换行分隔）
+- .idx：头部 <4sHII>（magic, 版本, chunk 数, id 表字节数）
+        + 每个 chunk 一条 <QII>（.txt 内字节偏移, 字节长度, 页码）
+        + chunk id 表（ASCII，换行分隔）
+- 先写 .txt 再写 .idx，均为临时文件 + os.replace；.idx 存在即视为完整
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.chunk_store import with_fields
+from core.evidence_rerank import tokenize
+
+DOC_TEXT_STORE_ROOT = os.getenv("DOC_TEXT_STORE_ROOT", "cache/doc_text")
+# 同时保持打开的文档数（每个文档一个 mmap）
+DOC_TEXT_MAX_OPEN = int(os.getenv("DOC_TEXT_MAX_OPEN", "128"))
+# 拉取 chunk 的分页大小
+DOC_TEXT_FETCH_PAGE_SIZE = 256
+# 命中 chunk 的上下文扩展：前后各取几个 chunk（0 = 不扩展）/ 扩展后单条 context 的字符上限
+CONTEXT_EXPAND_RADIUS = int(os.getenv("CONTEXT_EXPAND_RADIUS", "1"))
+CONTEXT_EXPAND_MAX_CHARS = int(os.getenv("CONTEXT_EXPAND_MAX_CHARS", "1500"))
+
+_MAGIC = b"DTXT"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHII")
+_RECORD = struct.Struct("<QII")
+
+
+@dataclass
+class ChunkText:
+    chunk_id: str
+    text: str
+    page: int = 0
+
+
+# =========================
+# 单文档：mmap 只读视图
+# =========================
+class DocText:
+    def __init__(self, txt_path: str, idx_path: str):
+        with open(idx_path, "rb") as f:
+            raw = f.read()
+        magic, version, n, ids_len = _HEADER.unpack_from(raw, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Unsupported doc text index: {idx_path}")
+
+        offset = _HEADER.size
+        self.records: List[Tuple[int, int, int]] = [
+            _RECORD.unpack_from(raw, offset + i * _RECORD.size) for i in range(n)
+        ]
+        offset += n * _RECORD.size
+        ids = raw[offset: offset + ids_len].decode("ascii").split("\n") if n else []
+        self.position: Dict[str, int] = {cid: i for i, cid in enumerate(ids)}
+
+        self._file = open(txt_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # 空文件不能 mmap
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def chunk(self, i: int) -> str:
+        off, length, _ = self.records[i]
+        return self._buf[off: off + length].decode("utf-8")
+
+    def page_of(self, i: int) -> int:
+        return self.records[i][2]
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+
+# =========================
+# 文档全文缓存
+# =========================
+class DocTextStore:
+    def __init__(self, root: str = DOC_TEXT_STORE_ROOT, *, max_open: int = DOC_TEXT_MAX_OPEN):
+        self.root = root
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, DocText]" = OrderedDict()
+        self.stats = {"writes": 0, "hits": 0, "misses": 0}
+
+    def _paths(self, document_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, document_id[:2], document_id)
+        return base + ".txt", base + ".idx"
+
+    def has(self, document_id: str) -> bool:
+        return os.path.exists(self._paths(document_id)[1])
+
+    # ---------- 写入 ----------
+    def write(self, document_id: str, chunks: Iterable[ChunkText]) -> int:
+        """按给定顺序写入整篇文档，返回 chunk 数（覆盖已有内容）"""
+        txt_path, idx_path = self._paths(document_id)
+        os.makedirs(os.path.dirname(txt_path), exist_ok=True)
+
+        records = []
+        ids = []
+        offset = 0
+        with open(txt_path + ".tmp", "wb") as f:
+            for c in chunks:
+                data = (c.text or "").encode("utf-8")
+                f.write(data + b"\n")
+                records.append(_RECORD.pack(offset, len(data), int(c.page or 0)))
+                ids.append(c.chunk_id)
+                offset += len(data) + 1
+        id_table = "\n".join(ids).encode("ascii")
+        with open(idx_path + ".tmp", "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(records), len(id_table)))
+            f.write(b"".join(records))
+            f.write(id_table)
+
+        self._evict(document_id)
+        os.replace(txt_path + ".tmp", txt_path)
+        os.replace(idx_path + ".tmp", idx_path)
+        with self._lock:
+            self.stats["writes"] += 1
+        return len(records)
+
+    def delete(self, document_id: str) -> None:
+        self._evict(document_id)
+        for path in self._paths(document_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ---------- 读取 ----------
+    def _evict(self, document_id: str) -> None:
+        """覆盖 / 删除前显式关闭（Windows 下已映射的文件不能被替换）"""
+        with self._lock:
+            doc = self._open.pop(document_id, None)
+        if doc is not None:
+            doc.close()
+
+    def get(self, document_id: str) -> Optional[DocText]:
+        with self._lock:
+            doc = self._open.get(document_id)
+            if doc is not None:
+                self._open.move_to_end(document_id)
+                self.stats["hits"] += 1
+                return doc
+        if not document_id or not self.has(document_id):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        doc = DocText(*self._paths(document_id))
+        with self._lock:
+            self.stats["misses"] += 1
+            self._open[document_id] = doc
+            # LRU 淘汰只丢引用，mmap 随对象回收关闭（其他线程可能仍在读）
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return doc
+
+    def window(
+        self,
+        document_id: str,
+        chunk_id: str,
+        *,
+        radius: int = 1,
+        query_terms: Optional[Set[str]] = None,
+        max_chars: int = 2000,
+        same_page: bool = False,
+    ) -> Optional[str]:
+        """
+        命中 chunk 前后各 radius 个 chunk 组成的窗口（文档顺序）
+        - query_terms 非空时，相邻 chunk 需与之有词重叠才保留（命中 chunk 始终保留）
+        - same_page=True 时只取同页 chunk
+        - 由近到远加入，总长不超过 max_chars；不连续处以“……”分隔
+        文档或 chunk 不在缓存中时返回 None
+        """
+        doc = self.get(document_id)
+        if doc is None or chunk_id not in doc.position:
+            return None
+
+        hit = doc.position[chunk_id]
+        page = doc.page_of(hit)
+        picked = {hit: doc.chunk(hit)}
+        used = len(picked[hit])
+
+        for dist in range(1, radius + 1):
+            for i in (hit - dist, hit + dist):
+                if i < 0 or i >= len(doc):
+                    continue
+                if same_page and doc.page_of(i) != page:
+                    continue
+                text = doc.chunk(i)
+                if query_terms and not _overlaps(text, query_terms):
+                    continue
+                if used + len(text) > max_chars:
+                    continue
+                picked[i] = text
+                used += len(text)
+
+        parts = []
+        prev = None
+        for i in sorted(picked):
+            if prev is not None and i != prev + 1:
+                parts.append("……")
+            parts.append(picked[i].strip())
+            prev = i
+        return "\n".join(parts)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "open_docs": len(self._open)}
+
+
+def _overlaps(text: str, query_terms: Set[str]) -> bool:
+    return not query_terms.isdisjoint(tokenize(text))
+
+
+def expand_contexts(
+    contexts: List[Dict[str, Any]],
+    *,
+    intent: str,
+    query_hints: List[str],
+    store: Optional[DocTextStore] = None,
+    radius: int = CONTEXT_EXPAND_RADIUS,
+    max_chars: int = CONTEXT_EXPAND_MAX_CHARS,
+) -> List[Dict[str, Any]]:
+    """
+    用本地全文缓存把命中 chunk 扩展为“命中 + 与目标相关的相邻 chunk”窗口
+    - 需要 context 带 doc_id / chunk_id（RAGFlowAdapter 输出）
+    - 缓存缺失 / radius=0 时原样返回；扩展后的 context 标记 expanded=True
+    """
+    if radius <= 0 or not contexts:
+        return contexts
+    store = store or get_doc_text_store()
+    query_terms = set(tokenize(intent))
+    for h in query_hints:
+        query_terms.update(tokenize(h))
+
+    expanded = []
+    for c in contexts:
+        text = None
+        if c.get("doc_id") and c.get("chunk_id"):
+            try:
+                text = store.window(
+                    c["doc_id"],
+                    c["chunk_id"],
+                    radius=radius,
+                    query_terms=query_terms,
+                    max_chars=max(max_chars, len(c.get("text", ""))),
+                )
+            except Exception as e:
+                print(f"[DOC TEXT ERROR] doc_id={c.get('doc_id')}, error={e}")
+        if text and text != c.get("text", "").strip():
+            expanded.append(with_fields(c, text=text, expanded=True))
+        else:
+            expanded.append(c)
+    return expanded
+
+
+# =========================
+# 从 RAGFlow 拉取（解析完成时调用一次）
+# =========================
+def _chunk_page(chunk: Any) -> Tuple[int, float]:
+    """positions: [[page, left, right, top, bottom], ...]；无位置信息时为 (0, 0)"""
+    positions = getattr(chunk, "positions", None) or []
+    if positions and len(positions[0]) >= 4:
+        return int(positions[0][0]), float(positions[0][3])
+    return 0, 0.0
+
+
+def fetch_document_chunks(
+    rag,
+    dataset_id: str,
+    document_id: str,
+    *,
+    page_size: int = DOC_TEXT_FETCH_PAGE_SIZE,
+) -> List[ChunkText]:
+    """分页拉取文档全部 chunk，按（页码, 页内位置, 原顺序）排成文档顺序"""
+    from ragflow_sdk.modules.document import Document as RAGFlowDocument
+    doc = RAGFlowDocument(rag, {"id": document_id, "dataset_id": dataset_id})
+
+    rows = []
+    page = 1
+    while True:
+        batch = doc.list_chunks(page=page, page_size=page_size)
+        for c in batch:
+            rows.append((_chunk_page(c), len(rows), c))
+        if len(batch) < page_size:
+            break
+        page += 1
+
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return [ChunkText(chunk_id=c.id, text=c.content, page=pos[0]) for pos, _, c in rows]
+
+
+def ingest_document_text(rag, store: DocTextStore, dataset_id: str, document_id: str) -> int:
+    chunks = fetch_document_chunks(rag, dataset_id, document_id)
+    return store.write(document_id, chunks)
+
+
+_store: Optional[DocTextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_doc_text_store() -> DocTextStore:
+    """进程级单例"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocTextStore()
+        return _store
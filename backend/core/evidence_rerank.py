@@ -0,0 +1,411 @@
+# core/evidence_rerank.py
+"""
+检索结果的本地重排（CPU-only，检索 → 证据池之后、进入 LLM prompt 之前）
+
+背景：
+- RAGFlowAdapter 只按服务端 similarity 排序截断，Step 5 裁决 / Step 6 写作
+  会拿到大量“沾边”的 chunk，prompt 变长、耗时变长
+- 这里按子目标 intent + query_hints 对 contexts 重新打分，只保留最相关的一小部分
+
+结构：
+1) Reranker 协议：score(intent, query_hints, passages) -> List[float]
+2) LexicalReranker：默认实现，BM25（中文按字 bigram，英文 / 数字按词）
+   + 字段覆盖度（正文 / 来源文件名），无第三方依赖
+3) CrossEncoderReranker：本地小型 cross-encoder 的接入点
+   （sentence-transformers 可选依赖，首次打分时才加载）
+4) mmr_select：Maximal Marginal Relevance + 单文档上限，避免一篇长 PDF 占满 contexts
+5) rerank_contexts / rerank_evidence_pool：打分 → MMR 选择 → 截断，失败时保持原顺序
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from core.chunk_store import with_fields
+
+# =========================
+# 配置
+# =========================
+# RERANKER: lexical（默认）/ cross-encoder / none（关闭，保持服务端顺序）
+RERANKER = os.getenv("RERANKER", "lexical")
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "12"))
+# 低于 最高分 × RERANK_MIN_RELATIVE 的 chunk 丢弃（至少保留 RERANK_MIN_KEEP 条）
+RERANK_MIN_RELATIVE = float(os.getenv("RERANK_MIN_RELATIVE", "0.25"))
+RERANK_MIN_KEEP = int(os.getenv("RERANK_MIN_KEEP", "4"))
+# MMR：相关性权重（1 = 纯相关性，越小越强调多样性）；单个来源文件最多保留的 chunk 数
+RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))
+RERANK_MAX_PER_DOC = int(os.getenv("RERANK_MAX_PER_DOC", "3"))
+RERANK_CROSS_ENCODER_MODEL = os.getenv(
+    "RERANK_CROSS_ENCODER_MODEL", "BAAI/bge-reranker-base"
+)
+
+
+# -------------------------
+# 1) Reranker 协议
+# -------------------------
+class Reranker(Protocol):
+    name: str
+
+    def score(
+        self,
+        *,
+        intent: str,
+        query_hints: List[str],
+        passages: List[Dict[str, Any]],
+    ) -> List[float]:
+        """
+        passages: contexts 列表（{"text", "source", ...}）
+        返回与 passages 等长的分数，越大越相关
+        """
+        ...
+
+
+# -------------------------
+# 2) 词法重排
+# -------------------------
+_LATIN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文无分词器：连续汉字切成字 bigram（单字保留为 unigram）；
+    英文 / 数字按词（小写，保留 2.5 这类小数）
+    """
+    text = (text or "").lower()
+    tokens = _LATIN_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _normalize(scores: List[float]) -> List[float]:
+    top = max(scores, default=0.0)
+    if top <= 0:
+        return [0.0] * len(scores)
+    return [s / top for s in scores]
+
+
+@dataclass
+class LexicalReranker:
+    """
+    四个分量（各自归一化到 [0, 1] 后加权）：
+    - intent：intent 对正文的 BM25
+    - hints：各 query_hint 对正文 BM25 的最大值
+    - coverage：查询词（intent ∪ hints）在正文中出现的比例
+    - source：查询词在来源文件名中出现的比例
+    """
+    name: str = "lexical"
+    k1: float = 1.2
+    b: float = 0.75
+    weights: Dict[str, float] = field(default_factory=lambda: {
+        "intent": 0.4,
+        "hints": 0.3,
+        "coverage": 0.2,
+        "source": 0.1,
+    })
+
+    def _bm25(
+        self,
+        query: Counter,
+        doc_tfs: List[Counter],
+        doc_lens: List[int],
+        idf: Dict[str, float],
+        avg_len: float,
+    ) -> List[float]:
+        scores = []
+        for tf, dl in zip(doc_tfs, doc_lens):
+            norm = self.k1 * (1 - self.b + self.b * dl / avg_len)
+            s = 0.0
+            for term in query:
+                f = tf.get(term)
+                if f:
+                    s += idf[term] * f * (self.k1 + 1) / (f + norm)
+            scores.append(s)
+        return scores
+
+    def score(
+        self,
+        *,
+        intent: str,
+        query_hints: List[str],
+        passages: List[Dict[str, Any]],
+    ) -> List[float]:
+        if not passages:
+            return []
+
+        doc_tfs = [Counter(tokenize(p.get("text", ""))) for p in passages]
+        doc_lens = [sum(tf.values()) for tf in doc_tfs]
+        avg_len = (sum(doc_lens) / len(doc_lens)) or 1.0
+
+        # 文档频率 / IDF（只在本批候选内统计）
+        n = len(passages)
+        df: Counter = Counter()
+        for tf in doc_tfs:
+            df.update(tf.keys())
+        idf = {t: math.log(1 + (n - c + 0.5) / (c + 0.5)) for t, c in df.items()}
+
+        intent_q = Counter(tokenize(intent))
+        hint_qs = [Counter(tokenize(h)) for h in query_hints if h]
+        all_terms = set(intent_q)
+        for q in hint_qs:
+            all_terms.update(q)
+
+        intent_s = _normalize(self._bm25(intent_q, doc_tfs, doc_lens, idf, avg_len))
+        hint_s = _normalize([
+            max(col) for col in zip(*(
+                self._bm25(q, doc_tfs, doc_lens, idf, avg_len) for q in hint_qs
+            ))
+        ]) if hint_qs else [0.0] * n
+
+        if all_terms:
+            coverage = [len(all_terms & tf.keys()) / len(all_terms) for tf in doc_tfs]
+            source_tfs = [set(tokenize(p.get("source") or "")) for p in passages]
+            source = [len(all_terms & s) / len(all_terms) for s in source_tfs]
+        else:
+            coverage = source = [0.0] * n
+
+        w = self.weights
+        return [
+            w["intent"] * a + w["hints"] * h + w["coverage"] * c + w["source"] * s
+            for a, h, c, s in zip(intent_s, hint_s, coverage, source)
+        ]
+
+
+# -------------------------
+# 3) 本地 cross-encoder（可选）
+# -------------------------
+class CrossEncoderReranker:
+    """
+    本地 cross-encoder 接入点（如 bge-reranker-base），CPU 上对几十个候选打分即可。
+    sentence-transformers 为可选依赖：首次 score() 时才导入 / 加载模型。
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = RERANK_CROSS_ENCODER_MODEL, *, batch_size: int = 16, max_chars: int = 1500):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder  # type: ignore
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def score(
+        self,
+        *,
+        intent: str,
+        query_hints: List[str],
+        passages: List[Dict[str, Any]],
+    ) -> List[float]:
+        if not passages:
+            return []
+        query = " ".join([intent, *query_hints]).strip()
+        pairs = [(query, (p.get("text") or "")[: self.max_chars]) for p in passages]
+        scores = self._load().predict(pairs, batch_size=self.batch_size)
+        return [float(s) for s in scores]
+
+
+_reranker_cache: Dict[str, Reranker] = {}
+_reranker_lock = threading.Lock()
+
+
+def get_reranker(name: Optional[str] = None) -> Optional[Reranker]:
+    """
+    按名称取进程内共享的 reranker；"none" 返回 None（不重排）
+    """
+    name = (name or RERANKER).strip().lower()
+    if name in ("", "none", "off"):
+        return None
+    with _reranker_lock:
+        if name not in _reranker_cache:
+            if name == "lexical":
+                _reranker_cache[name] = LexicalReranker()
+            elif name == "cross-encoder":
+                _reranker_cache[name] = CrossEncoderReranker()
+            else:
+                raise ValueError(f"Unknown reranker: {name}")
+        return _reranker_cache[name]
+
+
+# -------------------------
+# 4) MMR 多样性选择
+# -------------------------
+def _term_vectors(texts: List[str]) -> Tuple[List[Counter], List[float]]:
+    vecs = [Counter(tokenize(t)) for t in texts]
+    norms = [math.sqrt(sum(v * v for v in vec.values())) or 1.0 for vec in vecs]
+    return vecs, norms
+
+
+def _cosine(a: Counter, na: float, b: Counter, nb: float) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b[t] for t, v in a.items() if t in b) / (na * nb)
+
+
+def doc_key(passage: Dict[str, Any]) -> Any:
+    """单文档上限 / 文档数统计的键：优先 doc_id（同名文件可能是不同文档），缺失时退回 source"""
+    return passage.get("doc_id") or passage.get("source")
+
+
+def mmr_select(
+    passages: List[Dict[str, Any]],
+    relevance: List[float],
+    *,
+    candidates: Optional[List[int]] = None,
+    top_k: int = RERANK_TOP_K,
+    mmr_lambda: float = RERANK_MMR_LAMBDA,
+    max_per_doc: int = RERANK_MAX_PER_DOC,
+    min_keep: int = 0,
+) -> List[int]:
+    """
+    贪心 MMR：每步选 λ·rel - (1-λ)·max_sim(已选) 最大的候选，返回下标（按选择顺序）
+
+    - relevance 需已归一化到 [0, 1]（与 chunk 间余弦相似度同量纲）
+    - 同一文档（doc_key）最多 max_per_doc 条；若已选不足 min_keep 且只剩超限候选，放宽上限
+    - 与已选候选的最大相似度增量维护，整体 O(top_k · n) 次稀疏点积
+    """
+    pool = list(range(len(passages))) if candidates is None else list(candidates)
+    if not pool:
+        return []
+
+    vecs, norms = _term_vectors([p.get("text", "") for p in passages])
+    max_sim = {i: 0.0 for i in pool}
+    per_doc: Counter = Counter()
+    selected: List[int] = []
+
+    while pool and len(selected) < top_k:
+        allowed = [i for i in pool if per_doc[doc_key(passages[i])] < max_per_doc]
+        if not allowed:
+            if len(selected) >= min_keep:
+                break
+            allowed = pool
+        best = max(
+            allowed,
+            key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * max_sim[i],
+        )
+        selected.append(best)
+        pool.remove(best)
+        per_doc[doc_key(passages[best])] += 1
+        for i in pool:
+            max_sim[i] = max(max_sim[i], _cosine(vecs[i], norms[i], vecs[best], norms[best]))
+    return selected
+
+
+# -------------------------
+# 5) 重排 + 截断
+# -------------------------
+def rerank_contexts(
+    contexts: List[Dict[str, Any]],
+    *,
+    intent: str,
+    query_hints: List[str],
+    reranker: Optional[Reranker] = None,
+    top_k: int = RERANK_TOP_K,
+    min_relative: float = RERANK_MIN_RELATIVE,
+    min_keep: int = RERANK_MIN_KEEP,
+    mmr_lambda: float = RERANK_MMR_LAMBDA,
+    max_per_doc: int = RERANK_MAX_PER_DOC,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    返回 (保留的 contexts, 统计)；保留的 context 为拷贝（ChunkRef 仍为引用）并附带 rerank_score。
+    - 先按相关性阈值筛出候选（至少 min_keep 条），再用 MMR + 单文档上限选出 top_k
+    - reranker 为 None 或打分失败时，原样返回全部 contexts（与未接入重排时一致）
+    """
+    stats = {
+        "reranker": reranker.name if reranker else "none",
+        "candidates": len(contexts),
+        "kept": 0,
+        "docs_before": len({doc_key(c) for c in contexts}),
+        "docs_after": 0,
+        "chars_before": sum(len(c.get("text", "")) for c in contexts),
+        "chars_after": 0,
+    }
+
+    scores: Optional[List[float]] = None
+    if reranker is not None and contexts:
+        try:
+            scores = reranker.score(intent=intent, query_hints=query_hints, passages=contexts)
+        except Exception as e:
+            print(f"[RERANK ERROR] reranker={reranker.name}, error={e}，保持原顺序")
+            stats["reranker"] = "none"
+
+    if scores is None:
+        kept = [with_fields(c) for c in contexts]
+    else:
+        # 稳定排序：同分时保留服务端 similarity 顺序
+        order = sorted(range(len(contexts)), key=lambda i: scores[i], reverse=True)
+        threshold = scores[order[0]] * min_relative if scores[order[0]] > 0 else float("-inf")
+        eligible = [i for rank, i in enumerate(order) if rank < min_keep or scores[i] >= threshold]
+
+        # cross-encoder 分数不在 [0, 1]，按候选内 min-max 归一化后再与相似度比较
+        lo, hi = min(scores), max(scores)
+        relevance = [(x - lo) / (hi - lo) if hi > lo else 1.0 for x in scores]
+        picked = mmr_select(
+            contexts,
+            relevance,
+            candidates=eligible,
+            top_k=top_k,
+            mmr_lambda=mmr_lambda,
+            max_per_doc=max_per_doc,
+            min_keep=min_keep,
+        )
+        kept = [with_fields(contexts[i], rerank_score=round(scores[i], 4)) for i in picked]
+
+    stats["kept"] = len(kept)
+    stats["docs_after"] = len({doc_key(c) for c in kept})
+    stats["chars_after"] = sum(len(c.get("text", "")) for c in kept)
+    return kept, stats
+
+
+def rerank_evidence_pool(
+    pool: Dict[str, Any],
+    *,
+    intent: str,
+    query_hints: List[str],
+    reranker: Optional[Reranker] = None,
+    top_k: int = RERANK_TOP_K,
+) -> Dict[str, Any]:
+    """
+    返回新的 pool：contexts 为重排截断后的结果（供裁决 / 写作 prompt 使用），
+    evidences（用户可见证据）不变，统计写入 meta["rerank"]。不修改传入的 pool。
+
+    meta 的 total_chunks / docs_hit 改为描述实际交给 LLM 的 contexts
+    （原 meta 只记录第一轮检索，多轮合并后并不准确）。
+    """
+    kept, stats = rerank_contexts(
+        pool.get("contexts", []),
+        intent=intent,
+        query_hints=query_hints,
+        reranker=reranker,
+        top_k=top_k,
+    )
+    print(
+        f"[RERANK] {stats['reranker']}: {stats['kept']}/{stats['candidates']} contexts, "
+        f"docs {stats['docs_before']} → {stats['docs_after']}, "
+        f"chars {stats['chars_before']} → {stats['chars_after']}"
+    )
+    meta = {**pool.get("meta", {}), "rerank": stats}
+    if stats["reranker"] != "none":
+        meta["total_chunks"] = stats["kept"]
+        meta["docs_hit"] = stats["docs_after"]
+    return {
+        **pool,
+        "contexts": kept,
+        "meta": meta,
+    }
@@ -18,10 +18,29 @@ core/llm_gateway.py
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Protocol
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple, Union
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import json
+import logging
 import os
+import random
+import threading
+import time
+
+from core.metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds", "LLM request latency excluding admission wait", ("task", "model", "status"),
+)
+LLM_CLIENT_EVENTS = REGISTRY.counter(
+    "llm_client_events_total", "ResilientLLMClient calls / attempts / retries / hedges / failures", ("event",),
+)
 
 
 # -------------------------
@@ -31,8 +50,15 @@ class LLMClient(Protocol):
     """
     让业务层不依赖具体 SDK。
     任何模型只要实现 complete(messages)->str 即可替换。
+    max_tokens 只在配置了模型路由时传入。
     """
-    def complete(self, messages: List[Dict[str, str]], *, timeout: Optional[float] = None) -> str:
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        timeout: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
         ...
 
 
@@ -48,52 +74,795 @@ class OpenAICompatibleClient:
     model: str
     api_key: str
     base_url: str
+    # SDK 内置重试；外层使用 ResilientLLMClient 时置 0，避免重试次数叠加
+    sdk_max_retries: int = 2
 
     def __post_init__(self) -> None:
         # 延迟导入：避免业务层加载时就强依赖 openai 包
         from openai import OpenAI  # type: ignore
-        self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self._client = OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=self.sdk_max_retries,
+        )
 
-    def complete(self, messages: List[Dict[str, str]], *, timeout: Optional[float] = None) -> str:
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        timeout: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        kwargs: Dict[str, Any] = {}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
         resp = self._client.chat.completions.create(
             model=self.model,
             messages=messages,
             timeout=timeout,
+            **kwargs,
         )
         return (resp.choices[0].message.content or "").strip()
 
 
 # -------------------------
-# 3) JSON 输出解析器（强制严格 JSON）
+# 3) 韧性层：退避重试 + 对冲请求（降低长尾延迟）
 # -------------------------
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+_RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+    "InternalServerError",
+}
+
+# 对冲请求与被丢弃的慢请求共用的线程池（慢请求无法中途取消，只能放弃结果）
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")),
+                thread_name_prefix="llm-hedge",
+            )
+        return _hedge_executor
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    可重试：连接失败 / 超时 / 429 / 5xx。
+    4xx 参数错误、鉴权失败等直接抛出，重试没有意义。
+    """
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES
+    if type(exc).__name__ in _RETRYABLE_ERROR_NAMES:
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+@dataclass
+class ResilientLLMClient:
+    """
+    包装任意 LLMClient（本身也是 LLMClient）：
+
+    - 可重试错误按“全抖动指数退避”重试：sleep ~ U(0, min(cap, base * 2^n))
+    - hedge_delay 不为空时启用对冲：首个请求 hedge_delay 秒内未返回，
+      再发一个相同请求，先成功者胜出（hedge_delay 建议取该调用的 p95 延迟）
+    - stats 记录 calls / attempts / retries / hedges / hedge_wins / failures
+    - complete(..., admit=fn) 时每次实际发往 provider 的尝试（含重试 / 对冲）都经
+      admit(send) 单独准入记账（LLMGateway 传入），限流桶与真实流量一致
+    """
+    # LLMGateway 据此把准入下放到每次尝试
+    admits_per_attempt = True
+
+    inner: LLMClient
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge_delay: Optional[float] = None
+    sleep: Any = time.sleep
+
+    def __post_init__(self) -> None:
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failures": 0,
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+        LLM_CLIENT_EVENTS.inc(n, event=key)
+
+    def _call_inner(
+        self,
+        messages: List[Dict[str, str]],
+        timeout: Optional[float],
+        max_tokens: Optional[int],
+        admit: Optional[Callable[[Callable[[], str]], str]] = None,
+    ) -> str:
+        def _send() -> str:
+            self._count("attempts")
+            if max_tokens is None:
+                return self.inner.complete(messages, timeout=timeout)
+            return self.inner.complete(messages, timeout=timeout, max_tokens=max_tokens)
+
+        if admit is None:
+            return _send()
+        return admit(_send)
+
+    def _hedged_call(
+        self,
+        messages: List[Dict[str, str]],
+        timeout: Optional[float],
+        max_tokens: Optional[int],
+        admit: Optional[Callable[[Callable[[], str]], str]] = None,
+    ) -> str:
+        executor = _get_hedge_executor()
+        primary = executor.submit(self._call_inner, messages, timeout, max_tokens, admit)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+
+        self._count("hedges")
+        hedge = executor.submit(self._call_inner, messages, timeout, max_tokens, admit)
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                error = fut.exception()
+                if error is None:
+                    if fut is hedge:
+                        self._count("hedge_wins")
+                    return fut.result()
+                first_error = first_error or error
+        assert first_error is not None
+        raise first_error
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        timeout: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        admit: Optional[Callable[[Callable[[], str]], str]] = None,
+    ) -> str:
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.hedge_delay:
+                    return self._hedged_call(messages, timeout, max_tokens, admit)
+                return self._call_inner(messages, timeout, max_tokens, admit)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    self._count("failures")
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                self._count("retries")
+                logger.warning(
+                    "LLM call failed (%s), retry %d/%d in %.2fs",
+                    type(e).__name__, attempt + 1, self.max_retries, delay,
+                )
+                self.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self.stats)
+
+
+# -------------------------
+# 4) JSON 输出解析器（容错修复 + schema 校验）
+# -------------------------
+# 字段 -> 期望类型（或类型元组）；值为 dict 时表示嵌套对象的 schema
+JSONSchema = Dict[str, Union[type, Tuple[type, ...], Dict[str, Any]]]
+
+
+class JSONSchemaError(ValueError):
+    """模型输出是合法 JSON，但不满足调用方声明的 schema"""
+
+
+def validate_json_schema(data: Any, schema: JSONSchema, path: str = "") -> None:
+    """
+    最小 schema 校验：只检查必需字段是否存在以及类型是否匹配。
+    不做业务兜底（默认值 / 截断等仍由各 step 负责）。
+    """
+    if not isinstance(data, dict):
+        raise JSONSchemaError(f"{path or '<root>'}: expected object, got {type(data).__name__}")
+
+    problems: List[str] = []
+    for key, expected in schema.items():
+        field_path = f"{path}.{key}" if path else key
+        if key not in data:
+            problems.append(f"{field_path}: missing")
+            continue
+        value = data[key]
+        if isinstance(expected, dict):
+            try:
+                validate_json_schema(value, expected, field_path)
+            except JSONSchemaError as e:
+                problems.append(str(e))
+            continue
+        # bool 是 int 的子类，数值字段不接受 true/false
+        if isinstance(value, bool) and bool not in (expected if isinstance(expected, tuple) else (expected,)):
+            problems.append(f"{field_path}: expected {expected}, got bool")
+        elif not isinstance(value, expected):
+            problems.append(f"{field_path}: expected {expected}, got {type(value).__name__}")
+
+    if problems:
+        raise JSONSchemaError("; ".join(problems))
+
+
+# 字符串外部出现的全角结构符号 -> 半角
+_FULLWIDTH_STRUCTURAL = {
+    "，": ",",
+    "：": ":",
+    "｛": "{",
+    "｝": "}",
+    "［": "[",
+    "］": "]",
+}
+# 可作为字符串起止的引号：开引号 -> 可接受的闭引号
+_STRING_QUOTES = {
+    '"': '"',
+    "“": "”",
+    "”": "”",
+    "'": "'",
+}
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def repair_json_text(text: str) -> str:
+    """
+    对模型输出的“近似 JSON”做一次线性扫描修复：
+    - 字符串外的中文标点（，：｛｝［］“”）转为 JSON 结构符号
+    - 删除对象 / 数组末尾的多余逗号
+    - 字符串内的裸换行 / 制表符转义，非法反斜杠转义补齐
+    - 字符串内未转义的双引号（后面不是 , : } ]）按正文引号转义
+    - 输出被截断时补齐未闭合的字符串 / 对象 / 数组
+    顶层对象闭合后的多余文本直接丢弃。
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    closing_quote = ""
+    pending_comma = False
+    i = 0
+    n = len(text)
+
+    def _next_significant(pos: int) -> str:
+        while pos < n and text[pos] in " \t\r\n":
+            pos += 1
+        return text[pos] if pos < n else ""
+
+    while i < n:
+        ch = text[i]
+
+        if in_string:
+            if ch == "\\":
+                nxt = text[i + 1] if i + 1 < n else ""
+                if nxt in _VALID_ESCAPES:
+                    out.append(ch + nxt)
+                    i += 2
+                    continue
+                out.append("\\\\")
+            elif ch == closing_quote or (closing_quote == "”" and ch == '"'):
+                follow = _next_significant(i + 1)
+                if follow in ("", ",", ":", "}", "]", "，", "：", "｝", "］"):
+                    out.append('"')
+                    in_string = False
+                else:
+                    out.append('\\"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        ch = _FULLWIDTH_STRUCTURAL.get(ch, ch)
+
+        if ch in " \t\r\n":
+            i += 1
+            continue
+
+        if ch == ",":
+            pending_comma = True
+            i += 1
+            continue
+
+        if ch in ("}", "]"):
+            pending_comma = False
+            if stack:
+                out.append(_CLOSERS[stack.pop()])
+            i += 1
+            if not stack:
+                break
+            continue
+
+        if pending_comma:
+            out.append(",")
+            pending_comma = False
+
+        if ch in _STRING_QUOTES:
+            in_string = True
+            closing_quote = _STRING_QUOTES[ch]
+            out.append('"')
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+
+    # ---------- 截断补齐 ----------
+    if in_string:
+        out.append('"')
+    repaired = "".join(out).rstrip()
+    if repaired.endswith(":"):
+        repaired += "null"
+    elif stack and stack[-1] == "{" and repaired.endswith('"'):
+        # 对象内最后一个完整 token 是 key（"k" 前面是 { 或 ,）时补 null
+        j = len(repaired) - 2
+        while j >= 0 and not (repaired[j] == '"' and repaired[j - 1] != "\\"):
+            j -= 1
+        if j > 0 and repaired[j - 1] in "{,":
+            repaired += ":null"
+    for opener in reversed(stack):
+        repaired += _CLOSERS[opener]
+    return repaired
+
+
 @dataclass
 class JSONExtractor:
     """
     统一做 JSON 解析容错：
     - 从文本中截取第一个 {...} 块
-    - json.loads 解析
-    - 若失败，抛出异常给上层（上层可决定重试或判失败）
+    - json.loads 解析；失败时先做一次本地修复（repair_json_text）再解析
+    - 仍失败则抛出异常给上层（上层可决定追问修复 / 重新生成）
     """
+    repair: bool = True
+
     def extract(self, text: str) -> Dict[str, Any]:
         text = text.strip()
 
         # 容错：截取最外层 JSON 对象
         start = text.find("{")
-        end = text.rfind("}")
-        if start == -1 or end == -1 or end <= start:
+        if start == -1:
+            start = text.find("｛")
+        if start == -1:
             raise ValueError("Model output does not contain a JSON object.")
 
-        candidate = text[start:end + 1]
-        print("--- JSON Extraction Debug ---")
-        print(f"Extracted JSON candidate: {candidate}")
-        print("--- JSON Extraction Debug ---")
-        return json.loads(candidate)
+        end = text.rfind("}")
+        candidate = text[start:end + 1] if end > start else text[start:]
+        logger.debug("JSON candidate: %s", candidate)
+
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            if not self.repair:
+                raise
+
+        # 从首个 { 到文本末尾整体修复（覆盖截断输出）
+        repaired = repair_json_text(text[start:])
+        logger.debug("JSON repaired candidate: %s", repaired)
+        return json.loads(repaired)
 
 
 # -------------------------
-# 4) 高层网关：LLMGateway
+# 5) 全局准入控制：令牌桶限流 + 优先级 / 跨用户公平调度
 # -------------------------
-from dataclasses import dataclass, field
+# 数值越小越优先：交互式澄清 > 证据裁决 > 分段写作 > 全局编辑 > 后台任务（入库摘要等）
+LLM_PRIORITIES = {
+    "clarify": 0,
+    "adjudicate": 1,
+    "draft": 2,
+    "edit": 3,
+    "background": 4,
+}
+DEFAULT_PRIORITY = "draft"
+
+# 估算回复长度时为每次请求预留的 token
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+def estimate_tokens(text_or_messages: Union[str, List[Dict[str, str]]]) -> int:
+    """
+    粗略 token 估算（不依赖 tokenizer）：中英混合文本按 ~0.7 token / 字符计。
+    只用于限流记账，不要求精确。
+    """
+    if isinstance(text_or_messages, str):
+        chars = len(text_or_messages)
+    else:
+        chars = sum(len(m.get("content") or "") for m in text_or_messages)
+    return int(chars * 0.7) + 1
+
+
+class TokenBucket:
+    """
+    经典令牌桶：容量 capacity，按 refill_per_sec 匀速补充。
+    允许余额为负（事后按实际用量补扣），负债期间新请求需等待。
+    """
+
+    def __init__(self, capacity: float, refill_per_sec: float, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.refill_per_sec = float(refill_per_sec)
+        self._clock = clock
+        self.tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_sec)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取得 amount 个令牌还需等待的秒数（0 表示可立即取得）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        if self.refill_per_sec <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.refill_per_sec
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正：delta > 0 退还，delta < 0 补扣"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class LLMAdmissionTimeoutError(RuntimeError):
+    """准入排队超过 max_wait（不属于可重试错误：重试只会再排一次队）"""
+
+
+@dataclass
+class AdmissionTicket:
+    priority: str
+    user_id: str
+    est_tokens: int
+    enqueued_at: float
+    admitted_at: float = 0.0
+
+
+class LLMAdmissionController:
+    """
+    进程级 LLM 准入控制器（所有 session 共享一个实例）。
+
+    - 两个令牌桶：requests/min 与 tokens/min，超限的请求排队等待
+    - 严格优先级：只有更高优先级队列为空时，低优先级请求才能放行
+    - 同一优先级内按用户轮转（round-robin），避免单个用户的批量请求独占额度
+    - 记录每个优先级的排队等待指标（次数 / 总等待 / 最大等待 / 当前排队数）
+
+    LLMClient 是同步接口，因此这里用 threading.Condition 实现阻塞等待：
+    async 调用方必须在线程中调用网关（编排器经 asyncio.to_thread），不能在事件循环里直接调用。
+    排队超过 max_wait 秒抛出 LLMAdmissionTimeoutError（None 表示不限）。
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        burst_requests: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        self._clock = clock
+        self.max_wait = max_wait
+        self._requests = TokenBucket(
+            burst_requests or requests_per_minute, requests_per_minute / 60.0, clock
+        )
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, clock)
+        self._cond = threading.Condition()
+        # priority -> OrderedDict[user_id -> deque[ticket]]
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            level: OrderedDict() for level in sorted(set(LLM_PRIORITIES.values()))
+        }
+        self._metrics: Dict[str, Dict[str, float]] = {
+            name: {"admitted": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "queued": 0}
+            for name in LLM_PRIORITIES
+        }
+
+    # ---------- 调度 ----------
+    def _head(self) -> Optional[AdmissionTicket]:
+        for level in sorted(self._queues):
+            users = self._queues[level]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _discard(self, ticket: AdmissionTicket) -> None:
+        """超时放弃：从所在用户队列中移除（不一定是队首）"""
+        users = self._queues[LLM_PRIORITIES[ticket.priority]]
+        tickets = users[ticket.user_id]
+        tickets.remove(ticket)
+        if not tickets:
+            del users[ticket.user_id]
+
+    def _dequeue(self, ticket: AdmissionTicket) -> None:
+        users = self._queues[LLM_PRIORITIES[ticket.priority]]
+        tickets = users.pop(ticket.user_id)
+        tickets.popleft()
+        if tickets:
+            # 该用户还有请求：移到队尾，实现同优先级内的轮转
+            users[ticket.user_id] = tickets
+
+    def acquire(
+        self,
+        *,
+        priority: str = DEFAULT_PRIORITY,
+        user_id: Optional[Any] = None,
+        est_tokens: int = 0,
+    ) -> AdmissionTicket:
+        if priority not in LLM_PRIORITIES:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+
+        ticket = AdmissionTicket(
+            priority=priority,
+            user_id=str(user_id) if user_id is not None else "-",
+            est_tokens=est_tokens,
+            enqueued_at=self._clock(),
+        )
+        with self._cond:
+            users = self._queues[LLM_PRIORITIES[priority]]
+            users.setdefault(ticket.user_id, deque()).append(ticket)
+            self._metrics[priority]["queued"] += 1
+
+            deadline = None if self.max_wait is None else ticket.enqueued_at + self.max_wait
+            while True:
+                wait: Optional[float] = None
+                if self._head() is ticket:
+                    wait = max(
+                        self._requests.wait_time(1),
+                        self._tokens.wait_time(est_tokens),
+                    )
+                    if wait <= 0:
+                        break
+                if deadline is not None:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        self._discard(ticket)
+                        self._metrics[priority]["queued"] -= 1
+                        self._metrics[priority]["timeouts"] += 1
+                        self._cond.notify_all()
+                        raise LLMAdmissionTimeoutError(
+                            f"LLM admission queue wait exceeded {self.max_wait}s (priority={priority})"
+                        )
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(timeout=wait)
+
+            self._requests.consume(1)
+            self._tokens.consume(est_tokens)
+            self._dequeue(ticket)
+
+            ticket.admitted_at = self._clock()
+            waited = ticket.admitted_at - ticket.enqueued_at
+            m = self._metrics[priority]
+            m["queued"] -= 1
+            m["admitted"] += 1
+            m["wait_seconds_total"] += waited
+            m["wait_seconds_max"] = max(m["wait_seconds_max"], waited)
+
+            # 队首变化，唤醒下一个候选
+            self._cond.notify_all()
+        return ticket
+
+    def release(self, ticket: AdmissionTicket, used_tokens: int) -> None:
+        """请求结束后按实际用量修正 tokens/min 记账"""
+        with self._cond:
+            self._tokens.adjust(ticket.est_tokens - used_tokens)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(
+        self,
+        *,
+        priority: str = DEFAULT_PRIORITY,
+        user_id: Optional[Any] = None,
+        est_tokens: int = 0,
+    ):
+        """
+        with controller.admit(...) as usage:
+            reply = client.complete(...)
+            usage["tokens"] = ...
+        """
+        ticket = self.acquire(priority=priority, user_id=user_id, est_tokens=est_tokens)
+        usage = {"tokens": est_tokens}
+        try:
+            yield usage
+        finally:
+            self.release(ticket, usage["tokens"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """排队等待指标快照（只读拷贝）"""
+        with self._cond:
+            return {
+                "priorities": {name: dict(m) for name, m in self._metrics.items()},
+                "requests_available": round(self._requests.tokens, 3),
+                "tokens_available": round(self._tokens.tokens, 3),
+            }
+
+
+_admission_controller: Optional[LLMAdmissionController] = None
+_admission_lock = threading.Lock()
+
+
+def get_llm_admission_controller() -> LLMAdmissionController:
+    """
+    进程级单例。
+
+    Env:
+      LLM_RPM_LIMIT=600        # requests / min
+      LLM_TPM_LIMIT=1000000    # tokens / min
+      LLM_ADMISSION_MAX_WAIT=120  # 最长排队秒数，超时抛 LLMAdmissionTimeoutError（0 = 不限）
+    """
+    global _admission_controller
+    with _admission_lock:
+        if _admission_controller is None:
+            _admission_controller = LLMAdmissionController(
+                requests_per_minute=float(os.getenv("LLM_RPM_LIMIT", "600")),
+                tokens_per_minute=float(os.getenv("LLM_TPM_LIMIT", "1000000")),
+                max_wait=float(os.getenv("LLM_ADMISSION_MAX_WAIT", "120")) or None,
+            )
+        return _admission_controller
+
+
+# -------------------------
+# 6) 调用点路由：task → 模型 / 超时 / max_tokens / 兜底链
+# -------------------------
+# 每个调用点声明自己的任务类别；分类类任务（裁决 / 意图扩展 / 澄清）
+# 可路由到便宜快速的模型，长文写作仍走强模型。
+LLM_TASKS = ("clarify", "plan", "subgoals", "adjudicate", "expand", "draft", "edit", "summarize")
+
+# 任务类别 → 准入优先级
+TASK_PRIORITIES = {
+    "clarify": "clarify",
+    "plan": "adjudicate",
+    "subgoals": "adjudicate",
+    "adjudicate": "adjudicate",
+    "expand": "adjudicate",
+    "draft": "draft",
+    "edit": "edit",
+    "summarize": "background",
+}
+
+
+@dataclass
+class ModelRoute:
+    """
+    单个任务类别的路由配置：
+    - timeout / max_tokens 为空时沿用调用点传入的值 / 模型默认值
+    - fallbacks：主模型调用失败后依次尝试的模型
+    """
+    model: str
+    timeout: Optional[float] = None
+    max_tokens: Optional[int] = None
+    fallbacks: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelRoute":
+        return cls(
+            model=data["model"],
+            timeout=data.get("timeout"),
+            max_tokens=data.get("max_tokens"),
+            fallbacks=list(data.get("fallbacks") or []),
+        )
+
+
+class LLMRouter:
+    """
+    task → ModelRoute 的映射 + 按模型名惰性创建、复用的客户端。
+    未配置的 task 走 default 路由。
+    """
+
+    def __init__(
+        self,
+        default: ModelRoute,
+        client_factory: Callable[[str], LLMClient],
+        routes: Optional[Dict[str, ModelRoute]] = None,
+    ):
+        self.default = default
+        self.routes: Dict[str, ModelRoute] = dict(routes or {})
+        self._client_factory = client_factory
+        self._clients: Dict[str, LLMClient] = {}
+        self._lock = threading.Lock()
+
+    def route_for(self, task: Optional[str]) -> ModelRoute:
+        if task is None:
+            return self.default
+        return self.routes.get(task, self.default)
+
+    def client_for(self, model: str) -> LLMClient:
+        with self._lock:
+            client = self._clients.get(model)
+            if client is None:
+                client = self._client_factory(model)
+                self._clients[model] = client
+            return client
+
+    def candidates(self, task: Optional[str]) -> List[Tuple[str, LLMClient]]:
+        route = self.route_for(task)
+        models = [route.model] + [m for m in route.fallbacks if m != route.model]
+        return [(m, self.client_for(m)) for m in models]
+
+
+def load_llm_routes(raw: str) -> Dict[str, ModelRoute]:
+    """
+    解析路由配置：raw 可以是 JSON 字符串，也可以是 JSON 文件路径。
+    格式：{"adjudicate": {"model": "qwen-turbo", "timeout": 30, "max_tokens": 512, "fallbacks": ["qwen-plus"]}, ...}
+    """
+    raw = raw.strip()
+    if not raw:
+        return {}
+    if not raw.startswith("{"):
+        with open(raw, "r", encoding="utf-8") as f:
+            raw = f.read()
+    data = json.loads(raw)
+    unknown = set(data) - set(LLM_TASKS)
+    if unknown:
+        raise ValueError(f"Unknown LLM task classes in routes: {sorted(unknown)}")
+    return {task: ModelRoute.from_dict(cfg) for task, cfg in data.items()}
+
+
+# -------------------------
+# 7) 高层网关：LLMGateway
+# -------------------------
+SYSTEM_JSON_FIXER = """
+你是 JSON 修复器。
+你会收到一段本应是 JSON 的模型输出，以及解析 / 校验错误。
+请在不改变原有内容含义的前提下，把它修复为严格合法的 JSON：
+- 只输出 JSON，不得输出任何解释或代码块
+- 不得使用中文标点作为 JSON 结构符号
+- 保留原有字段与取值，只补齐缺失的必需字段
+""".strip()
+
+USER_JSON_FIXER = """
+【错误】
+{error}
+
+【必需字段】
+{schema}
+
+【原始输出】
+{raw}
+""".strip()
+
+
+def _describe_schema(schema: Optional[JSONSchema]) -> str:
+    if not schema:
+        return "（未指定）"
+
+    def _name(t: Any) -> str:
+        if isinstance(t, dict):
+            return "{" + ", ".join(f"{k}: {_name(v)}" for k, v in t.items()) + "}"
+        if isinstance(t, tuple):
+            return " | ".join(x.__name__ for x in t)
+        return t.__name__
+
+    return _name(schema)
+
 
 @dataclass
 class LLMGateway:
@@ -101,40 +870,235 @@ class LLMGateway:
     业务层调用的主要入口。
     提供：
     - ask_json(): 输入 messages，返回 Dict（严格 JSON）
+
+    失败处理顺序（逐级变贵）：
+    1) 本地修复（JSONExtractor）
+    2) 追问修复：只把原始输出与错误发回模型（不带原 prompt，token 很少）
+    3) 整体重新生成：用原 messages 重新请求
+
+    若配置了 admission，每一次模型请求（含追问修复 / 重新生成，以及
+    ResilientLLMClient 内部的重试 / 对冲请求）都先经过全局准入控制，
+    priority 由调用方按业务阶段声明。
+
+    若配置了 router，调用方通过 task 声明任务类别，由路由决定模型、超时、
+    max_tokens 与兜底链；priority 未显式给出时按 TASK_PRIORITIES 推导。
     """
     client: LLMClient
     extractor: JSONExtractor = field(default_factory=JSONExtractor)
+    fix_retries: int = 1
+    regenerate_retries: int = 1
+    admission: Optional[LLMAdmissionController] = None
+    user_id: Optional[Any] = None
+    router: Optional[LLMRouter] = None
+
+    def _admitted_call(
+        self,
+        client: LLMClient,
+        messages: List[Dict[str, str]],
+        *,
+        timeout: Optional[float],
+        max_tokens: Optional[int],
+        priority: str,
+        task: Optional[str] = None,
+        model: str = "",
+    ) -> str:
+        prompt_tokens = estimate_tokens(messages)
+
+        def _admit(send: Callable[[], str]) -> str:
+            """一次 provider 请求的准入与记账（按实际输出修正 token 用量）"""
+            with self.admission.admit(
+                priority=priority,
+                user_id=self.user_id,
+                est_tokens=prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS),
+            ) as usage:
+                raw = send()
+                usage["tokens"] = prompt_tokens + estimate_tokens(raw)
+            return raw
+
+        # 客户端内部会重试 / 对冲时，准入下放到每次尝试；否则整次调用准入一次
+        per_attempt = self.admission is not None and getattr(client, "admits_per_attempt", False)
+        kwargs: Dict[str, Any] = {"timeout": timeout}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if per_attempt:
+            kwargs["admit"] = _admit
+
+        def _call() -> str:
+            started = time.perf_counter()
+            status = "error"
+            try:
+                raw = client.complete(messages, **kwargs)
+                status = "ok"
+                return raw
+            finally:
+                LLM_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started,
+                    task=task or "default",
+                    model=model or getattr(getattr(client, "inner", client), "model", ""),
+                    status=status,
+                )
+
+        if self.admission is None or per_attempt:
+            return _call()
+        return _admit(_call)
+
+    def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        timeout: Optional[float],
+        priority: str,
+        task: Optional[str] = None,
+    ) -> str:
+        if self.router is None:
+            return self._admitted_call(
+                self.client, messages, timeout=timeout, max_tokens=None, priority=priority, task=task,
+            )
+
+        route = self.router.route_for(task)
+        if route.timeout is not None:
+            timeout = route.timeout
+        last_error: Optional[Exception] = None
+        for model, client in self.router.candidates(task):
+            if last_error is not None:
+                logger.warning("LLM task %s falling back to %s: %s", task, model, last_error)
+            try:
+                return self._admitted_call(
+                    client, messages, timeout=timeout, max_tokens=route.max_tokens, priority=priority,
+                    task=task, model=model,
+                )
+            except LLMAdmissionTimeoutError:
+                # 准入是进程级的，换模型只会再排一次队
+                raise
+            except Exception as e:
+                last_error = e
+        assert last_error is not None
+        raise last_error
+
+    def _parse(self, raw: str, schema: Optional[JSONSchema]) -> Dict[str, Any]:
+        data = self.extractor.extract(raw)
+        if schema:
+            validate_json_schema(data, schema)
+        return data
 
     def ask_json(
         self,
         messages: List[Dict[str, str]],
         *,
         timeout: Optional[float] = None,
+        schema: Optional[JSONSchema] = None,
+        priority: Optional[str] = None,
+        task: Optional[str] = None,
     ) -> Dict[str, Any]:
-        raw = self.client.complete(messages, timeout=timeout)
-        return self.extractor.extract(raw)
+        if priority is None:
+            priority = TASK_PRIORITIES.get(task or "", DEFAULT_PRIORITY)
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.regenerate_retries + 1):
+            if attempt:
+                logger.warning("LLM JSON output unusable, regenerating (attempt %d): %s", attempt, last_error)
+            raw = self._complete(messages, timeout=timeout, priority=priority, task=task)
+            try:
+                return self._parse(raw, schema)
+            except ValueError as e:
+                last_error = e
+
+            for _ in range(self.fix_retries):
+                logger.info("LLM JSON output invalid, asking model to fix: %s", last_error)
+                fix_messages = [
+                    {"role": "system", "content": SYSTEM_JSON_FIXER},
+                    {
+                        "role": "user",
+                        "content": USER_JSON_FIXER.format(
+                            error=last_error,
+                            schema=_describe_schema(schema),
+                            raw=raw,
+                        ),
+                    },
+                ]
+                raw = self._complete(fix_messages, timeout=timeout, priority=priority, task=task)
+                try:
+                    return self._parse(raw, schema)
+                except ValueError as e:
+                    last_error = e
+
+        assert last_error is not None
+        raise last_error
 
 
 
 # -------------------------
-# 5) 一个便捷的工厂方法（可选）
+# 8) 一个便捷的工厂方法（可选）
 # -------------------------
-def build_qwen_gateway_from_env() -> LLMGateway:
+def build_qwen_gateway_from_env(user_id: Optional[Any] = None) -> LLMGateway:
     """
     用环境变量构建 Qwen（DashScope compatible-mode）的网关。
     这样 Step 1 不需要关心 api_key/base_url/model 的细节。
 
+    所有网关共享进程级准入控制器；user_id 用于跨用户公平调度。
+    同一进程内按模型名复用客户端（见 get_llm_router）。
+
     Env:
       DASHSCOPE_API_KEY=...
       DASHSCOPE_BASE_URL=https://dashscope.aliyuncs.com/compatible-mode/v1
       DASHSCOPE_MODEL=qwen-plus
+      LLM_MAX_RETRIES=2        # 可重试错误的最大重试次数
+      LLM_HEDGE_DELAY=         # 秒；为空则不启用对冲请求
+      DASHSCOPE_FAST_MODEL=    # 可选；裁决 / 意图扩展 / 入库摘要使用的快速模型，失败回退主模型
+      LLM_ROUTES=              # 可选；JSON 字符串或文件路径，按 task 覆盖路由（见 load_llm_routes）
     """
-    api_key = os.getenv("DASHSCOPE_API_KEY", "")
-    base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-    model = os.getenv("DASHSCOPE_MODEL", "qwen-plus")
+    router = get_llm_router()
+    return LLMGateway(
+        client=router.client_for(router.default.model),
+        admission=get_llm_admission_controller(),
+        user_id=user_id,
+        router=router,
+    )
+
+
+_llm_router: Optional[LLMRouter] = None
+_llm_router_lock = threading.Lock()
+
 
-    if not api_key:
-        raise RuntimeError("Missing DASHSCOPE_API_KEY in environment variables.")
+def get_llm_router() -> LLMRouter:
+    """进程级单例：路由表 + 按模型名缓存的客户端"""
+    global _llm_router
+    with _llm_router_lock:
+        if _llm_router is not None:
+            return _llm_router
 
-    client = OpenAICompatibleClient(model=model, api_key=api_key, base_url=base_url)
-    return LLMGateway(client=client)
+        api_key = os.getenv("DASHSCOPE_API_KEY", "")
+        base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+        model = os.getenv("DASHSCOPE_MODEL", "qwen-plus")
+        fast_model = os.getenv("DASHSCOPE_FAST_MODEL", "")
+
+        if not api_key:
+            raise RuntimeError("Missing DASHSCOPE_API_KEY in environment variables.")
+
+        hedge_delay = os.getenv("LLM_HEDGE_DELAY", "")
+        max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+        def _client_factory(model_name: str) -> LLMClient:
+            return ResilientLLMClient(
+                inner=OpenAICompatibleClient(
+                    model=model_name,
+                    api_key=api_key,
+                    base_url=base_url,
+                    sdk_max_retries=0,
+                ),
+                max_retries=max_retries,
+                hedge_delay=float(hedge_delay) if hedge_delay else None,
+            )
+
+        routes: Dict[str, ModelRoute] = {}
+        if fast_model:
+            for task in ("adjudicate", "expand", "summarize"):
+                routes[task] = ModelRoute(model=fast_model, fallbacks=[model])
+        routes.update(load_llm_routes(os.getenv("LLM_ROUTES", "")))
+
+        _llm_router = LLMRouter(
+            default=ModelRoute(model=model),
+            client_factory=_client_factory,
+            routes=routes,
+        )
+        return _llm_router
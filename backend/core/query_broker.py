@@ -0,0 +1,116 @@
+# core/query_broker.py
+"""
+会话级检索查询代理（Step 4 各 sub-goal 共享）
+
+背景：
+- 同一 section 下的 sub-goal 经常生成重叠 / 相同的 query_hints，
+  意图扩展也常收敛到相同表述；每个 sub-goal 仍对每个知识库各查一次
+- QueryBroker 在一次研究会话内：
+  1) 规范化查询（全半角 / 大小写 / 空白，保留词序）
+  2) 合并相同的进行中请求（后到者等待同一个 Future）
+  3) 复用已完成的结果
+- 结果仍按 sub-goal 归属（调用方各自适配），节省情况按 sub-goal 记账，写入 Step 4 trace
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.metrics import REGISTRY
+
+QUERY_BROKER_EVENTS = REGISTRY.counter(
+    "query_broker_events_total", "Session query broker requests / fetched / cache_hits / coalesced / failures", ("event",),
+)
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化后相同的查询视为同一请求（只去掉不影响检索语义的差异）：
+    - NFKC（全角 → 半角）+ 小写
+    - 连续空白合并为单个空格，去掉首尾空白
+    - 保留词序与重复词：检索按短语相关性打分，“A of B” 与 “B of A” 不是同一查询
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _new_stats() -> Dict[str, int]:
+    return {"requests": 0, "fetched": 0, "cache_hits": 0, "coalesced": 0, "failures": 0}
+
+
+class QueryBroker:
+    """
+    用法（一次研究会话一个实例）：
+        broker = QueryBroker()
+        chunks = broker.fetch(query, kb_id, lambda q, kb: rag.retrieve(...), owner=sub_goal_id)
+
+    - 返回的结果对象在 sub-goal 间共享，调用方只读不改
+    - 失败不缓存：等待中的调用方收到同一异常，之后的请求会重新发起
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str, Optional[int]], Future] = {}
+        self._stats = _new_stats()
+        self._owners: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, owner: Optional[str], key: str) -> None:
+        # 调用方已持有 self._lock
+        self._stats[key] += 1
+        QUERY_BROKER_EVENTS.inc(event=key)
+        if owner is not None:
+            self._owners.setdefault(owner, _new_stats())[key] += 1
+
+    def fetch(
+        self,
+        query: str,
+        kb_id: str,
+        fetch_fn: Callable[[str, str], List[Any]],
+        *,
+        owner: Optional[str] = None,
+        size: Optional[int] = None,
+    ) -> List[Any]:
+        # size（每次检索条数）不同的结果不能互相复用
+        key = (normalize_query(query), kb_id, size)
+        with self._lock:
+            self._count(owner, "requests")
+            future = self._entries.get(key)
+            if future is None:
+                future = Future()
+                self._entries[key] = future
+                leader = True
+                self._count(owner, "fetched")
+            else:
+                leader = False
+                self._count(owner, "cache_hits" if future.done() else "coalesced")
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fetch_fn(query, kb_id)
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+                self._count(owner, "failures")
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def snapshot(self, owner: Optional[str] = None) -> Dict[str, Any]:
+        """owner 为空时返回会话总计（含节省比例），否则返回该 sub-goal 的计数"""
+        with self._lock:
+            if owner is not None:
+                return dict(self._owners.get(owner, _new_stats()))
+            stats = dict(self._stats)
+            stats["unique_queries"] = len(self._entries)
+        saved = stats["cache_hits"] + stats["coalesced"]
+        stats["saved_ratio"] = round(saved / stats["requests"], 3) if stats["requests"] else 0.0
+        return stats
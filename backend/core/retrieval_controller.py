@@ -0,0 +1,154 @@
+# core/retrieval_controller.py
+"""
+Step 4 自适应检索控制（每个 sub-goal 一个实例）
+
+背景：
+- search_list_ragflow 原先把 size=10 悄悄改写为 0.8 * query 数 * 知识库数 * 10
+- run_step4_for_subgoal 无论收益如何都跑满 3 + 3 轮
+- 这里按“信息增益”控制检索开销：
+  1) 每轮统计新增的唯一 chunk / 文档（按轮、按 query）
+  2) 新增比例高且结果被截断 → 扩大 size；新增比例低 → 缩小 size
+  3) 连续 patience 轮新增比例低于 min_gain → 提前结束检索轮次
+
+全部策略参数可由环境变量配置；RETRIEVAL_ADAPTIVE=0 时退回旧行为（固定 size、跑满轮次）。
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+# =========================
+# 常量定义（环境变量可覆盖）
+# =========================
+RETRIEVAL_ADAPTIVE = os.getenv("RETRIEVAL_ADAPTIVE", "1") == "1"
+# 每个 query × 知识库保留的 chunk 数（旧公式 0.8 * 10 = 8）
+RETRIEVAL_PER_QUERY_SIZE = int(os.getenv("RETRIEVAL_PER_QUERY_SIZE", "8"))
+RETRIEVAL_MIN_PER_QUERY_SIZE = int(os.getenv("RETRIEVAL_MIN_PER_QUERY_SIZE", "4"))
+RETRIEVAL_MAX_PER_QUERY_SIZE = int(os.getenv("RETRIEVAL_MAX_PER_QUERY_SIZE", "16"))
+# 新增 chunk 占本轮返回的比例：低于 MIN_GAIN 视为无增益，高于 GROW_GAIN 且被截断时扩大 size
+RETRIEVAL_MIN_GAIN = float(os.getenv("RETRIEVAL_MIN_GAIN", "0.15"))
+RETRIEVAL_SHRINK_GAIN = float(os.getenv("RETRIEVAL_SHRINK_GAIN", "0.3"))
+RETRIEVAL_GROW_GAIN = float(os.getenv("RETRIEVAL_GROW_GAIN", "0.6"))
+RETRIEVAL_GROW_FACTOR = float(os.getenv("RETRIEVAL_GROW_FACTOR", "1.5"))
+RETRIEVAL_SHRINK_FACTOR = float(os.getenv("RETRIEVAL_SHRINK_FACTOR", "0.5"))
+# 连续多少轮低增益后停止（默认 2：单轮低增益可能只是 query 改写不佳，不立即放弃）
+RETRIEVAL_PATIENCE = int(os.getenv("RETRIEVAL_PATIENCE", "2"))
+# Step 4 检索轮次 / Step 5 裁决轮次上限
+RETRIEVAL_MAX_ROUNDS = int(os.getenv("RETRIEVAL_MAX_ROUNDS", "3"))
+RETRIEVAL_MAX_ADJUDICATION_ROUNDS = int(os.getenv("RETRIEVAL_MAX_ADJUDICATION_ROUNDS", "3"))
+
+
+@dataclass
+class RetrievalPolicy:
+    adaptive: bool = RETRIEVAL_ADAPTIVE
+    per_query_size: int = RETRIEVAL_PER_QUERY_SIZE
+    min_per_query_size: int = RETRIEVAL_MIN_PER_QUERY_SIZE
+    max_per_query_size: int = RETRIEVAL_MAX_PER_QUERY_SIZE
+    min_gain: float = RETRIEVAL_MIN_GAIN
+    shrink_gain: float = RETRIEVAL_SHRINK_GAIN
+    grow_gain: float = RETRIEVAL_GROW_GAIN
+    grow_factor: float = RETRIEVAL_GROW_FACTOR
+    shrink_factor: float = RETRIEVAL_SHRINK_FACTOR
+    patience: int = RETRIEVAL_PATIENCE
+    max_rounds: int = RETRIEVAL_MAX_ROUNDS
+    max_adjudication_rounds: int = RETRIEVAL_MAX_ADJUDICATION_ROUNDS
+
+
+def default_retrieval_size(n_queries: int, n_kbs: int, per_query_size: int = RETRIEVAL_PER_QUERY_SIZE) -> int:
+    """旧公式的显式版本：每个 query × 知识库 per_query_size 条"""
+    return max(1, per_query_size * max(n_queries, 1) * max(n_kbs, 1))
+
+
+@dataclass
+class RetrievalController:
+    policy: RetrievalPolicy = field(default_factory=RetrievalPolicy)
+    seen_chunks: Set[str] = field(default_factory=set)     # 已交给 pool 的 chunk
+    seen_docs: Set[str] = field(default_factory=set)
+    seen_raw: Set[str] = field(default_factory=set)        # 各 query 召回过的 chunk（截断前）
+    history: List[Dict[str, Any]] = field(default_factory=list)
+    low_gain_rounds: int = 0
+
+    def __post_init__(self):
+        self.per_query_size = self.policy.per_query_size
+
+    def size_for(self, n_queries: int, n_kbs: int) -> int:
+        return default_retrieval_size(n_queries, n_kbs, self.per_query_size)
+
+    def observe(
+        self,
+        round_no: int,
+        *,
+        contexts: List[Dict[str, Any]],
+        size: int,
+        per_query: Optional[Dict[str, List[str]]] = None,
+        saturated: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        """
+        记录一轮检索结果，返回本轮记录（写入 trace）：
+        {"round", "size", "returned", "new_chunks", "new_docs", "gain", "per_query", "next_size_per_query", "stop"}
+        saturated：检索端是否取满了 page_size（None 时按 returned >= size 判断）
+        """
+        returned = len(contexts)
+        chunk_ids = [c.get("chunk_id") or c.get("text", "") for c in contexts]
+        new_chunks = {cid for cid in chunk_ids if cid not in self.seen_chunks}
+        new_docs = {c.get("doc_id") or c.get("source") for c in contexts} - self.seen_docs
+        gain = len(new_chunks) / returned if returned else 0.0
+
+        query_gain = {}
+        for q, ids in (per_query or {}).items():
+            query_gain[q] = len(set(ids) - self.seen_raw)
+        for ids in (per_query or {}).values():
+            self.seen_raw.update(ids)
+
+        first = not self.history
+        self.seen_chunks.update(new_chunks)
+        self.seen_docs.update(new_docs)
+
+        stop = False
+        if self.policy.adaptive and not first:
+            if gain < self.policy.min_gain:
+                self.low_gain_rounds += 1
+                stop = self.low_gain_rounds >= self.policy.patience
+            else:
+                self.low_gain_rounds = 0
+        if self.policy.adaptive:
+            self._resize(gain, saturated=returned >= size if saturated is None else saturated)
+
+        record = {
+            "round": round_no,
+            "size": size,
+            "returned": returned,
+            "new_chunks": len(new_chunks),
+            "new_docs": len(new_docs),
+            "gain": round(gain, 3),
+            "per_query": query_gain,
+            "next_size_per_query": self.per_query_size,
+            "stop": stop,
+        }
+        self.history.append(record)
+        print(
+            f"[RETRIEVAL] round {round_no}: +{len(new_chunks)} chunks / +{len(new_docs)} docs "
+            f"(gain {gain:.2f}), next per-query size {self.per_query_size}{' → stop' if stop else ''}"
+        )
+        return record
+
+    def _resize(self, gain: float, *, saturated: bool) -> None:
+        p = self.policy
+        if gain >= p.grow_gain and saturated:
+            size = int(round(self.per_query_size * p.grow_factor))
+        elif gain < p.shrink_gain:
+            size = int(round(self.per_query_size * p.shrink_factor))
+        else:
+            return
+        self.per_query_size = min(p.max_per_query_size, max(p.min_per_query_size, size))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "rounds": len(self.history),
+            "unique_chunks": len(self.seen_chunks),
+            "unique_docs": len(self.seen_docs),
+            "requested": sum(h["size"] for h in self.history),
+            "stopped_early": any(h["stop"] for h in self.history),
+        }
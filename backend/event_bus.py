@@ -2,6 +2,13 @@
 import asyncio
 from typing import AsyncGenerator
 
+from core.metrics import REGISTRY
+
+SSE_SUBSCRIBERS = REGISTRY.gauge("sse_subscribers", "Open SSE streams", ("bus",))
+SSE_EVENTS = REGISTRY.counter("sse_events_total", "Events emitted", ("bus",))
+SSE_EVENTS_DROPPED = REGISTRY.counter("sse_events_dropped_total", "Events dropped for slow subscribers", ("bus",))
+SSE_QUEUE_DEPTH = REGISTRY.gauge("sse_queue_depth", "Events waiting in the bus queue(s)", ("bus",))
+
 
 class EventBus:
     """
@@ -10,7 +17,8 @@ class EventBus:
     - SSE 层：stream()
     """
 
-    def __init__(self):
+    def __init__(self, name: str = "research"):
+        self.name = name
         self.queue: asyncio.Queue[str] = asyncio.Queue()
 
     async def emit(self, event: str):
@@ -18,15 +26,78 @@ class EventBus:
         向事件队列中发送一条已经格式化好的 SSE 文本
         """
         await self.queue.put(event)
+        SSE_EVENTS.inc(bus=self.name)
+        SSE_QUEUE_DEPTH.set(self.queue.qsize(), bus=self.name)
 
     async def stream(self) -> AsyncGenerator[str, None]:
         """
         SSE 消费端：不断从队列中取事件并 yield 给前端
         """
-        while True:
-            event = await self.queue.get()
-            yield event
+        SSE_SUBSCRIBERS.inc(bus=self.name)
+        try:
+            while True:
+                event = await self.queue.get()
+                SSE_QUEUE_DEPTH.set(self.queue.qsize(), bus=self.name)
+                yield event
+        finally:
+            SSE_SUBSCRIBERS.dec(bus=self.name)
 
 
 # 全局单例（当前 demo 阶段足够）
 event_bus = EventBus()
+
+
+class BroadcastEventBus:
+    """
+    广播式事件总线：每个订阅者一个独立队列，事件带 topic 过滤
+    - 与 EventBus 不同，多个 SSE 连接可以同时收到同一事件
+    - emit() 可在事件循环线程内调用；后台线程请用 emit_threadsafe()
+    """
+
+    def __init__(self, max_queue_size: int = 1000, name: str = "broadcast"):
+        self.name = name
+        self.max_queue_size = max_queue_size
+        self._subscribers: dict[asyncio.Queue, set] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def emit(self, topic, event: str) -> None:
+        SSE_EVENTS.inc(bus=self.name)
+        for queue, topics in list(self._subscribers.items()):
+            if topic not in topics:
+                continue
+            if queue.full():
+                # 慢消费者：丢弃最旧的事件，避免无限堆积
+                queue.get_nowait()
+                SSE_EVENTS_DROPPED.inc(bus=self.name)
+            queue.put_nowait(event)
+        SSE_QUEUE_DEPTH.set(self.queue_depth(), bus=self.name)
+
+    def emit_threadsafe(self, topic, event: str) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self.emit, topic, event)
+
+    async def stream(self, topics: set) -> AsyncGenerator[str, None]:
+        """订阅 topics，直到客户端断开"""
+        queue: asyncio.Queue[str] = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers[queue] = set(topics)
+        SSE_SUBSCRIBERS.inc(bus=self.name)
+        try:
+            while True:
+                event = await queue.get()
+                SSE_QUEUE_DEPTH.set(self.queue_depth(), bus=self.name)
+                yield event
+        finally:
+            self._subscribers.pop(queue, None)
+            SSE_SUBSCRIBERS.dec(bus=self.name)
+
+    def queue_depth(self) -> int:
+        """所有订阅者队列中待发送的事件总数"""
+        return sum(q.qsize() for q in list(self._subscribers))
+
+
+# 文档状态变更（解析完成 / 失败）推送，topic = knowledge_space_id
+document_event_bus = BroadcastEventBus(name="documents")
@@ -12,7 +12,7 @@ from steps.step4_se_ev import run_step4_for_subgoal,run_step4
 # from steps.step5_adjudicator import evaluate_subgoal_support_with_llm
 from steps.step6_draft import generate_paragraphs_for_sub_goals
 from utils.pickle_csp import save_result,pretty,load_result
-from tests.test_step7 import run_step7_global_edit
+from steps.step7_edit import run_step7_global_edit
 
 
 
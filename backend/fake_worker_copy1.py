@@ -11,6 +11,7 @@ DeepResearch Orchestrator (Live / Cache Dual Mode)
 """
 
 import asyncio
+import os
 from typing import Dict
 
 from utils.sse_utils import sse_event
@@ -23,22 +24,31 @@ from steps.step2_plan import generate_research_plan
 from steps.step3_subgoals import generate_sub_goals
 from steps.step4_se_ev import run_step4
 from steps.step6_draft import generate_paragraphs_for_sub_goals
-from tests.test_step7 import run_step7_global_edit
+from steps.step7_edit import run_step7_global_edit
 
-from utils.pickle_csp import save_result, load_result, pretty
-from interface_DB.knowledge_service import search_know_ragflow_id
+from utils.pickle_csp import pretty
+from core.metrics import REGISTRY
+from utils.step_cache import save_result, load_result, iter_records
+from interface_DB.knowledge_service import get_knowledge_summaries_service, search_know_ragflow_id
 
 # ============================================================
 # 全局运行模式控制
 # ============================================================
 USE_CACHE = True   # True = 回放模式 / False = 实时运行
 
+# Step 7 编辑模式："single" = 整篇一次调用（默认）/ "map_reduce" = 按章节并发编辑
+STEP7_EDIT_MODE = os.getenv("STEP7_EDIT_MODE", "single")
+
 
 # ============================================================
 # Clarification Queue（前后端同步）
 # ============================================================
 clarification_queues: Dict[str, asyncio.Queue] = {}
 
+CLARIFICATION_WAITING = REGISTRY.gauge(
+    "research_clarification_waiting", "Research sessions blocked waiting for a clarification reply",
+)
+
 
 def get_clarification_queue(session_id: str) -> asyncio.Queue:
     if session_id not in clarification_queues:
@@ -55,7 +65,7 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     print("search_list:", search_list)
     print("Session ID:", session_id)
 
-    gateway = build_qwen_gateway_from_env()
+    gateway = build_qwen_gateway_from_env(user_id=user_input["user_id"])
     queue = get_clarification_queue(session_id)
 
     # =====================================================
@@ -69,13 +79,17 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     user_id = user_input["user_id"]
     knw_rag_list = []
     for i in search_list:
-        knw_ragflow_id = search_know_ragflow_id(user_id=user_id,knowledge_space_id=i)
+        # 同步 DB 查询放到线程池，避免阻塞事件循环
+        knw_ragflow_id = await asyncio.to_thread(search_know_ragflow_id, user_id=user_id, knowledge_space_id=i)
         if knw_ragflow_id:
             knw_rag_list.append(knw_ragflow_id)
+    # 入库时已生成的文档摘要（Step 3 / Step 4 意图扩展参考，无额外 LLM 调用）
+    doc_summaries = await asyncio.to_thread(get_knowledge_summaries_service, knw_rag_list)
 
 
     while True:
-        result = clarification_step(gateway, state, user_text)
+        # 网关是同步调用（准入排队会阻塞线程）：放到线程中执行，不阻塞事件循环
+        result = await asyncio.to_thread(clarification_step, gateway, state, user_text)
         pretty(result)
 
         status = result.get("status")
@@ -89,7 +103,8 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
                 )
             )
             print("[Waiting clarification reply from frontend...]")
-            user_text = await queue.get()
+            with CLARIFICATION_WAITING.track_inprogress():
+                user_text = await queue.get()
             print("📩 Clarification reply:", user_text)
             continue
 
@@ -100,7 +115,7 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
         print("[Clarification failed]")
         return
 
-    save_result(requirements, "cache/step1_requirements.pkl")
+    save_result(requirements, "cache/step1_requirements.jsonl.gz")
 
     step1_lite = {
         "goal": requirements["goal"],
@@ -125,13 +140,14 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     print("Step 2: Research Plan")
 
     if USE_CACHE:
-        plan = load_result("cache/step2_plan.pkl")
+        plan = load_result("cache/step2_plan.jsonl.gz")
     else:
-        plan = generate_research_plan(
+        plan = await asyncio.to_thread(
+            generate_research_plan,
             gateway=gateway,
             requirements=requirements,
         )
-        save_result(plan, "cache/step2_plan.pkl")
+        save_result(plan, "cache/step2_plan.jsonl.gz")
 
     pretty(plan)
 
@@ -147,16 +163,18 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     print("Step 3: Sub-goals")
 
     if USE_CACHE:
-        subgoals_result = load_result("cache/step3_subgoals.pkl")
+        subgoals_result = load_result("cache/step3_subgoals.jsonl.gz")
     else:
-        subgoals_result = generate_sub_goals(
+        subgoals_result = await asyncio.to_thread(
+            generate_sub_goals,
             gateway=gateway,
             requirements=requirements,
             plan=plan,
             min_per_section=2,
             max_per_section=5,
+            doc_summaries=doc_summaries,
         )
-        save_result(subgoals_result, "cache/step3_subgoals.pkl")
+        save_result(subgoals_result, "cache/step3_subgoals.jsonl.gz")
 
     pretty(subgoals_result)
 
@@ -171,40 +189,46 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     )
 
     if USE_CACHE:
-        step4_result = load_result("cache/step4_result.pkl")
+        # 回放模式下 Step 6 同样读缓存，不需要完整的 Step 4 结果；下方事件按 sub-goal 流式读取
+        step4_result = None
     else:
-        step4_result = run_step4(
+        step4_result = await asyncio.to_thread(
+            run_step4,
             kb_ids=knw_rag_list,
             gateway=gateway,
             sub_goals=subgoals_result["sub_goals"],
+            doc_summaries=doc_summaries,
         )
-        save_result(step4_result, "cache/step4_result.pkl")
+        save_result(step4_result, "cache/step4_result.jsonl.gz")
 
     # ======== 保留你写死的 retrieval_finished 事件（一个不删） ========
 
     # await asyncio.sleep(1)
-    temp_step4_output = load_result("cache/step4_result.pkl")['sub_goal_results']
+    # 回放时流式逐个 sub-goal 读取（不再整份重新加载一次）；实时运行直接用内存中的结果
+    if USE_CACHE:
+        temp_step4_output = iter_records("cache/step4_result.jsonl.gz")
+    else:
+        temp_step4_output = step4_result['sub_goal_results']
     # for i in range(len(temp_step4_output)):
     #     for j in range(len(temp_step4_output[i]['result']['pool']["contexts"])):
     #         print("title", temp_step4_output[i]['result']['pool']['intent'],temp_step4_output[i]['result']['pool']['contexts'][j]['source'])
     # print('\n\n\n')
-    for i in range(len(temp_step4_output)):
+    for sg_output in temp_step4_output:
         source_list = []
-        for j in range(len(temp_step4_output[i]['result']['pool']["contexts"])):
-            source_list.append(temp_step4_output[i]['result']['pool']['contexts'][j]['source'])
+        for c in sg_output['result']['pool']["contexts"]:
+            source_list.append(c['source'])
         # print('\n\n\n')
         # print(len(source_list),source_list)
         source_list = list(set(source_list))
         # print(len(source_list),source_list)
         for j in source_list :
-            # print(temp_step4_output[i]['result']['pool']['contexts'][j]['source'])
             await event_bus.emit(
                 sse_event(
                     "retrieval_finished",
                     {
-                        "title": temp_step4_output[i]['result']['pool']['intent'],
+                        "title": sg_output['result']['pool']['intent'],
                         "source": j,
-                        "sub_goal_id": temp_step4_output[i]['sub_goal_id'],
+                        "sub_goal_id": sg_output['sub_goal_id'],
                     },
                 )
             )
@@ -275,13 +299,14 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     print("Step 6: Draft Paragraphs")
 
     if USE_CACHE:
-        step6_paragraphs = load_result("cache/step6_paragraphs.pkl")
+        step6_paragraphs = load_result("cache/step6_paragraphs.jsonl.gz")
     else:
-        step6_paragraphs = generate_paragraphs_for_sub_goals(
+        step6_paragraphs = await asyncio.to_thread(
+            generate_paragraphs_for_sub_goals,
             gateway=gateway,
             result=step4_result,
         )
-        save_result(step6_paragraphs, "cache/step6_paragraphs.pkl")
+        save_result(step6_paragraphs, "cache/step6_paragraphs.jsonl.gz")
 
     # =====================================================
     # Step 7: Global Edit
@@ -294,15 +319,17 @@ async def run_fake_research(session_id: str, user_input: dict, search_list: list
     )
 
     if USE_CACHE:
-        final_doc = load_result("cache/step7_final_doc.pkl")
+        final_doc = load_result("cache/step7_final_doc.jsonl.gz")
     else:
-        final_doc = run_step7_global_edit(
+        final_doc = await asyncio.to_thread(
+            run_step7_global_edit,
             gateway=gateway,
             requirements=step1_lite,
             plan=step2_lite,
             draft_paragraphs=step6_paragraphs,
+            mode=STEP7_EDIT_MODE,
         )
-        save_result(final_doc, "cache/step7_final_doc.pkl")
+        save_result(final_doc, "cache/step7_final_doc.jsonl.gz")
 
     await event_bus.emit(
         sse_event(
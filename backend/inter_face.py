@@ -13,29 +13,40 @@ from fastapi import (
     Form,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 
 # =========================
 # 事件 / research 相关
 # =========================
-from event_bus import event_bus
-from fake_worker_copy1 import run_fake_research, get_clarification_queue
+from event_bus import event_bus, document_event_bus
+from fake_worker_copy1 import run_fake_research, get_clarification_queue, clarification_queues
 from utils.sse_utils import sse_event
+from utils.upload_stream import UploadTooLargeError, save_upload_stream, store_blob
 
 # =========================
 # Auth & DB
 # =========================
-from interface_DB.MySQL_db import SessionLocal
+from interface_DB.MySQL_db import init_db, run_db, should_auto_create_schema
 from interface_DB.MySQL_user_crud import (
-    register_user,
-    login_user,
+    register_user_async,
+    login_user_async,
     get_current_user,
+    user_cache,
+    password_hasher,
+    login_throttle,
+)
+from interface_DB.auth_guard import (
+    HashPoolBusyError,
+    LoginThrottledError,
+    parse_trusted_proxies,
+    resolve_client_ip,
 )
 
 # =========================
 # ORM（只 import 用于注册）
 # =========================
 from interface_DB.MySQL_user import User
+from interface_DB.user_cache import UserSnapshot
 from interface_DB.MySQL_knowledge_space import KnowledgeSpace
 from interface_DB.MySQL_document import Document
 from interface_DB.MySQL_knowledge_space_crud import get_knowledge_space
@@ -48,12 +59,19 @@ from interface_DB.knowledge_service import (
     update_knowledge_space_service,
     delete_knowledge_space_service,
     upload_document_service,
+    upload_documents_batch_service,
+    find_duplicate_document_service,
+    release_local_file_service,
     list_documents_service,
     rename_document_service,
     delete_document_service,
     parse_document_service,
-    check_parse_status_job,
 )
+from interface_DB.parse_status_sync import ParseStatusSyncService
+from core.doc_text_store import get_doc_text_store
+from core.llm_gateway import build_qwen_gateway_from_env, get_llm_admission_controller
+from core.metrics import CONTENT_TYPE, REGISTRY, MetricFamily, snapshot_families
+from interface_DB.doc_summary import DocumentSummarizer
 
 # =========================================================
 # App 初始化
@@ -71,15 +89,98 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -----------------------------
+# 后台任务：解析状态同步（结果经 SSE 推送）
+# -----------------------------
+def _publish_document_change(change: dict) -> None:
+    document_event_bus.emit_threadsafe(
+        change["knowledge_space_id"],
+        sse_event("document_status_changed", change),
+    )
+
+
+doc_summarizer = DocumentSummarizer(
+    gateway_factory=build_qwen_gateway_from_env,
+    text_store=get_doc_text_store(),
+)
+parse_status_sync = ParseStatusSyncService(
+    on_change=_publish_document_change,
+    text_store=get_doc_text_store(),
+    summarizer=doc_summarizer,
+)
+
+
+# -----------------------------
+# 指标：各组件已有 snapshot() 在抓取时读取
+# -----------------------------
+# 负载均衡 / Prometheus 抓取用；设置后需带 Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+RESEARCH_SESSIONS_ACTIVE = REGISTRY.gauge("research_sessions_active", "Research sessions currently running")
+RESEARCH_SESSIONS = REGISTRY.counter("research_sessions_total", "Finished research sessions", ("status",))
+
+
+def _collect_llm_admission():
+    snap = get_llm_admission_controller().snapshot()
+    families = [
+        MetricFamily("llm_admission_queued", "gauge", "LLM requests waiting for admission"),
+        MetricFamily("llm_admission_admitted_total", "counter", "LLM requests admitted"),
+        MetricFamily("llm_admission_wait_seconds_total", "counter", "Total admission wait"),
+        MetricFamily("llm_admission_wait_seconds_max", "gauge", "Longest admission wait"),
+    ]
+    for priority, m in snap["priorities"].items():
+        labels = {"priority": priority}
+        families[0].add(m["queued"], labels)
+        families[1].add(m["admitted"], labels)
+        families[2].add(m["wait_seconds_total"], labels)
+        families[3].add(m["wait_seconds_max"], labels)
+    return families + snapshot_families(
+        "llm_admission",
+        {"requests_available": snap["requests_available"], "tokens_available": snap["tokens_available"]},
+        "LLM admission token bucket level",
+    )
+
+
+def _collect_clarification_queues():
+    family = MetricFamily("research_clarification_queues", "gauge", "Sessions with a clarification queue")
+    family.add(len(clarification_queues))
+    return [family]
+
+
+for _name, _snapshot in {
+    "auth_user_cache": user_cache.snapshot,
+    "auth_password_hasher": password_hasher.snapshot,
+    "auth_login_throttle": login_throttle.snapshot,
+    "parse_status_sync": parse_status_sync.snapshot,
+    "doc_summarizer": doc_summarizer.snapshot,
+    "doc_text_store": lambda: get_doc_text_store().snapshot(),
+}.items():
+    REGISTRY.register_collector(
+        _name, lambda _name=_name, _snapshot=_snapshot: snapshot_families(_name, _snapshot(), f"{_name} snapshot"),
+    )
+REGISTRY.register_collector("llm_admission", _collect_llm_admission)
+REGISTRY.register_collector("research_clarification", _collect_clarification_queues)
+
+
+@app.on_event("startup")
+async def _start_background_jobs():
+    if should_auto_create_schema():
+        await asyncio.to_thread(init_db)
+    document_event_bus.bind_loop(asyncio.get_running_loop())
+    parse_status_sync.start()
+
+
+@app.on_event("shutdown")
+async def _stop_background_jobs():
+    await parse_status_sync.stop()
+    doc_summarizer.shutdown()
+
+
 # =========================================================
-# DB 依赖
+# DB 访问
 # =========================================================
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 所有 async 接口的 DB 操作统一经 run_db(fn) 放到 DB 线程池执行，
+# fn(db) 内完成查询与序列化，避免同步 SQLAlchemy 阻塞事件循环（SSE 等）。
 
 
 # =========================================================
@@ -106,30 +207,51 @@ def get_current_user_from_header(
 async def api_register(request: Request):
     body = await request.json()
     try:
-        return register_user(
+        return await register_user_async(
             username=body.get("username"),
             email=body.get("email"),
             password=body.get("password"),
         )
+    except HashPoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+# 负载均衡 / 反向代理地址（逗号分隔 IP / CIDR）。未配置时按直连地址限流：
+# 部署在 LB 后必须配置，否则所有客户端共用 LB 地址、互相触发 IP 锁定
+TRUSTED_PROXIES = parse_trusted_proxies(os.getenv("TRUSTED_PROXIES", ""))
+
+
+def _client_ip(request: Request) -> str | None:
+    peer = request.client.host if request.client else None
+    return resolve_client_ip(peer, request.headers.get("x-forwarded-for"), TRUSTED_PROXIES)
+
+
 @app.post("/api/auth/login")
 async def api_login(request: Request):
     body = await request.json()
     try:
-        return login_user(
+        return await login_user_async(
             username=body.get("username"),
             password=body.get("password"),
+            client_ip=_client_ip(request),
+        )
+    except LoginThrottledError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after) + 1)},
         )
+    except HashPoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
 
 @app.get("/api/auth/me")
 async def api_me(
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
     return {
         "id": user.id,
@@ -165,7 +287,7 @@ async def api_me(
 @app.post("/api/research/start")
 async def start_research(
     request: Request,
-    user: User = Depends(get_current_user_from_header),  # ✅ 引入用户上下文
+    user: UserSnapshot = Depends(get_current_user_from_header),  # ✅ 引入用户上下文
 ):
     try:
         body = await request.json()
@@ -179,7 +301,7 @@ async def start_research(
     search_list = body.get("search_list", [])
 
     asyncio.create_task(
-        run_fake_research(
+        _tracked_research(
             session_id=session_id,
             user_input={
                 "query": user_input,
@@ -195,6 +317,17 @@ async def start_research(
     }
 
 
+async def _tracked_research(**kwargs):
+    """run_fake_research + 会话指标（进行中 / 完成 / 失败）"""
+    status = "failed"
+    with RESEARCH_SESSIONS_ACTIVE.track_inprogress():
+        try:
+            await run_fake_research(**kwargs)
+            status = "completed"
+        finally:
+            RESEARCH_SESSIONS.inc(status=status)
+
+
 # @app.post("/api/research/clarification")
 # async def research_clarification(request: Request):
 #     body = await request.json()
@@ -219,7 +352,7 @@ async def start_research(
 @app.post("/api/research/clarification")
 async def research_clarification(
     request: Request,
-    user: User = Depends(get_current_user_from_header),  # ✅ 新增
+    user: UserSnapshot = Depends(get_current_user_from_header),  # ✅ 新增
 ):
     body = await request.json()
 
@@ -258,7 +391,7 @@ async def research_clarification(
 async def research_stream(
     request: Request,
     session_id: str,
-    user: User = Depends(get_current_user_from_header),  # ✅ 新增
+    user: UserSnapshot = Depends(get_current_user_from_header),  # ✅ 新增
 ):
     # ⚠️ 当前版本只做“登录态校验”
     # 后续可做：session_id → user_id 映射校验
@@ -269,17 +402,27 @@ async def research_stream(
     )
 
 
+# =========================================================
+# 监控指标（Prometheus 文本格式）
+# =========================================================
+@app.get("/metrics")
+async def metrics(authorization: str = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 # =========================================================
 # Knowledge Space 接口（必须登录）
 # =========================================================
 @app.post("/api/knowledge_spaces")
 async def api_create_knowledge_space(
     request: Request,
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
     body = await request.json()
-    db = SessionLocal()
-    try:
+
+    def _create(db):
         ks = create_knowledge_space_service(
             db,
             name=body.get("name"),
@@ -292,16 +435,15 @@ async def api_create_knowledge_space(
             "description": ks.description,
             "created_at": ks.created_at,
         }
-    finally:
-        db.close()
+
+    return await run_db(_create)
 
 
 @app.get("/api/knowledge_spaces")
 async def api_list_knowledge_spaces(
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
-    db = SessionLocal()
-    try:
+    def _list(db):
         items = list_knowledge_spaces_service(
             db,
             owner_id=user.id,
@@ -316,19 +458,19 @@ async def api_list_knowledge_spaces(
             }
             for ks in items
         ]
-    finally:
-        db.close()
+
+    return await run_db(_list)
 
 
 @app.put("/api/knowledge_spaces/{knowledge_space_id}")
 async def api_update_knowledge_space(
     knowledge_space_id: int,
     request: Request,
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
     body = await request.json()
-    db = SessionLocal()
-    try:
+
+    def _update(db):
         ks = update_knowledge_space_service(
             db,
             knowledge_space_id=knowledge_space_id,
@@ -338,25 +480,21 @@ async def api_update_knowledge_space(
             visibility=body.get("visibility"),
         )
         return {"status": "ok", "id": ks.id}
-    finally:
-        db.close()
+
+    return await run_db(_update)
 
 
 @app.delete("/api/knowledge_spaces/{knowledge_space_id}")
 async def api_delete_knowledge_space(
     knowledge_space_id: int,
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
-    db = SessionLocal()
-    try:
-        delete_knowledge_space_service(
-            db,
-            knowledge_space_id=knowledge_space_id,
-            owner_id=user.id,
-        )
-        return {"status": "ok"}
-    finally:
-        db.close()
+    await run_db(
+        delete_knowledge_space_service,
+        knowledge_space_id=knowledge_space_id,
+        owner_id=user.id,
+    )
+    return {"status": "ok"}
 
 
 # =========================================================
@@ -367,6 +505,10 @@ async def api_delete_knowledge_space(
 # -----------------------------
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
 UPLOAD_ROOT = "cache/uploads"
+# 内容寻址存储：相同内容（跨用户 / 知识库）只存一份
+BLOB_ROOT = os.path.join(UPLOAD_ROOT, "blobs")
+UPLOAD_TMP_ROOT = os.path.join(UPLOAD_ROOT, "tmp")
+MAX_BATCH_FILES = 50
 
 
 # @app.post("/api/documents/upload")
@@ -374,110 +516,207 @@ UPLOAD_ROOT = "cache/uploads"
 async def api_upload_document_real(
     knowledge_space_id: int = Form(...),   # ✅ 关键在这里
     file: UploadFile = File(...),
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
-    # 文件大小校验
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
+    ext = os.path.splitext(file.filename)[1]
+    tmp_path = os.path.join(UPLOAD_TMP_ROOT, f"{uuid.uuid4().hex}{ext}")
+
+    # 流式落盘：边收边写，超限立即中止，同时计算 sha256
+    try:
+        stored = await save_upload_stream(file, tmp_path, max_size=MAX_FILE_SIZE)
+    except UploadTooLargeError:
         raise HTTPException(status_code=400, detail="File too large (max 20MB)")
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to save file")
+
+    # 同一知识库内已有相同内容 → 直接复用（不再上传 / 解析）
+    def _find_duplicate(db):
+        existing = find_duplicate_document_service(
+            db,
+            knowledge_space_id=knowledge_space_id,
+            owner_id=user.id,
+            content_hash=stored.sha256,
+        )
+        if not existing:
+            return None
+        return {
+            "id": existing.id,
+            "filename": existing.filename,
+            "status": existing.status,
+            "created_at": existing.created_at,
+            "deduplicated": True,
+        }
 
-    # 构造存储路径
-    user_dir = os.path.join(UPLOAD_ROOT, f"user_{user.id}")
-    os.makedirs(user_dir, exist_ok=True)
+    try:
+        existing = await run_db(_find_duplicate)
+    except Exception as e:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=400, detail=str(e))
 
-    ext = os.path.splitext(file.filename)[1]
-    stored_filename = f"{uuid.uuid4().hex}{ext}"
-    storage_path = os.path.join(user_dir, stored_filename)
+    if existing:
+        os.remove(tmp_path)
+        return existing
 
+    # 移入内容寻址目录（跨知识库共享同一份本地文件）
     try:
-        with open(storage_path, "wb") as f:
-            f.write(contents)
+        storage_path = store_blob(tmp_path, stored.sha256, ext, BLOB_ROOT)
     except Exception:
+        os.remove(tmp_path)
         raise HTTPException(status_code=500, detail="Failed to save file")
 
-    db = SessionLocal()
+    # 建行 / 回写走 run_db 短事务，RAGFlow 上传走独立线程池（不占 DB 线程与连接）
     try:
-        doc = upload_document_service(
-            db,
+        doc = await upload_document_service(
             knowledge_space_id=knowledge_space_id,
             filename=file.filename,
             file_type=ext.lstrip("."),
             storage_uri=storage_path,
             uploaded_by=user.id,
+            content_hash=stored.sha256,
         )
-        return {
-            "id": doc.id,
-            "filename": doc.filename,
-            "status": doc.status,
-            "created_at": doc.created_at,
-        }
     except Exception as e:
-        os.remove(storage_path)  # 回滚文件
+        await run_db(release_local_file_service, storage_uri=storage_path)  # 无其他引用时回滚文件
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
+
+    return {
+        "id": doc["id"],
+        "filename": doc["filename"],
+        "status": doc["status"],
+        "created_at": doc["created_at"],
+        "deduplicated": False,
+    }
+
+
+@app.post("/api/documents/upload_batch")
+async def api_upload_documents_batch(
+    knowledge_space_id: int = Form(...),
+    files: list[UploadFile] = File(...),
+    user: UserSnapshot = Depends(get_current_user_from_header),
+):
+    """
+    批量上传：一次请求多个文件
+
+    - 每个文件流式落盘（超限的文件单独标记 rejected，不影响其他文件）
+    - 所有 documents 行一个事务创建，RAGFlow 分批上传
+    - 返回逐文件状态：indexed / failed / deduplicated / rejected
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {MAX_BATCH_FILES})")
+
+    results: list[dict | None] = [None] * len(files)
+    accepted: list[tuple[int, dict]] = []
+
+    # 1. 逐个流式落盘 + 计算哈希
+    for i, file in enumerate(files):
+        ext = os.path.splitext(file.filename)[1]
+        tmp_path = os.path.join(UPLOAD_TMP_ROOT, f"{uuid.uuid4().hex}{ext}")
+        try:
+            stored = await save_upload_stream(file, tmp_path, max_size=MAX_FILE_SIZE)
+            storage_path = store_blob(tmp_path, stored.sha256, ext, BLOB_ROOT)
+        except UploadTooLargeError:
+            results[i] = {"filename": file.filename, "status": "rejected", "id": None,
+                          "error": "File too large (max 20MB)"}
+            continue
+        except Exception:
+            results[i] = {"filename": file.filename, "status": "rejected", "id": None,
+                          "error": "Failed to save file"}
+            continue
+        accepted.append((i, {
+            "filename": file.filename,
+            "file_type": ext.lstrip("."),
+            "storage_uri": storage_path,
+            "content_hash": stored.sha256,
+        }))
+
+    # 2. 建行 + 分批上传 RAGFlow
+    if accepted:
+        try:
+            batch_results = await upload_documents_batch_service(
+                knowledge_space_id=knowledge_space_id,
+                uploaded_by=user.id,
+                files=[f for _, f in accepted],
+            )
+        except Exception as e:
+            for _, f in accepted:
+                await run_db(release_local_file_service, storage_uri=f["storage_uri"])
+            raise HTTPException(status_code=400, detail=str(e))
+
+        for (i, _), result in zip(accepted, batch_results):
+            results[i] = result
+
+    return {"items": results}
 
 
 @app.get("/api/documents")
 async def api_list_documents(
     knowledge_space_id: int,
     page: int = 1,
-    user: User = Depends(get_current_user_from_header),
+    cursor: int | None = None,
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
-    db = SessionLocal()
-    try:
-        check_parse_status_job(db,
-                               user_id=user.id,
-                               knowledge_space_id=knowledge_space_id)  # 检查解析状态
-        return list_documents_service(
-            db,
-            knowledge_space_id=knowledge_space_id,
-            page=page,
-        )
-    finally:
-        db.close()
+    # 解析状态由后台 ParseStatusSyncService 同步，这里只读 MySQL
+    return await run_db(
+        list_documents_service,
+        knowledge_space_id=knowledge_space_id,
+        page=page,
+        cursor=cursor,
+    )
+
+
 
 
 
 
+@app.get("/api/documents/stream")
+async def api_document_status_stream(
+    knowledge_space_id: int,
+    user: UserSnapshot = Depends(get_current_user_from_header),
+):
+    """
+    文档状态变更 SSE（document_status_changed）
+    """
+    ks = await run_db(
+        get_knowledge_space,
+        knowledge_space_id=knowledge_space_id,
+        owner_id=user.id,
+    )
+    if not ks:
+        raise HTTPException(status_code=404, detail="Knowledge space not found")
+
+    return StreamingResponse(
+        document_event_bus.stream({knowledge_space_id}),
+        media_type="text/event-stream",
+    )
 
 
 @app.put("/api/documents/{document_id}")
 async def api_rename_document(
     document_id: int,
     request: Request,
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
     body = await request.json()
-    db = SessionLocal()
-    try:
-        rename_document_service(
-            db,
-            document_id=document_id,
-            knowledge_space_id=body.get("knowledge_space_id"),
-            filename=body.get("filename"),
-        )
-        return {"status": "ok"}
-    finally:
-        db.close()
+    await run_db(
+        rename_document_service,
+        document_id=document_id,
+        knowledge_space_id=body.get("knowledge_space_id"),
+        filename=body.get("filename"),
+    )
+    return {"status": "ok"}
 
 
 @app.delete("/api/documents/{document_id}")
 async def api_delete_document(
     document_id: int,
     knowledge_space_id: int,
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
-    db = SessionLocal()
-    try:
-        delete_document_service(
-            db,
-            document_id=document_id,
-            knowledge_space_id=knowledge_space_id,
-        )
-        return {"status": "ok"}
-    finally:
-        db.close()
+    await run_db(
+        delete_document_service,
+        document_id=document_id,
+        knowledge_space_id=knowledge_space_id,
+    )
+    return {"status": "ok"}
 
 
 
@@ -486,7 +725,7 @@ async def api_delete_document(
 async def api_parse_document(
     document_id: int,
     knowledge_space_id: int,
-    user: User = Depends(get_current_user_from_header),
+    user: UserSnapshot = Depends(get_current_user_from_header),
 ):
     """
     触发文档解析（RAGFlow）
@@ -496,8 +735,7 @@ async def api_parse_document(
     - 不等待解析完成
     - 状态由 Service 层写入 parsing / failed
     """
-    db = SessionLocal()
-    try:
+    def _parse(db):
         # 1. 校验知识库归属（可选但推荐）
         ks = get_knowledge_space(
             db,
@@ -520,8 +758,7 @@ async def api_parse_document(
             "parse_status": updated_doc.status,
         }
 
-    finally:
-        db.close()
+    return await run_db(_parse)
 
 
 
@@ -1,34 +1,94 @@
 # db.py
-from sqlalchemy import create_engine
+from sqlalchemy import BigInteger, Integer, create_engine, event
+from sqlalchemy.exc import TimeoutError as SATimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+import asyncio
 import os
+import threading
+import time
+
+from core.metrics import REGISTRY, snapshot_families
+
+T = TypeVar("T")
 
 # DB_URL = os.getenv("DB_URL")
 
+# =========================
+# 后端选择
+# =========================
+# mysql  ：生产默认（需要 MYSQL_* 环境变量）
+# sqlite ：嵌入式单文件（WAL），用于 CI / 压测 / 单机部署，无需外部服务
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "cache/deepresearch.db")
+
+if DB_BACKEND == "mysql":
+    MYSQL_HOST = os.getenv("MYSQL_HOST")
+    MYSQL_PORT = os.getenv("MYSQL_PORT")
+    MYSQL_DB = os.getenv("MYSQL_DATABASE")
+    MYSQL_USER = os.getenv("DB_USER")        # 用户名你是放在 DB_USER 里的
+    MYSQL_PASSWORD = os.getenv("DB_PASSWORD")
 
-MYSQL_HOST = os.getenv("MYSQL_HOST")
-MYSQL_PORT = os.getenv("MYSQL_PORT")
-MYSQL_DB = os.getenv("MYSQL_DATABASE")
-MYSQL_USER = os.getenv("DB_USER")        # 用户名你是放在 DB_USER 里的
-MYSQL_PASSWORD = os.getenv("DB_PASSWORD")
+    if not all([MYSQL_HOST, MYSQL_PORT, MYSQL_DB, MYSQL_USER, MYSQL_PASSWORD]):
+        raise RuntimeError(
+            "MySQL environment variables are not fully set. "
+            "Expected MYSQL_HOST, MYSQL_PORT, MYSQL_DATABASE, DB_USER, DB_PASSWORD "
+            "(or set DB_BACKEND=sqlite)."
+        )
 
-if not all([MYSQL_HOST, MYSQL_PORT, MYSQL_DB, MYSQL_USER, MYSQL_PASSWORD]):
-    raise RuntimeError(
-        "MySQL environment variables are not fully set. "
-        "Expected MYSQL_HOST, MYSQL_PORT, MYSQL_DATABASE, DB_USER, DB_PASSWORD."
+    DB_URL = (
+        f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
+        f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
     )
+elif DB_BACKEND == "sqlite":
+    if SQLITE_PATH != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(SQLITE_PATH)), exist_ok=True)
+    DB_URL = f"sqlite:///{SQLITE_PATH}"
+else:
+    raise RuntimeError(f"Unsupported DB_BACKEND: {DB_BACKEND} (expected mysql / sqlite)")
 
-DB_URL = (
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
-    f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
-)
+# 主键类型：MySQL 用 BIGINT；SQLite 只有 INTEGER PRIMARY KEY 才是自增 rowid
+BigIntPK = BigInteger().with_variant(Integer, "sqlite")
 
 
 
-engine = create_engine(
-    DB_URL,
-    pool_pre_ping=True,
-)
+# =========================
+# 连接池配置
+# =========================
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))     # 等待空闲连接的秒数
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))     # 早于 MySQL wait_timeout 回收连接
+
+
+if DB_BACKEND == "sqlite":
+    engine = create_engine(
+        DB_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        # 连接会在 run_db 线程池的不同线程间复用
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, conn_record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")      # 读写并发：读不阻塞写
+        cur.execute("PRAGMA synchronous=NORMAL")    # WAL 下足够安全，写入快很多
+        cur.execute("PRAGMA foreign_keys=ON")       # 与 MySQL 一致的外键 / 级联行为
+        cur.execute("PRAGMA busy_timeout=30000")
+        cur.close()
+else:
+    engine = create_engine(
+        DB_URL,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -37,3 +97,140 @@ SessionLocal = sessionmaker(
 )
 
 Base = declarative_base()
+
+
+def init_db() -> None:
+    """
+    建表（schema bootstrap）：按 ORM 模型创建缺失的表 / 索引，已有表不改动。
+    - sqlite：应用启动时自动执行
+    - mysql ：默认不执行（新库导入 deepresearch.sql，已有库执行 python -m interface_DB.migrate），
+      DB_AUTO_CREATE=1 时执行
+    """
+    # 导入所有模型，确保注册到 Base.metadata
+    import interface_DB.MySQL_user  # noqa: F401
+    import interface_DB.MySQL_knowledge_space  # noqa: F401
+    import interface_DB.MySQL_knowledge_space_permission  # noqa: F401
+    import interface_DB.MySQL_document  # noqa: F401
+    import interface_DB.MySQL_document_stats  # noqa: F401
+
+    Base.metadata.create_all(engine)
+
+
+def should_auto_create_schema() -> bool:
+    return DB_BACKEND == "sqlite" or os.getenv("DB_AUTO_CREATE", "0") == "1"
+
+
+# =========================
+# 连接池指标（checkout / checkin 事件）
+# =========================
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    "checkouts": 0,
+    "checked_out": 0,
+    "peak_checked_out": 0,
+    "checkout_timeouts": 0,
+    "hold_seconds_total": 0.0,
+    "hold_seconds_max": 0.0,
+}
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+    conn_record.info["checkout_at"] = time.monotonic()
+    with _pool_stats_lock:
+        _pool_stats["checkouts"] += 1
+        _pool_stats["checked_out"] += 1
+        _pool_stats["peak_checked_out"] = max(_pool_stats["peak_checked_out"], _pool_stats["checked_out"])
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_conn, conn_record):
+    started = conn_record.info.pop("checkout_at", None)
+    if started is None:
+        return
+    held = time.monotonic() - started
+    with _pool_stats_lock:
+        _pool_stats["checked_out"] -= 1
+        _pool_stats["hold_seconds_total"] += held
+        _pool_stats["hold_seconds_max"] = max(_pool_stats["hold_seconds_max"], held)
+
+
+# =========================
+# 异步接口的 DB 访问：线程池卸载
+# =========================
+# 同步 SQLAlchemy / pymysql 会阻塞事件循环；async 接口统一经 run_db 在独立线程池执行。
+# 线程数与连接池上限一致，多出的请求在线程池排队而不是在连接池超时。
+_db_executor = ThreadPoolExecutor(
+    max_workers=DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    thread_name_prefix="db",
+)
+DB_QUEUE_WAIT_SECONDS = REGISTRY.histogram("db_queue_wait_seconds", "run_db wait for a DB worker thread")
+DB_RUN_SECONDS = REGISTRY.histogram("db_run_seconds", "run_db execution time (session open to close)")
+DB_IN_FLIGHT = REGISTRY.gauge("db_run_in_flight", "run_db calls submitted and not yet finished")
+_run_stats = {
+    "calls": 0,
+    "errors": 0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+    "run_seconds_total": 0.0,
+    "run_seconds_max": 0.0,
+}
+
+
+async def run_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    在 DB 线程池中执行 fn(db, *args, **kwargs)，自动创建 / 关闭 Session。
+
+    ⚠️ fn 内完成 ORM 对象到 dict 的转换：Session 关闭后（commit 过的）对象属性不可再访问。
+    """
+    submitted = time.monotonic()
+
+    def _job():
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        except SATimeoutError:
+            with _pool_stats_lock:
+                _pool_stats["checkout_timeouts"] += 1
+            raise
+        finally:
+            db.close()
+            finished = time.monotonic()
+            with _pool_stats_lock:
+                _run_stats["calls"] += 1
+                _run_stats["queue_wait_seconds_total"] += started - submitted
+                _run_stats["queue_wait_seconds_max"] = max(_run_stats["queue_wait_seconds_max"], started - submitted)
+                _run_stats["run_seconds_total"] += finished - started
+                _run_stats["run_seconds_max"] = max(_run_stats["run_seconds_max"], finished - started)
+            DB_QUEUE_WAIT_SECONDS.observe(started - submitted)
+            DB_RUN_SECONDS.observe(finished - started)
+
+    loop = asyncio.get_running_loop()
+    DB_IN_FLIGHT.inc()
+    try:
+        return await loop.run_in_executor(_db_executor, _job)
+    except Exception:
+        with _pool_stats_lock:
+            _run_stats["errors"] += 1
+        raise
+    finally:
+        DB_IN_FLIGHT.dec()
+
+
+def db_pool_snapshot() -> dict:
+    """连接池与 run_db 指标快照（供监控 / 调试）"""
+    with _pool_stats_lock:
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_status": engine.pool.status(),
+            **_pool_stats,
+            **{f"run_db_{k}": v for k, v in _run_stats.items()},
+        }
+
+
+REGISTRY.register_collector(
+    "db_pool",
+    lambda: snapshot_families("db_pool", db_pool_snapshot(), "DB connection pool / run_db snapshot"),
+)
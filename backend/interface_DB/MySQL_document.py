@@ -7,15 +7,25 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Text,
+    Index,
 )
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
-from interface_DB.MySQL_db import Base
+from interface_DB.MySQL_db import Base, BigIntPK
 
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # 上传去重：同一知识库内按内容哈希查找
+        Index("ix_documents_space_hash", "knowledge_space_id", "content_hash"),
+        # 解析状态同步：按 status（+ 知识库）过滤
+        Index("ix_documents_status_space", "status", "knowledge_space_id"),
+        # 文档列表 keyset 分页：WHERE knowledge_space_id = ? AND id < ? ORDER BY id DESC
+        Index("ix_documents_space_id", "knowledge_space_id", "id"),
+    )
 
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntPK, primary_key=True, index=True)
 
     knowledge_space_id = Column(
         BigInteger,
@@ -73,4 +83,25 @@ class Document(Base):
         String(64),  # 匹配数据库中 VARCHAR(64) 的定义
         nullable=True,  # 初始为空，上传后赋值
         index=True,  # 可选：添加索引，方便查询
-    )
\ No newline at end of file
+    )
+
+    # 文件内容 sha256（hex），上传时流式计算，用于去重
+    # 新库见 deepresearch.sql；已有库执行 python -m interface_DB.migrate（含上方索引）
+    content_hash = Column(
+        String(64),
+        nullable=True,
+    )
+
+    # 入库摘要（解析完成后后台生成，见 doc_summary.py）
+    # summary_hash 记录生成摘要时的 content_hash，内容不变则不重复生成
+    # deferred：文档列表等查询不加载长文本
+    # 已有库执行 python -m interface_DB.migrate
+    summary = deferred(Column(
+        Text,
+        nullable=True,
+    ))
+
+    summary_hash = Column(
+        String(64),
+        nullable=True,
+    )
@@ -1,6 +1,8 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 from interface_DB.MySQL_document import Document
+# 导入即注册计数维护事件
+from interface_DB.MySQL_document_stats import get_status_counts
 
 # =========================
 # 常量定义
@@ -21,6 +23,7 @@ def create_document(
     storage_uri: str,
     uploaded_by: int | None,
     status: str = "uploaded",
+    content_hash: str | None = None,
 ) -> Document:
     """
     创建文档记录（上传完成后立即调用）
@@ -32,6 +35,7 @@ def create_document(
         storage_uri=storage_uri,
         uploaded_by=uploaded_by,
         status="uploaded",
+        content_hash=content_hash,
     )
     db.add(doc)
     db.commit()
@@ -39,6 +43,24 @@ def create_document(
     return doc
 
 
+def create_documents_bulk(
+    db: Session,
+    *,
+    rows: list[dict],
+) -> list[Document]:
+    """
+    批量创建文档记录（一个事务、一次提交）
+    - rows: 每项为 Document 字段字典（knowledge_space_id / filename / ...）
+    - 返回顺序与 rows 一致
+    """
+    docs = [Document(status="uploaded", **row) for row in rows]
+    db.add_all(docs)
+    db.commit()
+    for doc in docs:
+        db.refresh(doc)
+    return docs
+
+
 # =========================
 # Read - list (分页)
 # =========================
@@ -47,24 +69,28 @@ def list_documents(
     *,
     knowledge_space_id: int,
     page: int = 1,
+    cursor: int | None = None,
+    limit: int = PAGE_SIZE,
 ) -> list[Document]:
     """
-    按知识库分页查询文档
-    - page 从 1 开始
-    - 每页 20 条
+    按知识库分页查询文档（按 id 倒序，即最新上传在前）
+    - cursor：上一页最后一条的 id（keyset 分页，走 (knowledge_space_id, id) 索引，
+      翻到多深都是常数代价）
+    - 未给 cursor 时兼容旧的 page（从 1 开始，OFFSET 分页）
     """
-    if page < 1:
-        page = 1
-
-    offset = (page - 1) * PAGE_SIZE
-
-    return db.scalars(
+    query = (
         select(Document)
         .where(Document.knowledge_space_id == knowledge_space_id)
-        .order_by(Document.created_at.desc())
-        .offset(offset)
-        .limit(PAGE_SIZE)
-    ).all()
+        .order_by(Document.id.desc())
+        .limit(limit)
+    )
+
+    if cursor is not None:
+        return db.scalars(query.where(Document.id < cursor)).all()
+
+    if page < 1:
+        page = 1
+    return db.scalars(query.offset((page - 1) * limit)).all()
 
 
 # =========================
@@ -77,12 +103,9 @@ def count_documents(
 ) -> int:
     """
     返回知识库下的文档总数
-    （用于前端分页）
+    （用于前端分页；读增量维护的计数表，该知识库无计数记录时退回 COUNT）
     """
-    return db.scalar(
-        select(func.count())
-        .where(Document.knowledge_space_id == knowledge_space_id)
-    )
+    return sum(get_status_counts(db, knowledge_space_id=knowledge_space_id).values())
 
 
 # =========================
@@ -104,6 +127,49 @@ def get_document(
         )
     )
 
+
+# =========================
+# Read - 按内容哈希（上传去重）
+# =========================
+def get_document_by_hash(
+    db: Session,
+    *,
+    knowledge_space_id: int,
+    content_hash: str,
+) -> Document | None:
+    """
+    查询同一知识库下内容相同、且未失败的文档（最新一条）
+    """
+    return db.scalar(
+        select(Document)
+        .where(
+            Document.knowledge_space_id == knowledge_space_id,
+            Document.content_hash == content_hash,
+            Document.status != "failed",
+        )
+        .order_by(Document.id.desc())
+        .limit(1)
+    )
+
+
+def count_documents_by_storage_uri(
+    db: Session,
+    *,
+    storage_uri: str,
+) -> int:
+    """
+    统计仍引用某个本地文件的（未失败）文档数
+    （本地文件按内容寻址、跨知识库共享，删除前需确认无引用）
+    """
+    return db.scalar(
+        select(func.count())
+        .select_from(Document)
+        .where(
+            Document.storage_uri == storage_uri,
+            Document.status != "failed",
+        )
+    )
+
 from typing import Optional
 # =========================
 # 状态白名单（唯一真源）
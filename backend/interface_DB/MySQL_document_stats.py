@@ -0,0 +1,185 @@
+# models/document_stats.py
+"""
+每个知识库按状态的文档计数（增量维护）
+
+- 文档列表的 total / 各状态数量直接读这张小表，不再 COUNT(*) 扫描 documents
+- ORM 层的新增 / 删除 / 状态变更由 Session after_flush 事件自动维护（同一事务）
+- 绕过 ORM 的批量 UPDATE 需调用 apply_status_deltas() 手动维护
+- 已有库由 python -m interface_DB.migrate 建表并回填（rebuild_document_stats）；
+  计数表中没有某知识库的记录时，读取退回 documents 上的 GROUP BY 统计
+"""
+
+from collections import Counter
+
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    Integer,
+    String,
+    ForeignKey,
+    event,
+    inspect,
+    select,
+    delete,
+    func,
+    insert,
+    update,
+)
+from sqlalchemy.orm import Session
+
+from interface_DB.MySQL_db import Base
+from interface_DB.MySQL_document import Document
+
+
+class KnowledgeSpaceDocumentStats(Base):
+    __tablename__ = "knowledge_space_document_stats"
+
+    knowledge_space_id = Column(
+        BigInteger,
+        ForeignKey("knowledge_spaces.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    status = Column(
+        String(32),
+        primary_key=True,
+    )
+
+    count = Column(
+        Integer,
+        nullable=False,
+        default=0,
+    )
+
+
+# =========================
+# 计数增量写入（按方言 UPSERT）
+# =========================
+def _upsert_stmt(dialect_name: str, rows: list[dict]):
+    """MySQL / SQLite 的单语句 UPSERT；其他方言返回 None（走 UPDATE + INSERT）"""
+    table = KnowledgeSpaceDocumentStats.__table__
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted["count"])
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=["knowledge_space_id", "status"],
+            set_={"count": table.c.count + stmt.excluded["count"]},
+        )
+    return None
+
+
+def _update_then_insert(connection, rows: list[dict]) -> None:
+    """通用写法：逐行 UPDATE，没有命中行时 INSERT"""
+    table = KnowledgeSpaceDocumentStats.__table__
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(
+                table.c.knowledge_space_id == row["knowledge_space_id"],
+                table.c.status == row["status"],
+            )
+            .values(count=table.c.count + row["count"])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+
+def apply_status_deltas(connection, deltas: Counter) -> None:
+    """
+    deltas: Counter({(knowledge_space_id, status): +n / -n})
+    """
+    rows = [
+        {"knowledge_space_id": ks_id, "status": status, "count": n}
+        for (ks_id, status), n in deltas.items()
+        if n
+    ]
+    if not rows:
+        return
+    stmt = _upsert_stmt(connection.dialect.name, rows)
+    if stmt is None:
+        _update_then_insert(connection, rows)
+    else:
+        connection.execute(stmt)
+
+
+@event.listens_for(Document.status, "set", active_history=True)
+def _load_previous_status(target, value, oldvalue, initiator):
+    """
+    active_history：对已过期（commit 后）的实例赋值 status 时先加载旧值，
+    否则属性历史中没有旧状态，计数只加不减
+    """
+
+
+@event.listens_for(Session, "after_flush")
+def _track_document_counts(session: Session, flush_context) -> None:
+    """
+    after_flush 时 new / dirty / deleted 仍是 flush 前的状态，属性历史也还在
+    """
+    deltas: Counter = Counter()
+
+    for obj in session.new:
+        if isinstance(obj, Document):
+            deltas[(obj.knowledge_space_id, obj.status or "uploaded")] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Document):
+            deltas[(obj.knowledge_space_id, obj.status)] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Document) or obj in session.deleted:
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old == new:
+            continue
+        if old is not None:
+            deltas[(obj.knowledge_space_id, old)] -= 1
+        if new is not None:
+            deltas[(obj.knowledge_space_id, new)] += 1
+
+    apply_status_deltas(session.connection(), deltas)
+
+
+# =========================
+# 读取 / 回填
+# =========================
+def get_status_counts(db: Session, *, knowledge_space_id: int) -> dict[str, int]:
+    rows = db.execute(
+        select(KnowledgeSpaceDocumentStats.status, KnowledgeSpaceDocumentStats.count)
+        .where(KnowledgeSpaceDocumentStats.knowledge_space_id == knowledge_space_id)
+    ).all()
+    if not rows:
+        # 该知识库从未计数（升级前的数据未回填 / 新建的空知识库）：直接统计 documents
+        # 只读不回填，避免并发读取重复写入计数
+        rows = db.execute(
+            select(Document.status, func.count())
+            .where(Document.knowledge_space_id == knowledge_space_id)
+            .group_by(Document.status)
+        ).all()
+    return {status: count for status, count in rows if count}
+
+
+def rebuild_document_stats(db: Session, *, knowledge_space_id: int | None = None) -> None:
+    """
+    按 documents 表重算计数（迁移回填 / 计数漂移时修复）
+    """
+    clear = delete(KnowledgeSpaceDocumentStats)
+    query = (
+        select(Document.knowledge_space_id, Document.status, func.count())
+        .group_by(Document.knowledge_space_id, Document.status)
+    )
+    if knowledge_space_id is not None:
+        clear = clear.where(KnowledgeSpaceDocumentStats.knowledge_space_id == knowledge_space_id)
+        query = query.where(Document.knowledge_space_id == knowledge_space_id)
+
+    db.execute(clear)
+    deltas = Counter({(ks_id, status): n for ks_id, status, n in db.execute(query).all()})
+    apply_status_deltas(db.connection(), deltas)
+    db.commit()
@@ -32,7 +32,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.sql import func
 
-from interface_DB.MySQL_db import Base
+from interface_DB.MySQL_db import Base, BigIntPK
 
 
 class KnowledgeSpace(Base):
@@ -41,7 +41,7 @@ class KnowledgeSpace(Base):
     # -----------------------------
     # 主键与基础信息
     # -----------------------------
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntPK, primary_key=True, index=True)
     name = Column(String(128), nullable=False)
     description = Column(Text)
 
@@ -0,0 +1,47 @@
+# models/knowledge_space_permission.py
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    Enum,
+    DateTime,
+    ForeignKey,
+    UniqueConstraint,
+)
+from sqlalchemy.sql import func
+
+from interface_DB.MySQL_db import Base, BigIntPK
+
+
+class KnowledgeSpacePermission(Base):
+    """
+    知识库共享授权（对应 deepresearch.sql 中的 knowledge_space_permissions 表）
+    """
+    __tablename__ = "knowledge_space_permissions"
+    __table_args__ = (
+        UniqueConstraint("knowledge_space_id", "user_id", name="knowledge_space_id"),
+    )
+
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+
+    knowledge_space_id = Column(
+        BigInteger,
+        ForeignKey("knowledge_spaces.id"),
+        nullable=False,
+    )
+
+    user_id = Column(
+        BigInteger,
+        ForeignKey("users.id"),
+        nullable=False,
+        index=True,
+    )
+
+    permission = Column(
+        Enum("read", "write", "admin"),
+        nullable=False,
+    )
+
+    created_at = Column(
+        DateTime,
+        server_default=func.now(),
+    )
@@ -1,12 +1,12 @@
 # interface_DB/models/user.py
 from sqlalchemy import Column, BigInteger, String, Enum, DateTime
 from sqlalchemy.sql import func
-from interface_DB.MySQL_db import Base
+from interface_DB.MySQL_db import Base, BigIntPK
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     username = Column(String(64), unique=True, nullable=False)
     email = Column(String(128), nullable=True)
     password_hash = Column(String(255), nullable=False)
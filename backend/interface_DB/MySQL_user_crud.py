@@ -250,8 +250,10 @@ from passlib.context import CryptContext
 from jose import jwt, JWTError
 
 # ===== 项目内 DB / ORM =====
-from interface_DB.MySQL_db import SessionLocal
+from interface_DB.MySQL_db import SessionLocal, run_db
+from interface_DB.auth_guard import LoginThrottle, PasswordHasher
 from interface_DB.MySQL_user import User
+from interface_DB.user_cache import UserSnapshot, UserSnapshotCache
 
 # -------------------------------------------------
 # 1. 环境变量
@@ -261,6 +263,9 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_MINUTES = 60 * 24   # 1 天
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))  # 秒；用户快照缓存时长
+
+user_cache = UserSnapshotCache(ttl=AUTH_CACHE_TTL)
 
 
 # -------------------------------------------------
@@ -280,6 +285,23 @@ def verify_password(plain_password: str, password_hash: str) -> bool:
     return pwd_context.verify(plain_password, password_hash)
 
 
+# bcrypt 每次 ~100–300ms CPU：异步接口经有界线程池执行，不阻塞事件循环
+password_hasher = PasswordHasher(
+    hash_password,
+    verify_password,
+    max_workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+    max_pending=int(os.getenv("AUTH_HASH_MAX_PENDING", "64")),
+)
+
+# 登录失败限流（按用户名 / IP）
+login_throttle = LoginThrottle(
+    max_failures_per_user=int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5")),
+    max_failures_per_ip=int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20")),
+    window=float(os.getenv("LOGIN_FAILURE_WINDOW", "300")),
+    lockout=float(os.getenv("LOGIN_LOCKOUT_SECONDS", "300")),
+)
+
+
 # -------------------------------------------------
 # 3. Token 工具（JWT）
 # -------------------------------------------------
@@ -296,20 +318,27 @@ def create_token(user_id: int) -> str:
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_user_id_from_token(token: str) -> int:
+def decode_token(token: str) -> tuple[int, float]:
     """
-    后端验证 token 并解析 user_id
+    仅验签 + 过期校验（不查库），返回 (user_id, exp 时间戳)
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if not user_id:
             raise ValueError("Invalid token payload")
-        return int(user_id)
-    except JWTError:
+        return int(user_id), float(payload["exp"])
+    except (JWTError, KeyError):
         raise ValueError("Invalid token")
 
 
+def get_user_id_from_token(token: str) -> int:
+    """
+    后端验证 token 并解析 user_id
+    """
+    return decode_token(token)[0]
+
+
 # -------------------------------------------------
 # 4. 注册逻辑
 # -------------------------------------------------
@@ -382,24 +411,134 @@ def login_user(username: str, password: str) -> dict:
 
 
 # -------------------------------------------------
-# 6. 基于 token 获取当前用户（后端用）
+# 5.1 异步版本（供 FastAPI 接口使用）
 # -------------------------------------------------
-def get_current_user(token: str) -> User:
+async def register_user_async(username: str, email: str, password: str) -> dict:
     """
-    后端使用：
-    从 token 中解析 user_id 并查询数据库
+    注册用户（异步）：DB 走 run_db，bcrypt 走 password_hasher
+    """
+    def _exists(db):
+        return db.query(User.id).filter(User.username == username).first() is not None
+
+    if await run_db(_exists):
+        raise ValueError("Username already exists")
+
+    password_hash = await password_hasher.hash(password)
+
+    def _create(db):
+        user = User(
+            username=username,
+            email=email,
+            password_hash=password_hash,
+            role="user",        # 强制 user
+            status="active"
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email
+        }
+
+    return await run_db(_create)
+
+
+async def login_user_async(username: str, password: str, client_ip: str | None = None) -> dict:
+    """
+    登录校验（异步）：
+    - 先查限流（锁定中直接拒绝，不查库、不做 bcrypt）
+    - DB 走 run_db，bcrypt 走 password_hasher
+    - 失败计入限流，成功清空用户名的失败记录
     """
-    user_id = get_user_id_from_token(token)
+    login_throttle.check(username, client_ip)
+
+    def _load(db):
+        user = db.query(User).filter(User.username == username).first()
+        if not user:
+            return None
+        return {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "status": user.status,
+            "password_hash": user.password_hash,
+        }
 
+    user = await run_db(_load)
+    if not user or not await password_hasher.verify(password, user["password_hash"]):
+        login_throttle.record_failure(username, client_ip)
+        raise ValueError("Invalid username or password")
+
+    if user["status"] != "active":
+        raise ValueError("User is disabled")
+
+    login_throttle.record_success(username)
+    return {
+        "token": create_token(user["id"]),
+        "user": {
+            "id": user["id"],
+            "username": user["username"],
+            "email": user["email"]
+        }
+    }
+
+
+# -------------------------------------------------
+# 6. 基于 token 获取当前用户（后端用）
+# -------------------------------------------------
+def _load_user_snapshot(user_id: int) -> UserSnapshot:
     db = SessionLocal()
     try:
         user = db.query(User).filter(User.id == user_id).first()
         if not user or user.status != "active":
             raise ValueError("Invalid user")
-        return user
+        return UserSnapshot(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            status=user.status,
+        )
+    finally:
+        db.close()
+
+
+def get_current_user(token: str) -> UserSnapshot:
+    """
+    后端使用：
+    从 token 中解析 user_id，返回用户快照
+
+    - 已验证过的 token、近期查过的用户走进程内缓存（TTL = AUTH_CACHE_TTL）
+    - 缓存未命中时才查询数据库
+    """
+    return user_cache.resolve(
+        token,
+        decode=decode_token,
+        load=_load_user_snapshot,
+    )
+
+
+def set_user_status(user_id: int, status: str) -> None:
+    """
+    启用 / 禁用用户；禁用后立即清除该用户的认证缓存
+    """
+    if status not in ("active", "disabled"):
+        raise ValueError(f"Invalid user status: {status}")
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise ValueError("User not found")
+        user.status = status
+        db.commit()
     finally:
         db.close()
 
+    user_cache.invalidate_user(user_id)
+
 
 # -------------------------------------------------
 # 7. 本地测试（可选）
@@ -0,0 +1,215 @@
+"""
+认证相关的 CPU 保护：
+
+- PasswordHasher：bcrypt hash / verify 放到独立的有界线程池，
+  并发上限 + 排队上限，不阻塞事件循环，也不会被突发登录占满 CPU
+- LoginThrottle：按用户名 / IP 的失败次数滑动窗口限流，
+  命中后在锁定期内直接拒绝（不查库、不做 bcrypt）
+- resolve_client_ip：负载均衡 / 反向代理后，从可信代理追加的 X-Forwarded-For 取真实客户端 IP
+- ❗不涉及 FastAPI / HTTP；不依赖具体哈希库（由调用方注入 hash / verify 函数）
+"""
+
+import asyncio
+import ipaddress
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Union
+
+
+class HashPoolBusyError(RuntimeError):
+    """哈希线程池排队已满"""
+
+
+class LoginThrottledError(ValueError):
+    """登录失败次数过多，暂时锁定"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many failed login attempts, please retry later")
+        self.retry_after = retry_after
+
+
+# =========================
+# 有界哈希线程池
+# =========================
+class PasswordHasher:
+    def __init__(
+        self,
+        hash_fn: Callable[[str], str],
+        verify_fn: Callable[[str, str], bool],
+        *,
+        max_workers: int = 2,
+        max_pending: int = 64,
+    ):
+        self._hash_fn = hash_fn
+        self._verify_fn = verify_fn
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pwd-hash")
+        # 执行中 + 排队中的任务总数上限
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "hash_calls": 0,
+            "verify_calls": 0,
+            "rejected": 0,
+            "queue_wait_seconds_total": 0.0,
+            "cpu_seconds_total": 0.0,
+            "cpu_seconds_max": 0.0,
+        }
+
+    def _timed(self, fn: Callable, args: tuple, submitted: float, kind: str):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.monotonic()
+            with self._stats_lock:
+                self.stats[f"{kind}_calls"] += 1
+                self.stats["queue_wait_seconds_total"] += started - submitted
+                self.stats["cpu_seconds_total"] += finished - started
+                self.stats["cpu_seconds_max"] = max(self.stats["cpu_seconds_max"], finished - started)
+            self._slots.release()
+
+    async def _submit(self, fn: Callable, args: tuple, kind: str):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.stats["rejected"] += 1
+            raise HashPoolBusyError("Password hashing is busy, please retry later")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._timed, fn, args, time.monotonic(), kind,
+        )
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self._hash_fn, (password,), "hash")
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._submit(self._verify_fn, (password, password_hash), "verify")
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats)
+
+
+# =========================
+# 登录限流
+# =========================
+class LoginThrottle:
+    """
+    - 同一用户名 window 秒内失败 max_failures_per_user 次 → 锁定 lockout 秒
+    - 同一 IP 阈值更高（NAT 后多人共用出口）
+    - 登录成功清空该用户名的失败记录
+    """
+
+    def __init__(
+        self,
+        *,
+        max_failures_per_user: int = 5,
+        max_failures_per_ip: int = 20,
+        window: float = 300.0,
+        lockout: float = 300.0,
+        max_keys: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limits = {"user": max_failures_per_user, "ip": max_failures_per_ip}
+        self.window = window
+        self.lockout = lockout
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures: dict[str, deque] = {}
+        self._locked_until: dict[str, float] = {}
+        self.stats = {"throttled": 0, "lockouts": 0}
+
+    @staticmethod
+    def _keys(username: Optional[str], ip: Optional[str]) -> list[tuple[str, str]]:
+        keys = []
+        if username:
+            keys.append(("user", f"user:{username.lower()}"))
+        if ip:
+            keys.append(("ip", f"ip:{ip}"))
+        return keys
+
+    def check(self, username: Optional[str], ip: Optional[str]) -> None:
+        """锁定中则抛出 LoginThrottledError"""
+        now = self._clock()
+        with self._lock:
+            retry_after = 0.0
+            for _, key in self._keys(username, ip):
+                until = self._locked_until.get(key)
+                if until is None:
+                    continue
+                if until <= now:
+                    del self._locked_until[key]
+                    continue
+                retry_after = max(retry_after, until - now)
+            if retry_after:
+                self.stats["throttled"] += 1
+                raise LoginThrottledError(retry_after)
+
+    def record_failure(self, username: Optional[str], ip: Optional[str]) -> None:
+        now = self._clock()
+        with self._lock:
+            if len(self._failures) > self.max_keys:
+                self._prune(now)
+            for kind, key in self._keys(username, ip):
+                failures = self._failures.setdefault(key, deque())
+                failures.append(now)
+                while failures and failures[0] <= now - self.window:
+                    failures.popleft()
+                if len(failures) >= self.limits[kind]:
+                    self._locked_until[key] = now + self.lockout
+                    failures.clear()
+                    self.stats["lockouts"] += 1
+
+    def record_success(self, username: Optional[str]) -> None:
+        if not username:
+            return
+        with self._lock:
+            self._failures.pop(f"user:{username.lower()}", None)
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, f in self._failures.items() if not f or f[-1] <= now - self.window]:
+            del self._failures[key]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "locked_keys": len(self._locked_until)}
+
+
+# =========================
+# 客户端 IP（反向代理后）
+# =========================
+ProxyNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_trusted_proxies(spec: str) -> List[ProxyNetwork]:
+    """逗号分隔的 IP / CIDR（如 "10.0.0.0/8,127.0.0.1"）；空串表示不信任任何代理"""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in (spec or "").split(",") if part.strip()]
+
+
+def _is_trusted(ip: str, trusted: List[ProxyNetwork]) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in trusted)
+
+
+def resolve_client_ip(
+    peer: Optional[str],
+    forwarded_for: Optional[str],
+    trusted: List[ProxyNetwork],
+) -> Optional[str]:
+    """
+    - 直连地址 peer 不是可信代理：X-Forwarded-For 可被客户端伪造，直接用 peer
+    - peer 是可信代理：从 X-Forwarded-For 右往左跳过可信代理，第一个非代理地址即客户端
+      （最左侧的值由客户端自报，不可信，只在整条链都是代理时使用）
+    """
+    if not peer or not forwarded_for or not _is_trusted(peer, trusted):
+        return peer
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted):
+            return hop
+    return hops[0] if hops else peer
@@ -0,0 +1,288 @@
+"""
+入库摘要：解析完成后在后台为每篇文档生成摘要，随 Document 持久化
+
+职责说明：
+- parse_status_sync 检测到文档 parsed 并写入本地全文缓存后调用 submit(document_id)
+- 有界线程池 + 排队上限，不占用研究会话的关键路径
+- 按 content_hash 幂等：已有摘要且内容未变则跳过；其他文档已为同一内容生成过摘要则直接复用
+- Step 3 / Step 4 意图扩展通过 get_summaries_for_datasets 读取已缓存的摘要（一次 DB 查询）
+- ❗不涉及 FastAPI / HTTP / token
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from core.doc_text_store import DocTextStore
+from interface_DB.MySQL_db import SessionLocal
+from interface_DB.MySQL_document import Document
+from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+
+# =========================
+# 常量定义
+# =========================
+DOC_SUMMARY_WORKERS = int(os.getenv("DOC_SUMMARY_WORKERS", "2"))
+DOC_SUMMARY_MAX_PENDING = int(os.getenv("DOC_SUMMARY_MAX_PENDING", "256"))
+# 送入 LLM 的正文上限（按文档顺序截取开头部分：标题 / 摘要 / 目录 / 引言）
+DOC_SUMMARY_INPUT_CHARS = int(os.getenv("DOC_SUMMARY_INPUT_CHARS", "6000"))
+# 注入 Step 3 / Step 4 prompt 的摘要总长上限
+DOC_SUMMARY_PROMPT_CHARS = 3000
+
+
+SYSTEM_DOC_SUMMARIZER = """
+你是“文献摘要器（Document Summarizer）”。
+
+你的任务：
+- 基于给定的文档正文片段，概括该文档的研究主题、研究对象、方法与主要内容
+- 摘要用于指导后续检索问题的生成，应尽量使用文档中的专业术语
+
+必须遵守的硬规则：
+1. 只能使用正文中出现的信息，不得补充外部知识
+2. 摘要 100–200 字，客观描述，不做评价
+3. 输出严格 JSON
+""".strip()
+
+
+USER_DOC_SUMMARIZER = """
+【文件名】
+{filename}
+
+【正文片段】
+{text}
+
+请严格使用以下 JSON 格式输出：
+{{
+  "summary": str,
+  "keywords": [str, str, str]
+}}
+""".strip()
+
+
+DOC_SUMMARY_SCHEMA = {
+    "summary": str,
+    "keywords": list,
+}
+
+
+def read_document_head(store: DocTextStore, ragflow_document_id: str, max_chars: int) -> str:
+    """按文档顺序读取开头若干 chunk，总长不超过 max_chars"""
+    doc = store.get(ragflow_document_id)
+    if doc is None:
+        return ""
+    parts = []
+    used = 0
+    for i in range(len(doc)):
+        text = doc.chunk(i).strip()
+        if not text:
+            continue
+        if used + len(text) > max_chars:
+            parts.append(text[: max_chars - used])
+            break
+        parts.append(text)
+        used += len(text)
+    return "\n".join(parts)
+
+
+def format_summary(result: Dict) -> str:
+    summary = str(result.get("summary", "")).strip()
+    keywords = [str(k).strip() for k in result.get("keywords", []) if str(k).strip()]
+    if keywords:
+        summary += f"\n关键词：{'、'.join(keywords)}"
+    return summary
+
+
+class DocumentSummarizer:
+    """
+    用法：
+        summarizer = DocumentSummarizer(gateway_factory=build_qwen_gateway_from_env, text_store=store)
+        summarizer.submit(document_id)   # 任意线程调用，立即返回
+
+    gateway_factory 在首次生成摘要时才调用（未配置 LLM 的环境不影响启动）。
+    """
+
+    def __init__(
+        self,
+        *,
+        gateway_factory: Callable,
+        text_store: DocTextStore,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_workers: int = DOC_SUMMARY_WORKERS,
+        max_pending: int = DOC_SUMMARY_MAX_PENDING,
+        input_chars: int = DOC_SUMMARY_INPUT_CHARS,
+    ):
+        self.gateway_factory = gateway_factory
+        self.text_store = text_store
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.input_chars = input_chars
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="doc-summary")
+        self._gateway = None
+        self._lock = threading.Lock()
+        self._pending: set[int] = set()
+        self.stats = {
+            "submitted": 0,
+            "generated": 0,
+            "reused": 0,
+            "skipped": 0,
+            "dropped": 0,
+            "errors": 0,
+        }
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "pending": len(self._pending)}
+
+    def submit(self, document_id: int) -> bool:
+        """排队生成摘要；同一文档已在队列中 / 队列已满时返回 False"""
+        with self._lock:
+            if document_id in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            self._pending.add(document_id)
+            self.stats["submitted"] += 1
+        self._executor.submit(self._run, document_id)
+        return True
+
+    def _get_gateway(self):
+        with self._lock:
+            if self._gateway is None:
+                self._gateway = self.gateway_factory()
+            return self._gateway
+
+    def _run(self, document_id: int) -> None:
+        try:
+            self.summarize(document_id)
+        except Exception as e:
+            self._count("errors")
+            print(f"[SUMMARY ERROR] document_id={document_id}, error={e}")
+        finally:
+            with self._lock:
+                self._pending.discard(document_id)
+
+    def summarize(self, document_id: int) -> str:
+        """
+        同步执行，返回结果："generated" / "reused" / "skipped"
+        LLM 调用期间不持有 DB 会话
+        """
+        # ---------- 1. 幂等检查 / 同内容复用 ----------
+        db = self.session_factory()
+        try:
+            doc = db.get(Document, document_id)
+            if doc is None or not doc.ragflow_document_id:
+                self._count("skipped")
+                return "skipped"
+            key = doc.content_hash or doc.ragflow_document_id
+            if doc.summary and doc.summary_hash == key:
+                self._count("skipped")
+                return "skipped"
+
+            if doc.content_hash:
+                existing = db.scalar(
+                    select(Document.summary).where(
+                        Document.content_hash == doc.content_hash,
+                        Document.summary_hash == doc.content_hash,
+                        Document.summary.isnot(None),
+                    ).limit(1)
+                )
+                if existing:
+                    doc.summary = existing
+                    doc.summary_hash = key
+                    db.commit()
+                    self._count("reused")
+                    return "reused"
+
+            filename = doc.filename
+            ragflow_document_id = doc.ragflow_document_id
+        finally:
+            db.close()
+
+        # ---------- 2. 本地全文 → LLM ----------
+        text = read_document_head(self.text_store, ragflow_document_id, self.input_chars)
+        if not text:
+            self._count("skipped")
+            return "skipped"
+
+        result = self._get_gateway().ask_json(
+            [
+                {"role": "system", "content": SYSTEM_DOC_SUMMARIZER},
+                {"role": "user", "content": USER_DOC_SUMMARIZER.format(filename=filename, text=text)},
+            ],
+            timeout=120.0,
+            schema=DOC_SUMMARY_SCHEMA,
+            task="summarize",
+        )
+        summary = format_summary(result)
+
+        # ---------- 3. 写回 ----------
+        db = self.session_factory()
+        try:
+            doc = db.get(Document, document_id)
+            if doc is None:
+                self._count("skipped")
+                return "skipped"
+            doc.summary = summary
+            doc.summary_hash = key
+            db.commit()
+        finally:
+            db.close()
+        self._count("generated")
+        return "generated"
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# =========================
+# 读取（研究流程使用）
+# =========================
+def get_summaries_for_datasets(
+    db: Session,
+    *,
+    ragflow_dataset_ids: List[str],
+    limit: int = 50,
+) -> List[Dict[str, str]]:
+    """
+    返回这些 RAGFlow dataset 下已生成摘要的文档：[{"filename", "summary"}, ...]（新文档在前）
+    """
+    if not ragflow_dataset_ids:
+        return []
+    rows = db.execute(
+        select(Document.filename, Document.summary)
+        .join(KnowledgeSpace, KnowledgeSpace.id == Document.knowledge_space_id)
+        .where(
+            KnowledgeSpace.ragflow_knowledge_id.in_(ragflow_dataset_ids),
+            Document.summary.isnot(None),
+        )
+        .order_by(Document.id.desc())
+        .limit(limit)
+    ).all()
+    return [{"filename": filename, "summary": summary} for filename, summary in rows]
+
+
+def format_doc_summaries(
+    summaries: Optional[List[Dict[str, str]]],
+    *,
+    max_chars: int = DOC_SUMMARY_PROMPT_CHARS,
+) -> str:
+    """拼成注入 prompt 的文本块；无摘要时返回空串"""
+    if not summaries:
+        return ""
+    lines = []
+    used = 0
+    for s in summaries:
+        line = f"- 《{s['filename']}》：{s['summary']}"
+        if used + len(line) > max_chars:
+            break
+        lines.append(line)
+        used += len(line)
+    return "\n".join(lines)
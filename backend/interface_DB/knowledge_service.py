@@ -24,11 +24,18 @@ from interface_DB.MySQL_knowledge_space_crud import (
     delete_knowledge_space,
 )
 
+from interface_DB.MySQL_db import run_db
+from interface_DB.MySQL_document import Document
+from interface_DB.MySQL_document_stats import get_status_counts
 from interface_DB.MySQL_document_crud import (
+    PAGE_SIZE,
     create_document,
+    create_documents_bulk,
     list_documents,
     count_documents,
     get_document,
+    get_document_by_hash,
+    count_documents_by_storage_uri,
     update_document_status,
     update_document_metadata,
     delete_document,
@@ -38,19 +45,101 @@ from interface_DB.MySQL_document_crud import (
 # RAGFlow Services（已验证可用）
 # =========================
 
-from ragflow_sdk import RAGFlow
+import asyncio
+import functools
 import os
-from ragflow_adapter.test import DocumentService  # 根据实际路径调整导入
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from utils.upload_stream import MultipartFileStream, remove_blob_if_unreferenced, unpin_blob
+from core.doc_text_store import get_doc_text_store
 
-def _get_ragflow_client() -> RAGFlow:
+# ragflow_sdk 导入较重（约 0.3s），且接口进程多数请求用不到：
+# 首次使用时才导入并构造客户端，之后进程内复用（客户端本身无连接状态）
+_ragflow_client = None
+_ragflow_client_lock = threading.Lock()
+
+
+def _get_ragflow_client():
     """
-    内部工具：创建 RAGFlow SDK 客户端
-    ❗严格使用你已经测试通过的方式
+    内部工具：获取 RAGFlow SDK 客户端（懒加载，进程内单例）
+    ❗构造不发起网络请求，RAGFlow 暂时不可用不影响进程启动
     """
-    return RAGFlow(
-        api_key=os.getenv("RAGFLOW_API_KEY"),
-        base_url=os.getenv("RAGFLOW_BASE_URL", "http://localhost:9380"),
-    )
+    global _ragflow_client
+    if _ragflow_client is None:
+        with _ragflow_client_lock:
+            if _ragflow_client is None:
+                from ragflow_sdk import RAGFlow
+                _ragflow_client = RAGFlow(
+                    api_key=os.getenv("RAGFLOW_API_KEY"),
+                    base_url=os.getenv("RAGFLOW_BASE_URL", "http://localhost:9380"),
+                )
+    return _ragflow_client
+
+
+def _get_ragflow_dataset(dataset_id: str):
+    """
+    内部工具：按 id 直接构造 DataSet（不走 list_datasets 往返）
+    """
+    from ragflow_sdk.modules.dataset import DataSet
+    return DataSet(_get_ragflow_client(), {"id": dataset_id})
+
+
+RAGFLOW_UPLOAD_TIMEOUT = 300  # 秒
+
+# RAGFlow 阻塞 I/O（上传可达 RAGFLOW_UPLOAD_TIMEOUT 秒）使用独立线程池：
+# run_db 的线程数与连接池一致，慢上传放在那里会占满 DB 线程、拖慢所有接口
+RAGFLOW_IO_WORKERS = int(os.getenv("RAGFLOW_IO_WORKERS", "4"))
+_ragflow_executor = ThreadPoolExecutor(
+    max_workers=RAGFLOW_IO_WORKERS,
+    thread_name_prefix="ragflow",
+)
+
+
+async def run_ragflow(fn, *args, **kwargs):
+    """
+    在 RAGFlow I/O 线程池中执行阻塞调用 fn(*args, **kwargs)
+    ❗fn 不应打开 DB Session：结果由调用方再经 run_db 短事务写回
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ragflow_executor, functools.partial(fn, *args, **kwargs))
+
+
+def _upload_files_to_ragflow(
+    dataset_id: str,
+    files: list[tuple[str, str]],
+) -> list[dict]:
+    """
+    内部工具：把本地文件流式上传到 RAGFlow dataset
+
+    - files: [(display_name, local_path), ...]
+    - 直接调用 HTTP 接口 POST /api/v1/datasets/{id}/documents，
+      请求体由 MultipartFileStream 边读磁盘边发送，不把文件整体读入内存
+      （SDK 的 upload_documents 需要传入完整 blob）
+    - 返回 RAGFlow 的 document 字典列表（顺序与 files 一致）
+    """
+    api_key = os.getenv("RAGFLOW_API_KEY")
+    base_url = os.getenv("RAGFLOW_BASE_URL", "http://localhost:9380")
+
+    body = MultipartFileStream([("file", name, path) for name, path in files])
+    try:
+        res = requests.post(
+            f"{base_url}/api/v1/datasets/{dataset_id}/documents",
+            data=body,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": body.content_type,
+            },
+            timeout=RAGFLOW_UPLOAD_TIMEOUT,
+        )
+    finally:
+        body.close()
+
+    res = res.json()
+    if res.get("code") != 0:
+        raise ValueError(res.get("message") or f"RAGFlow upload failed: {res}")
+    return res.get("data") or []
 
 
 # =========================================================
@@ -172,7 +261,7 @@ def delete_knowledge_space_service(
 # Document Services
 # =========================================================
 
-def upload_document_service(
+def create_upload_placeholder_service(
     db: Session,
     *,
     knowledge_space_id: int,
@@ -180,18 +269,21 @@ def upload_document_service(
     file_type: str | None,
     storage_uri: str,
     uploaded_by: int,
-):
+    content_hash: str | None = None,
+) -> dict:
     """
-    上传文档（Service 层）
+    上传第 1 步（短事务）：校验知识库 + 创建 document 占位（status=uploaded）
 
-    流程：
-    1. MySQL 创建 document（status=uploaded，占位）
-    2. RAGFlow upload_documents
-    3. 解析返回的 ragflow_document_id
-    4. 回写 MySQL（ragflow_document_id）
-    5. 成功返回
+    返回 {"id", "dataset_id"}；RAGFlow 上传在 Session 关闭后进行
     """
-    # ---------- 1. MySQL 占位 ----------
+    ks = get_knowledge_space(
+        db,
+        knowledge_space_id=knowledge_space_id,
+        owner_id=uploaded_by,
+    )
+    if not ks or not ks.ragflow_knowledge_id:
+        raise ValueError("Knowledge space not bound to RAGFlow")
+
     doc = create_document(
         db,
         knowledge_space_id=knowledge_space_id,
@@ -200,74 +292,299 @@ def upload_document_service(
         storage_uri=storage_uri,
         uploaded_by=uploaded_by,
         status="uploaded",
+        content_hash=content_hash,
     )
-    # 先提交占位记录，确保记录入库
+    return {"id": doc.id, "dataset_id": ks.ragflow_knowledge_id}
+
+
+def record_ragflow_upload_service(
+    db: Session,
+    *,
+    document_ids: list[int],
+    uploaded: list[dict] | None = None,
+    error: str | None = None,
+) -> list[dict]:
+    """
+    上传第 3 步（短事务）：把一次 RAGFlow 上传的结果写回，一次提交
+
+    - uploaded：RAGFlow 返回的 document 字典（顺序与 document_ids 一致）
+    - error：上传失败原因（此时全部标记 failed）
+    返回逐文档 {"id", "filename", "status", "created_at", "error"}
+    """
+    if error is None and len(uploaded or []) != len(document_ids):
+        error = f"RAGFlow returned {len(uploaded or [])} documents for {len(document_ids)} files"
+
+    docs = [db.get(Document, document_id) for document_id in document_ids]
+    for k, doc in enumerate(docs):
+        if error is not None:
+            doc.status = "failed"
+            doc.error_message = f"Failed to upload document to RAGFlow: {error}"
+            continue
+        doc.ragflow_document_id = uploaded[k].get("id")
+        if doc.ragflow_document_id:
+            doc.status = "indexed"
+        else:
+            doc.status = "failed"
+            doc.error_message = f"Cannot parse ragflow_document_id from {uploaded[k]}"
     db.commit()
-    db.refresh(doc)
 
-    rag = _get_ragflow_client()
+    return [
+        {
+            "id": doc.id,
+            "filename": doc.filename,
+            "status": doc.status,
+            "created_at": doc.created_at,
+            "error": doc.error_message if doc.status == "failed" else None,
+        }
+        for doc in docs
+    ]
+
 
+async def upload_document_service(
+    *,
+    knowledge_space_id: int,
+    filename: str,
+    file_type: str | None,
+    storage_uri: str,
+    uploaded_by: int,
+    content_hash: str | None = None,
+) -> dict:
+    """
+    上传文档（Service 层）
+
+    流程：
+    1. run_db：校验知识库 + MySQL 创建 document 占位
+    2. run_ragflow：RAGFlow 上传（从 storage_uri 流式发送；不持有 Session / 连接）
+    3. run_db：回写 ragflow_document_id / status
+    失败时文档标记 failed 并抛出 ValueError
+    storage_uri 由 store_blob 得到时带 pin：建行后（无论成败）释放
+    """
     try:
-        # ---------- 2. 查知识库 ----------
-        ks = get_knowledge_space(
-            db,
+        placeholder = await run_db(
+            create_upload_placeholder_service,
             knowledge_space_id=knowledge_space_id,
-            owner_id=uploaded_by,
+            filename=filename,
+            file_type=file_type,
+            storage_uri=storage_uri,
+            uploaded_by=uploaded_by,
+            content_hash=content_hash,
         )
-        if not ks or not ks.ragflow_knowledge_id:
-            raise ValueError("Knowledge space not bound to RAGFlow")
+    finally:
+        unpin_blob(storage_uri)
+
+    uploaded, error = None, None
+    try:
+        # dataset 不存在时 RAGFlow 接口直接返回错误，无需先 list_datasets
+        uploaded = await run_ragflow(
+            _upload_files_to_ragflow,
+            placeholder["dataset_id"],
+            [(filename, storage_uri)],
+        )
+    except Exception as e:
+        error = str(e)
+
+    [row] = await run_db(
+        record_ragflow_upload_service,
+        document_ids=[placeholder["id"]],
+        uploaded=uploaded,
+        error=error,
+    )
+    if row["status"] == "failed":
+        raise ValueError(row["error"])
+    return row
 
-        datasets = rag.list_datasets(id=ks.ragflow_knowledge_id)
-        if not datasets:
-            raise ValueError("RAGFlow dataset not found")
 
-        dataset = datasets[0]
+RAGFLOW_UPLOAD_BATCH_SIZE = 10  # 每次 multipart 请求携带的文件数
 
-        # ---------- 3. 上传文件 ----------
-        with open(storage_uri, "rb") as f:
-            blob = f.read()
 
-        upload_results = dataset.upload_documents([
+def prepare_documents_batch_service(
+    db: Session,
+    *,
+    knowledge_space_id: int,
+    uploaded_by: int,
+    files: list[dict],
+) -> dict:
+    """
+    批量上传第 1 步（短事务）：校验知识库、按 content_hash 去重、一个事务批量建行
+
+    返回 {"dataset_id", "results", "created": [(index, document_id), ...], "first_of": {index: index}}
+    - results：逐文件结果（库内重复已填好 deduplicated）
+    - first_of：本批次内重复的文件 → 首个同内容文件的下标
+    """
+    ks = get_knowledge_space(
+        db,
+        knowledge_space_id=knowledge_space_id,
+        owner_id=uploaded_by,
+    )
+    if not ks or not ks.ragflow_knowledge_id:
+        raise ValueError("Knowledge space not bound to RAGFlow")
+
+    results: list[dict] = [
+        {"filename": f["filename"], "status": None, "id": None, "error": None}
+        for f in files
+    ]
+
+    to_create: list[int] = []
+    seen_hashes: dict[str, int] = {}
+    first_of: dict[int, int] = {}
+    for i, f in enumerate(files):
+        content_hash = f.get("content_hash")
+        if content_hash:
+            existing = get_document_by_hash(
+                db,
+                knowledge_space_id=knowledge_space_id,
+                content_hash=content_hash,
+            )
+            if existing:
+                results[i].update(status="deduplicated", id=existing.id)
+                continue
+            if content_hash in seen_hashes:
+                # 本批次内重复：结果跟随首个文件
+                first_of[i] = seen_hashes[content_hash]
+                continue
+            seen_hashes[content_hash] = i
+        to_create.append(i)
+
+    docs = create_documents_bulk(
+        db,
+        rows=[
             {
-                "display_name": filename,
-                "blob": blob,
+                "knowledge_space_id": knowledge_space_id,
+                "filename": files[i]["filename"],
+                "file_type": files[i]["file_type"],
+                "storage_uri": files[i]["storage_uri"],
+                "uploaded_by": uploaded_by,
+                "content_hash": files[i].get("content_hash"),
             }
-        ])
-
-        # ---------- 4. 解析 RAGFlow 返回的 document_id ----------
-        if not upload_results:
-            raise ValueError("RAGFlow upload returned empty result")
-        print(f"RAGFlow upload_results: {upload_results}")
-        uploaded_doc = upload_results[0]
-        ragflow_document_id = getattr(uploaded_doc, "id", None)
-
-        if not ragflow_document_id:
-            raise ValueError(f"Cannot parse ragflow_document_id from {uploaded_doc}")
-
-        # ---------- 5. 回写 MySQL（修复后） ----------
-        # 方式1：对象赋值（现在模型有此字段，赋值有效）
-        doc.ragflow_document_id = ragflow_document_id
-        doc.status = "indexed"  # 可选：更新状态为已索引
-        db.commit()
-        db.refresh(doc)  # 刷新获取最新数据
+            for i in to_create
+        ],
+    ) if to_create else []
 
-        # 方式2：直接更新（备选，更稳定）
-        # db.query(Document).filter(Document.id == doc.id).update({
-        #     "ragflow_document_id": ragflow_document_id,
-        #     "status": "indexed"
-        # })
-        # db.commit()
-        # doc = db.query(Document).filter(Document.id == doc.id).first()
+    return {
+        "dataset_id": ks.ragflow_knowledge_id,
+        "results": results,
+        "created": [(i, doc.id) for i, doc in zip(to_create, docs)],
+        "first_of": first_of,
+    }
 
-        return doc
 
-    except Exception as e:
-        # ---------- 回滚状态 ----------
-        doc.status = "failed"
-        doc.error_message = str(e)
-        db.commit()
-        db.refresh(doc)
-        raise ValueError(f"Failed to upload document to RAGFlow: {e}")
+async def upload_documents_batch_service(
+    *,
+    knowledge_space_id: int,
+    uploaded_by: int,
+    files: list[dict],
+) -> list[dict]:
+    """
+    批量上传文档（Service 层）
+
+    files: [{"filename", "file_type", "storage_uri", "content_hash"}, ...]
+           （文件已由接口层流式落盘；store_blob 的 pin 在建行后逐文件释放）
+
+    流程：
+    1. run_db：校验知识库归属、去重（库内已有 / 本批次内重复 → deduplicated）、批量建行
+    2. 按 RAGFLOW_UPLOAD_BATCH_SIZE 分批：run_ragflow 上传 → run_db 写回（每批一次提交）
+       - 成功：写回 ragflow_document_id，status=indexed
+       - 失败：该批文档 status=failed，写 error_message
+    3. 未被任何有效文档引用的本地文件删除
+
+    返回与 files 顺序一致的逐文件结果：
+    {"filename", "status": indexed / failed / deduplicated, "id", "error"}
+    """
+    try:
+        plan = await run_db(
+            prepare_documents_batch_service,
+            knowledge_space_id=knowledge_space_id,
+            uploaded_by=uploaded_by,
+            files=files,
+        )
+    finally:
+        for f in files:
+            unpin_blob(f["storage_uri"])
+    results = plan["results"]
+    created = plan["created"]
+
+    # ---------- 分批上传 RAGFlow ----------
+    for start in range(0, len(created), RAGFLOW_UPLOAD_BATCH_SIZE):
+        batch = created[start:start + RAGFLOW_UPLOAD_BATCH_SIZE]
+        uploaded, error = None, None
+        try:
+            uploaded = await run_ragflow(
+                _upload_files_to_ragflow,
+                plan["dataset_id"],
+                [(files[i]["filename"], files[i]["storage_uri"]) for i, _ in batch],
+            )
+        except Exception as e:
+            print(f"[BATCH UPLOAD FAILED] files={len(batch)}, error={e}")
+            error = str(e)
+        rows = await run_db(
+            record_ragflow_upload_service,
+            document_ids=[document_id for _, document_id in batch],
+            uploaded=uploaded,
+            error=error,
+        )
+        for (i, _), row in zip(batch, rows):
+            results[i].update(status=row["status"], id=row["id"], error=row["error"])
+
+    # 本批次内重复的文件：沿用首个文件的结果
+    for i, first in plan["first_of"].items():
+        results[i].update(
+            status="failed" if results[first]["status"] == "failed" else "deduplicated",
+            id=results[first]["id"],
+            error=results[first]["error"],
+        )
+
+    # ---------- 清理未被引用的本地文件 ----------
+    for storage_uri in dict.fromkeys(f["storage_uri"] for f in files):
+        await run_db(release_local_file_service, storage_uri=storage_uri)
+
+    return results
+
+
+def find_duplicate_document_service(
+    db: Session,
+    *,
+    knowledge_space_id: int,
+    owner_id: int,
+    content_hash: str,
+):
+    """
+    上传去重（Service 层）
+
+    - 先校验知识库归属，避免通过哈希探测他人知识库
+    - 同一知识库内已有相同内容且未失败的文档 → 直接返回该文档
+      （跳过 RAGFlow 上传与重复解析）
+    """
+    ks = get_knowledge_space(
+        db,
+        knowledge_space_id=knowledge_space_id,
+        owner_id=owner_id,
+    )
+    if not ks:
+        raise ValueError("Knowledge space not found")
+
+    return get_document_by_hash(
+        db,
+        knowledge_space_id=knowledge_space_id,
+        content_hash=content_hash,
+    )
+
+
+def release_local_file_service(
+    db: Session,
+    *,
+    storage_uri: str,
+) -> bool:
+    """
+    删除本地文件（若已无未失败的文档引用它）
+
+    本地文件按内容寻址、跨知识库共享，不能随单个文档直接删除；
+    同内容上传已落盘但尚未建行（store_blob 的 pin）时同样保留。
+    返回是否真正删除了文件。
+    """
+    return remove_blob_if_unreferenced(
+        storage_uri,
+        lambda: count_documents_by_storage_uri(db, storage_uri=storage_uri) > 0,
+    )
 
 
 def list_documents_service(
@@ -275,13 +592,26 @@ def list_documents_service(
     *,
     knowledge_space_id: int,
     page: int = 1,
+    cursor: int | None = None,
 ):
     """
     分页列出知识库下的文档（仅 MySQL）
+
+    - 传 cursor（上一页返回的 next_cursor）走 keyset 分页；否则兼容 page
+    - total / status_counts 读计数表，常数代价
     """
+    items = list_documents(
+        db,
+        knowledge_space_id=knowledge_space_id,
+        page=page,
+        cursor=cursor,
+    )
+    status_counts = get_status_counts(db, knowledge_space_id=knowledge_space_id)
     return {
-        "items": list_documents(db, knowledge_space_id=knowledge_space_id, page=page),
-        "total": count_documents(db, knowledge_space_id=knowledge_space_id),
+        "items": items,
+        "total": sum(status_counts.values()),
+        "status_counts": status_counts,
+        "next_cursor": items[-1].id if len(items) == PAGE_SIZE else None,
     }
 
 
@@ -334,9 +664,6 @@ def rename_document_service(
 
     return update_document_metadata(db, document_id=document_id, filename=filename)
 
-# 首先确保导入 DocumentService 类（根据你的 SDK 实际路径调整）
-# 示例：from ragflow_sdk.modules.document import DocumentService
-
 def delete_document_service(
     db: Session,
     *,
@@ -384,25 +711,14 @@ def delete_document_service(
             )
 
         else:
-            # 1.2 调用 RAGFlow SDK（完全适配你验证可行的逻辑）
-            rag = _get_ragflow_client()
-            
-            # ===== 核心修复：实例化 DocumentService 类 =====
-            # 方式1：如果 DocumentService 需要 rag 客户端作为参数（多数 SDK 如此）
-            doc_service = DocumentService()  # 替换为实际的实例化方式
-            
-            # 方式2：如果是无参实例化（根据你验证的代码）
-            # doc_service = DocumentService()
-
+            # 1.2 调用 RAGFlow SDK（与 DocumentService.delete 等价，复用共享客户端）
             print(
                 f"[DELETE RAGFLOW] dataset_id={ks.ragflow_knowledge_id}, "
                 f"ragflow_doc_id={ragflow_doc_id}"
             )
 
-            # 调用你验证可行的删除语句（参数完全一致）
-            doc_service.delete(
-                dataset_id=ks.ragflow_knowledge_id,
-                document_ids=[ragflow_doc_id],
+            _get_ragflow_dataset(ks.ragflow_knowledge_id).delete_documents(
+                ids=[ragflow_doc_id],
             )
 
             print(
@@ -415,21 +731,30 @@ def delete_document_service(
             f"[RAGFLOW DELETE FAILED] doc_id={doc.id}, "
             f"ragflow_doc_id={ragflow_doc_id}, error={e}"
         )
-        # 调试：打印 DocumentService 的可用方法和参数
-        try:
-            from inspect import signature
-            rag = _get_ragflow_client()
-            doc_service = DocumentService()
-            # 打印 delete 方法的参数
-            print("[DEBUG] delete 方法参数：", signature(doc_service.delete))
-        except:
-            pass
 
     # -----------------------------
     # Step 2: 删除本地数据库记录（必须执行）
     # -----------------------------
+    storage_uri = doc.storage_uri
     delete_document(db, document_id=document_id, knowledge_space_id=knowledge_space_id)
 
+    # -----------------------------
+    # Step 3: 本地文件无其他引用时一并删除
+    # -----------------------------
+    try:
+        release_local_file_service(db, storage_uri=storage_uri)
+    except Exception as e:
+        print(f"[DELETE LOCAL FILE FAILED] path={storage_uri}, error={e}")
+
+    # -----------------------------
+    # Step 4: 清理本地全文缓存
+    # -----------------------------
+    if ragflow_doc_id:
+        try:
+            get_doc_text_store().delete(ragflow_doc_id)
+        except Exception as e:
+            print(f"[DELETE DOC TEXT FAILED] ragflow_doc_id={ragflow_doc_id}, error={e}")
+
 
 
 
@@ -614,6 +939,9 @@ def check_parse_status_job(
     knowledge_space_id: int,
 ) -> None:
     """
+    ⚠️ 逐文档请求 RAGFlow，仅保留作手动排查用；
+    接口层已改由后台 parse_status_sync.ParseStatusSyncService 批量同步。
+
     当前规则：
     - 仅处理 MySQL 中 status == 'parsing' 的文档
     - 若对应 RAGFlow.run == 'DONE'，则更新为 parsed
@@ -731,3 +1059,21 @@ def search_know_ragflow_id(user_id: int, knowledge_space_id: int) -> str:
 
     finally:
         db.close()
+
+
+def get_knowledge_summaries_service(ragflow_dataset_ids: list[str], limit: int = 50) -> list[dict]:
+    """
+    研究流程读取知识库的入库摘要（Step 3 / Step 4 意图扩展使用）
+    读取失败时返回空列表，不影响研究流程
+    """
+    from interface_DB.MySQL_db import SessionLocal
+    from interface_DB.doc_summary import get_summaries_for_datasets
+
+    db = SessionLocal()
+    try:
+        return get_summaries_for_datasets(db, ragflow_dataset_ids=ragflow_dataset_ids, limit=limit)
+    except Exception as e:
+        print(f"[SUMMARY READ ERROR] datasets={ragflow_dataset_ids}, error={e}")
+        return []
+    finally:
+        db.close()
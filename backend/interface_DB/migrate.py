@@ -0,0 +1,94 @@
+# interface_DB/migrate.py
+"""
+已有 MySQL 库的增量迁移（幂等，可重复执行）
+
+- 新库：直接导入 deepresearch.sql（已包含以下全部列 / 索引）
+- 已有库：升级代码后执行一次
+      cd backend && python -m interface_DB.migrate
+- 按当前表结构检查，只添加缺失的列 / 索引；SQLite 同样适用
+- 文档计数表 knowledge_space_document_stats 不存在时建表并按 documents 回填；
+  计数漂移时可用 --rebuild-stats 重新回填全部知识库
+"""
+
+import argparse
+import sys
+from typing import List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# documents 新增列：上传去重（content_hash）、入库摘要（summary / summary_hash）
+DOCUMENT_COLUMNS = [
+    ("content_hash", "CHAR(64) NULL"),
+    ("summary", "TEXT NULL"),
+    ("summary_hash", "CHAR(64) NULL"),
+]
+
+# documents 新增索引（与 MySQL_document.Document.__table_args__ 一致）
+DOCUMENT_INDEXES = [
+    ("ix_documents_space_hash", "knowledge_space_id, content_hash"),
+    ("ix_documents_status_space", "status, knowledge_space_id"),
+    ("ix_documents_space_id", "knowledge_space_id, id"),
+]
+
+
+def migrate(engine: Engine, *, rebuild_stats: bool = False) -> List[str]:
+    """执行缺失的迁移语句，返回实际执行的步骤列表"""
+    # 外键引用的表需已注册到 Base.metadata
+    import interface_DB.MySQL_user  # noqa: F401
+    import interface_DB.MySQL_knowledge_space  # noqa: F401
+    from interface_DB.MySQL_document_stats import KnowledgeSpaceDocumentStats, rebuild_document_stats
+
+    insp = inspect(engine)
+    columns = {c["name"] for c in insp.get_columns("documents")}
+    indexes = {i["name"] for i in insp.get_indexes("documents")}
+
+    statements = [
+        f"ALTER TABLE documents ADD COLUMN {name} {ddl}"
+        for name, ddl in DOCUMENT_COLUMNS
+        if name not in columns
+    ] + [
+        f"CREATE INDEX {name} ON documents ({cols})"
+        for name, cols in DOCUMENT_INDEXES
+        if name not in indexes
+    ]
+
+    with engine.begin() as conn:
+        for stmt in statements:
+            print(f"[MIGRATE] {stmt}")
+            conn.execute(text(stmt))
+
+    # ---------- 文档计数表：建表 + 回填 ----------
+    stats_table = KnowledgeSpaceDocumentStats.__tablename__
+    if not insp.has_table(stats_table):
+        print(f"[MIGRATE] CREATE TABLE {stats_table}")
+        KnowledgeSpaceDocumentStats.__table__.create(engine)
+        statements.append(f"CREATE TABLE {stats_table}")
+        rebuild_stats = True
+    if rebuild_stats:
+        print(f"[MIGRATE] rebuild {stats_table}")
+        with Session(engine) as db:
+            rebuild_document_stats(db)
+        statements.append(f"REBUILD {stats_table}")
+    return statements
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Incremental schema migration for existing databases")
+    parser.add_argument(
+        "--rebuild-stats",
+        action="store_true",
+        help="按 documents 表重算全部知识库的文档计数",
+    )
+    args = parser.parse_args(argv)
+
+    from interface_DB.MySQL_db import engine
+
+    applied = migrate(engine, rebuild_stats=args.rebuild_stats)
+    print(f"[MIGRATE] done, {len(applied)} step(s) applied")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
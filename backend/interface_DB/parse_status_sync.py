@@ -0,0 +1,340 @@
+"""
+后台解析状态同步（替代 GET /api/documents 里的同步 check_parse_status_job）
+
+职责说明：
+- 周期性找出 MySQL 中 status == 'parsing' 的文档，按 RAGFlow dataset 分组
+- 每个 dataset 用分页 list_documents 拉取状态（不再逐文档请求）
+- 与 MySQL 对比后批量更新，并通过回调推送变更（接口层转成 SSE）
+- 解析完成（parsed）的文档拉取一次全部 chunk 写入本地全文缓存（可选），
+  随后交给 DocumentSummarizer 后台生成入库摘要（可选）
+  - 以“全文缓存中缺失”为准而非状态跳变：写入失败的文档留在待补齐队列，后续轮次重试；
+    进程启动后首轮扫描一次已 parsed 但缺失全文的文档
+- 单个 dataset 拉取 / 写回失败只回滚该 dataset，其余 dataset 的变更照常提交与推送
+- ❗不涉及 FastAPI / HTTP / token
+"""
+
+import asyncio
+import os
+from collections import Counter
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from core.doc_text_store import DocTextStore, ingest_document_text
+from interface_DB.MySQL_db import SessionLocal
+from interface_DB.MySQL_document import Document
+from interface_DB.MySQL_document_stats import apply_status_deltas
+from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+from interface_DB.knowledge_service import _get_ragflow_client
+
+# =========================
+# 常量定义
+# =========================
+PARSE_SYNC_INTERVAL = float(os.getenv("PARSE_SYNC_INTERVAL", "5"))  # 秒
+PARSE_SYNC_PAGE_SIZE = 100
+# 全文缓存补齐：每轮最多处理的文档数 / 单个文档最多尝试次数（超过后本进程内不再重试）
+PARSE_SYNC_INGEST_BATCH = int(os.getenv("PARSE_SYNC_INGEST_BATCH", "20"))
+PARSE_SYNC_INGEST_MAX_ATTEMPTS = int(os.getenv("PARSE_SYNC_INGEST_MAX_ATTEMPTS", "5"))
+
+# 完整翻页后 dataset 中仍找不到的文档（在 RAGFlow 侧已被删除）：本地记为 failed，不再轮询
+RAGFLOW_RUN_MISSING = "MISSING"
+RAGFLOW_MISSING_MESSAGE = "Document missing in RAGFlow"
+
+# RAGFlow document.run → MySQL status（其余 run 值视为仍在解析）
+RAGFLOW_RUN_STATUS_MAP = {
+    "DONE": "parsed",
+    "FAIL": "failed",
+    "CANCEL": "failed",
+    RAGFLOW_RUN_MISSING: "failed",
+}
+
+
+def fetch_dataset_run_status(
+    rag,
+    dataset_id: str,
+    wanted_ids: set[str],
+    *,
+    page_size: int = PARSE_SYNC_PAGE_SIZE,
+) -> tuple[dict[str, tuple[str, str]], int]:
+    """
+    分页拉取 dataset 下文档的解析状态，找齐 wanted_ids 即停止
+
+    返回 ({ragflow_document_id: (run, progress_msg)}, 请求次数)
+    翻完全部分页仍缺失的 id 记为 (RAGFLOW_RUN_MISSING, RAGFLOW_MISSING_MESSAGE)，
+    否则每轮都会为它重新翻完整个 dataset
+    """
+    # 直接用 id 构造 DataSet，省去 list_datasets 往返（SDK 延迟导入）
+    from ragflow_sdk.modules.dataset import DataSet
+    dataset = DataSet(rag, {"id": dataset_id})
+    found: dict[str, tuple[str, str]] = {}
+    calls = 0
+    page = 1
+    while wanted_ids - found.keys():
+        docs = dataset.list_documents(page=page, page_size=page_size)
+        calls += 1
+        for d in docs:
+            if d.id in wanted_ids:
+                found[d.id] = (getattr(d, "run", None), getattr(d, "progress_msg", "") or "")
+        if len(docs) < page_size:
+            for missing in wanted_ids - found.keys():
+                found[missing] = (RAGFLOW_RUN_MISSING, RAGFLOW_MISSING_MESSAGE)
+            break
+        page += 1
+    return found, calls
+
+
+def diff_parse_status(
+    local_docs: list[tuple[int, str]],
+    remote: dict[str, tuple[str, str]],
+) -> list[dict]:
+    """
+    对比本地 parsing 文档与 RAGFlow 状态，返回需要写回的更新
+    - local_docs: [(document_id, ragflow_document_id), ...]
+    - 返回 [{"id", "status", "error_message"}, ...]
+    """
+    updates = []
+    for doc_id, ragflow_id in local_docs:
+        if ragflow_id not in remote:
+            continue
+        run, progress_msg = remote[ragflow_id]
+        status = RAGFLOW_RUN_STATUS_MAP.get(run)
+        if status is None:
+            continue
+        updates.append({
+            "id": doc_id,
+            "status": status,
+            "error_message": (progress_msg or f"RAGFlow run={run}") if status == "failed" else None,
+        })
+    return updates
+
+
+def apply_status_updates(db: Session, updates: list[dict]) -> None:
+    """
+    批量写回状态（按主键的 ORM bulk UPDATE，一次提交）
+    bulk UPDATE 不触发 ORM 事件，同一事务内手动维护计数表
+    """
+    if not updates:
+        return
+    old = db.execute(
+        select(Document.id, Document.knowledge_space_id, Document.status)
+        .where(Document.id.in_([u["id"] for u in updates]))
+    ).all()
+    new_status = {u["id"]: u["status"] for u in updates}
+    deltas: Counter = Counter()
+    for doc_id, ks_id, status in old:
+        if status != new_status[doc_id]:
+            deltas[(ks_id, status)] -= 1
+            deltas[(ks_id, new_status[doc_id])] += 1
+
+    db.execute(update(Document), updates)
+    apply_status_deltas(db.connection(), deltas)
+    db.commit()
+
+
+class ParseStatusSyncService:
+    """
+    后台轮询服务：
+
+        service = ParseStatusSyncService(on_change=callback)
+        service.start()     # 在事件循环中启动
+        await service.stop()
+
+    sync_once() 是同步函数（SQLAlchemy + requests），run_forever 放到线程池执行。
+    传入 text_store 时，解析完成且全文缓存中缺失的文档进入待补齐队列，逐轮写入本地全文缓存
+    （失败只计数并在后续轮次重试，不影响状态同步）；
+    再传入 summarizer（DocumentSummarizer）时，写入成功后排队生成入库摘要。
+    on_change(change) 在工作线程中调用，change 为
+    {"document_id", "knowledge_space_id", "status", "error_message"}。
+    """
+
+    def __init__(
+        self,
+        *,
+        session_factory: Callable[[], Session] = SessionLocal,
+        client_factory: Callable = _get_ragflow_client,
+        interval: float = PARSE_SYNC_INTERVAL,
+        page_size: int = PARSE_SYNC_PAGE_SIZE,
+        on_change: Optional[Callable[[dict], None]] = None,
+        text_store: Optional[DocTextStore] = None,
+        summarizer=None,
+    ):
+        self.session_factory = session_factory
+        self.client_factory = client_factory
+        self.interval = interval
+        self.page_size = page_size
+        self.on_change = on_change
+        self.text_store = text_store
+        self.summarizer = summarizer
+        self._task: Optional[asyncio.Task] = None
+        # 待补齐全文：document_id → (dataset_id, ragflow_document_id)；仅在 sync 线程中读写
+        self._ingest_pending: dict[int, tuple[str, str]] = {}
+        self._ingest_attempts: Counter = Counter()
+        self._backlog_scanned = False
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "runs": 0,
+            "ragflow_calls": 0,
+            "updated": 0,
+            "errors": 0,
+            "text_ingested": 0,
+            "text_errors": 0,
+            "last_duration": 0.0,
+        }
+
+    def _count(self, **deltas) -> None:
+        with self._stats_lock:
+            for k, v in deltas.items():
+                if k == "last_duration":
+                    self.stats[k] = v
+                else:
+                    self.stats[k] += v
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            return {**self.stats, "text_pending": len(self._ingest_pending)}
+
+    def sync_once(self) -> list[dict]:
+        t0 = time.monotonic()
+        changes: list[dict] = []
+        db = self.session_factory()
+        try:
+            if self.text_store is not None and not self._backlog_scanned:
+                self._scan_text_backlog(db)
+
+            # ---------- 1. 本地待同步文档（按 dataset 分组） ----------
+            rows = db.execute(
+                select(
+                    Document.id,
+                    Document.ragflow_document_id,
+                    Document.knowledge_space_id,
+                    KnowledgeSpace.ragflow_knowledge_id,
+                )
+                .join(KnowledgeSpace, KnowledgeSpace.id == Document.knowledge_space_id)
+                .where(
+                    Document.status == "parsing",
+                    Document.ragflow_document_id.isnot(None),
+                    KnowledgeSpace.ragflow_knowledge_id.isnot(None),
+                )
+            ).all()
+
+            by_dataset: dict[str, list] = {}
+            for row in rows:
+                by_dataset.setdefault(row.ragflow_knowledge_id, []).append(row)
+
+            rag = self.client_factory() if by_dataset or self._ingest_pending else None
+
+            # ---------- 2. 每个 dataset 分页拉取 + 对比 + 批量写回 ----------
+            for dataset_id, docs in by_dataset.items():
+                try:
+                    remote, calls = fetch_dataset_run_status(
+                        rag,
+                        dataset_id,
+                        {d.ragflow_document_id for d in docs},
+                        page_size=self.page_size,
+                    )
+                    self._count(ragflow_calls=calls)
+                    updates = diff_parse_status(
+                        [(d.id, d.ragflow_document_id) for d in docs],
+                        remote,
+                    )
+                    apply_status_updates(db, updates)
+                except Exception as e:
+                    # 只放弃这个 dataset；已提交的其他 dataset 变更照常推送
+                    db.rollback()
+                    self._count(errors=1)
+                    print(f"[SYNC ERROR] dataset_id={dataset_id}, error={e}")
+                    continue
+
+                doc_of = {d.id: d for d in docs}
+                for u in updates:
+                    if u["status"] == "parsed" and self.text_store is not None:
+                        self._ingest_pending[u["id"]] = (dataset_id, doc_of[u["id"]].ragflow_document_id)
+                    changes.append({
+                        "document_id": u["id"],
+                        "knowledge_space_id": doc_of[u["id"]].knowledge_space_id,
+                        "status": u["status"],
+                        "error_message": u["error_message"],
+                    })
+
+            # ---------- 3. 解析完成的文档写入本地全文缓存（可重试） ----------
+            if self._ingest_pending:
+                self._ingest_pending_texts(rag)
+        finally:
+            db.close()
+            self._count(runs=1, updated=len(changes), last_duration=time.monotonic() - t0)
+
+        if self.on_change:
+            for change in changes:
+                self.on_change(change)
+        return changes
+
+    def _scan_text_backlog(self, db: Session) -> None:
+        """进程启动后的首轮：已 parsed 但全文缓存缺失的文档（此前写入失败 / 升级前解析）加入待补齐队列"""
+        try:
+            rows = db.execute(
+                select(Document.id, Document.ragflow_document_id, KnowledgeSpace.ragflow_knowledge_id)
+                .join(KnowledgeSpace, KnowledgeSpace.id == Document.knowledge_space_id)
+                .where(
+                    Document.status == "parsed",
+                    Document.ragflow_document_id.isnot(None),
+                    KnowledgeSpace.ragflow_knowledge_id.isnot(None),
+                )
+            ).all()
+        except Exception as e:
+            db.rollback()
+            self._count(errors=1)
+            print(f"[DOC TEXT ERROR] backlog scan failed: {e}")
+            return
+        for doc_id, ragflow_id, dataset_id in rows:
+            if not self.text_store.has(ragflow_id):
+                self._ingest_pending.setdefault(doc_id, (dataset_id, ragflow_id))
+        self._backlog_scanned = True
+
+    def _ingest_pending_texts(self, rag) -> None:
+        for doc_id, (dataset_id, ragflow_id) in list(self._ingest_pending.items())[:PARSE_SYNC_INGEST_BATCH]:
+            if not self.text_store.has(ragflow_id):
+                try:
+                    ingest_document_text(rag, self.text_store, dataset_id, ragflow_id)
+                except Exception as e:
+                    self._count(text_errors=1)
+                    self._ingest_attempts[doc_id] += 1
+                    print(
+                        f"[DOC TEXT ERROR] ragflow_document_id={ragflow_id}, "
+                        f"attempt={self._ingest_attempts[doc_id]}, error={e}"
+                    )
+                    if self._ingest_attempts[doc_id] < PARSE_SYNC_INGEST_MAX_ATTEMPTS:
+                        continue
+                    # 超过重试上限：本进程内放弃（重启后首轮扫描会再次补齐）
+                    del self._ingest_pending[doc_id]
+                    del self._ingest_attempts[doc_id]
+                    continue
+                self._count(text_ingested=1)
+            del self._ingest_pending[doc_id]
+            self._ingest_attempts.pop(doc_id, None)
+            if self.summarizer is not None:
+                self.summarizer.submit(doc_id)
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sync_once)
+            except Exception as e:
+                self._count(errors=1)
+                print(f"[SYNC ERROR] {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
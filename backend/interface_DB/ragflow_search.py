@@ -0,0 +1,243 @@
+"""
+RAGFlow 检索（SDK 版）：search_list_ragflow + 结果适配
+
+说明：
+- 原先位于 tests/test_ragflow_interface.py，模块导入时即构造 RAGFlow 客户端；
+  现改用 knowledge_service 的共享客户端（首次检索时才导入 ragflow_sdk）
+- interface_DB/ragflow.py 是旧的 nginx 接口版本，仅作保留
+"""
+
+import time
+from collections import Counter
+from typing import Dict, List, Any, Optional
+from core.chunk_store import SessionChunkStore
+from core.query_broker import QueryBroker
+from core.retrieval_controller import default_retrieval_size
+from core.metrics import REGISTRY
+
+RAGFLOW_RETRIEVE_SECONDS = REGISTRY.histogram(
+    "ragflow_retrieve_seconds", "RAGFlow retrieve latency per query x dataset", ("status",),
+)
+from interface_DB.MySQL_document_crud import get_filename_by_ragflow_document_id
+from interface_DB.MySQL_db import SessionLocal
+from interface_DB.knowledge_service import _get_ragflow_client
+
+class RAGFlowAdapter:
+    """
+    将 新RAGFlow 检索结果（Response实例列表 / 字典列表），转换为：
+    - LLM 可用的上下文
+    - 用户可解释的证据
+    """
+
+    def __init__(
+        self,
+        *,
+        max_contexts: int = 10,
+        min_similarity: float = 0.0,
+        chunk_store: Optional[SessionChunkStore] = None,
+    ):
+        self.max_contexts = max_contexts
+        self.min_similarity = min_similarity
+        # 非空时 contexts / evidences 输出为引用记录，正文只在会话存储中保存一份
+        self.chunk_store = chunk_store
+
+    def _get_field(self, item: Any, field_name: str, default: Any = None) -> Any:
+        """
+        统一获取字段：兼容 Response 实例（属性访问）和 字典（键访问）
+        """
+        # 字典按键访问（getattr 对 dict 不会报错，只会返回默认值）
+        if isinstance(item, dict):
+            return item.get(field_name, default)
+        # Response 实例按属性访问
+        return getattr(item, field_name, default)
+
+    def adapt(self, ragflow_results: List[Any]) -> Dict:
+        """
+        适配 RAGFlow 结果格式：支持 Response 实例列表 / 字典列表
+        """
+        # ---------- 0. 初始化所有 chunks ----------
+        all_chunks = []
+        for chunk in ragflow_results:
+            all_chunks.append(chunk)
+
+        # ---------- 1. 使用 chunk_id（id 字段/属性）聚合 ----------
+        chunk_map = {}
+
+        for c in all_chunks:
+            # 安全获取相似度（兼容 Response 和 字典）
+            similarity = self._get_field(c, "similarity", 0.0)
+            # 过滤非数字类型或低于最小相似度的Chunk
+            if not isinstance(similarity, (int, float)):
+                continue
+            if similarity < self.min_similarity:
+                continue
+
+            # 安全获取 chunk 唯一标识（id 字段/属性）
+            cid = self._get_field(c, "id")
+            if not cid:
+                continue
+
+            # 去重并聚合，记录命中次数
+            if cid not in chunk_map:
+                # 存储原始实例/字典，并添加命中次数
+                chunk_map[cid] = {
+                    "item": c,
+                    "_hit_count": 1,
+                    "similarity": similarity
+                }
+            else:
+                chunk_map[cid]["_hit_count"] += 1
+                # 保留更高相似度的那一次数据
+                if similarity > chunk_map[cid]["similarity"]:
+                    chunk_map[cid]["item"] = c
+                    chunk_map[cid]["similarity"] = similarity
+
+        # ---------- 2. 按相似度倒序排序 ----------
+        filtered_items = sorted(
+            chunk_map.values(),
+            key=lambda x: x["similarity"],
+            reverse=True
+        )
+
+        # ---------- 3. 构造 LLM Context ----------
+        # 文件名按 chunk 各自的 document_id 查询（同一次调用内按 doc_id 缓存）
+        db = SessionLocal()
+        doc_names: Dict[str, Optional[str]] = {}
+
+        def doc_name_of(c: Any) -> Optional[str]:
+            doc_id = self._get_field(c, "document_id", "")
+            if doc_id not in doc_names:
+                doc_names[doc_id] = get_filename_by_ragflow_document_id(db, ragflow_document_id=doc_id)
+            return doc_names[doc_id]
+
+        contexts = []
+        try:
+            for item_wrap in filtered_items[: self.max_contexts]:
+                c = item_wrap["item"]
+                context = {
+                    "text": self._get_field(c, "content", "").strip(),
+                    "source": doc_name_of(c) or "未知来源",
+                    # 供本地全文缓存做上下文扩展
+                    "doc_id": self._get_field(c, "document_id", ""),
+                    "chunk_id": self._get_field(c, "id", ""),
+                }
+                if self.chunk_store is not None:
+                    context = self.chunk_store.context(**context)
+                contexts.append(context)
+
+            # ---------- 4. 构造 Evidence ----------
+            evidences = []
+            for item_wrap in filtered_items:
+                c = item_wrap["item"]
+                fields = {
+                    "doc_name": doc_name_of(c),
+                    "doc_id": self._get_field(c, "document_id", ""),
+                    "chunk_id": self._get_field(c, "id", ""),
+                    "hit_count": item_wrap["_hit_count"],
+                    "similarity": round(item_wrap["similarity"], 4),
+                    "vector_similarity": round(self._get_field(c, "vector_similarity", 0.0), 4),
+                }
+                if self.chunk_store is not None:
+                    # 与 context 共用同一份正文（excerpt 读取时截取）
+                    evidences.append(self.chunk_store.evidence(
+                        text=self._get_field(c, "content", "").strip(), **fields,
+                    ))
+                else:
+                    evidences.append({**fields, "excerpt": self._get_field(c, "content", "")[:300].strip()})
+
+            # ---------- 5. Meta 信息 ----------
+            # 按 doc_id 计数，展示用文件名
+            doc_counter = Counter(self._get_field(w["item"], "document_id", "") for w in filtered_items)
+        finally:
+            db.close()
+
+        meta = {
+            "total_chunks": len(filtered_items),
+            "docs_hit": len(doc_counter),
+            "doc_distribution": [
+                {
+                    "doc_name": doc_names.get(doc_id),
+                    "doc_id": doc_id,
+                    "chunks": cnt
+                }
+                for doc_id, cnt in doc_counter.most_common()
+            ]
+        }
+
+        return {
+            "contexts": contexts,
+            "evidences": evidences,
+            "meta": meta,
+        }
+
+
+def search_list_ragflow(
+    query_hints: List[str],
+    kb_ids: List[str] = ["腕骨骨折"],
+    size: Optional[int] = None,
+    *,
+    broker: Optional[QueryBroker] = None,
+    owner: Optional[str] = None,
+    chunk_store: Optional[SessionChunkStore] = None,
+):
+    """
+    批量查询 RAGFlow：保留 Response 实例，不过滤有效数据
+    - broker 非空时经会话级 QueryBroker 去重（同一会话内相同 query × 知识库只检索一次）
+    - owner：记账用的 sub_goal_id
+    - chunk_store 非空时结果中的 contexts / evidences 为引用记录（见 core/chunk_store.py）
+    - size 为本次总条数，按 query × 知识库均分后作为 RAGFlow page_size（检索开销随 size 变化）
+    - meta["per_query"]：每个 query 召回的 chunk_id（截断前），供自适应检索按 query 统计增益
+    - meta["truncated"]：是否有 query × 知识库取满了 page_size（结果被截断，扩大 size 可能有收益）
+    """
+    if size is None:
+        # 未指定时沿用旧公式（每个 query × 知识库 8 条）；Step 4 由 RetrievalController 显式给出
+        size = default_retrieval_size(len(query_hints), len(kb_ids))
+    n_calls = max(len(query_hints), 1) * max(len(kb_ids), 1)
+    page_size = max(1, -(-size // n_calls))
+    rag_object = _get_ragflow_client()
+
+    def _retrieve(question: str, kb_id: str):
+        # kb_id 即 dataset id，无需先 list_datasets 再取 .id（每次省一次往返）
+        started = time.perf_counter()
+        status = "error"
+        try:
+            chunks = rag_object.retrieve(
+                dataset_ids=[kb_id],
+                question=question,
+                page_size=page_size,
+                keyword=True,
+            )
+            status = "ok"
+            return chunks
+        finally:
+            RAGFLOW_RETRIEVE_SECONDS.observe(time.perf_counter() - started, status=status)
+
+    results = []
+    per_query: Dict[str, List[str]] = {}
+    truncated = False
+    for i in range(len(query_hints)):
+        for j in range(len(kb_ids)):
+            # 获取单次检索的 Response 实例列表（有效数据）
+            if broker is not None:
+                single_retrieve_result = broker.fetch(
+                    query_hints[i], kb_ids[j], _retrieve, owner=owner, size=page_size,
+                )
+            else:
+                single_retrieve_result = _retrieve(query_hints[i], kb_ids[j])
+            truncated = truncated or len(single_retrieve_result) >= page_size
+            # 关键修正：直接 extend 保留所有 Response 实例，不做字典过滤
+            results.extend(single_retrieve_result)
+            per_query.setdefault(query_hints[i], []).extend(
+                getattr(c, "id", None) or (c.get("id") if isinstance(c, dict) else None)
+                for c in single_retrieve_result
+            )
+
+    adapter = RAGFlowAdapter(
+        max_contexts=size,
+        # min_similarity=0.85  # 可根据需要开启，暂时关闭避免过滤过多
+        chunk_store=chunk_store,
+    )
+    adapted = adapter.adapt(results)
+    adapted["meta"]["per_query"] = {q: [cid for cid in ids if cid] for q, ids in per_query.items()}
+    adapted["meta"]["truncated"] = truncated
+    return adapted
@@ -0,0 +1,131 @@
+"""
+token → 用户快照的进程内缓存（认证热路径）
+
+说明：
+- get_current_user 每次请求都会解 JWT + 查 users 表；SSE / 澄清等高频接口
+  只需要 id / username 等少量字段，短 TTL 缓存即可省掉 DB 往返
+- 两层缓存：
+  1) token → (user_id, token 过期时间)：命中后连 JWT 解码都省掉
+  2) user_id → UserSnapshot：新 token（同一用户）只需验签，不查库
+- 用户被禁用时调用 invalidate_user()，立即清掉该用户的快照与全部 token
+- ❗多进程部署时其他进程最多滞后一个 TTL
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    认证后传给接口层的只读用户信息（替代 ORM User，Session 关闭后仍可安全访问）
+    """
+    id: int
+    username: str
+    email: Optional[str]
+    role: str
+    status: str
+
+
+class UserSnapshotCache:
+    def __init__(
+        self,
+        *,
+        ttl: float = 60.0,
+        max_tokens: int = 10000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        # token -> (user_id, token_exp)
+        self._tokens: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+        # user_id -> (snapshot, cached_at)
+        self._users: dict[int, tuple[UserSnapshot, float]] = {}
+        self.stats = {"token_hits": 0, "user_hits": 0, "misses": 0, "invalidations": 0}
+
+    # ---------- token 层 ----------
+    def get_token(self, token: str) -> Optional[int]:
+        """已验证过且未过期的 token → user_id"""
+        now = self._clock()
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            user_id, token_exp = entry
+            if token_exp <= now:
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return user_id
+
+    def put_token(self, token: str, user_id: int, token_exp: float) -> None:
+        with self._lock:
+            self._tokens[token] = (user_id, token_exp)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+
+    # ---------- 用户层 ----------
+    def get_user(self, user_id: int) -> Optional[UserSnapshot]:
+        now = self._clock()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            snapshot, cached_at = entry
+            if now - cached_at >= self.ttl:
+                del self._users[user_id]
+                return None
+            return snapshot
+
+    def put_user(self, snapshot: UserSnapshot) -> None:
+        with self._lock:
+            self._users[snapshot.id] = (snapshot, self._clock())
+
+    def resolve(
+        self,
+        token: str,
+        *,
+        decode: Callable[[str], tuple[int, float]],
+        load: Callable[[int], UserSnapshot],
+    ) -> UserSnapshot:
+        """
+        - decode(token) -> (user_id, exp)：验签 + 过期校验（无 DB）
+        - load(user_id) -> UserSnapshot：查库，用户不存在 / 非 active 时抛异常
+        """
+        user_id = self.get_token(token)
+        if user_id is None:
+            user_id, token_exp = decode(token)
+            self.put_token(token, user_id, token_exp)
+        else:
+            self._count("token_hits")
+
+        snapshot = self.get_user(user_id)
+        if snapshot is not None:
+            self._count("user_hits")
+            return snapshot
+
+        self._count("misses")
+        snapshot = load(user_id)
+        self.put_user(snapshot)
+        return snapshot
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+            for token in [t for t, (uid, _) in self._tokens.items() if uid == user_id]:
+                del self._tokens[token]
+            self.stats["invalidations"] += 1
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "tokens": len(self._tokens), "users": len(self._users)}
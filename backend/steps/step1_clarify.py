@@ -121,6 +121,19 @@ FORCE_QUESTION_MAP = {
 }
 
 
+# LLM 输出必须包含的字段（下游 Orchestrator 直接读取）
+# 澄清过程中尚未获知的字段由模型返回 null（计入 missing_fields），只要求键存在
+_OPTIONAL_STR = (str, type(None))
+REQUIREMENTS_SCHEMA = {
+    "goal": _OPTIONAL_STR,
+    "topic": _OPTIONAL_STR,
+    "domain": _OPTIONAL_STR,
+    "audience": _OPTIONAL_STR,
+    "depth": _OPTIONAL_STR,
+    "language": _OPTIONAL_STR,
+}
+
+
 def _generate_force_question(field: str) -> str:
     return FORCE_QUESTION_MAP.get(field, f"请补充 {field} 的信息。")
 
@@ -138,7 +151,7 @@ def analyze_requirements(
         *conversation,
         {"role": "user", "content": JSON_SCHEMA_INSTRUCTION},
     ]
-    return gateway.ask_json(messages, timeout=60.0)
+    return gateway.ask_json(messages, timeout=60.0, schema=REQUIREMENTS_SCHEMA, task="clarify")
 
 
 # =========================
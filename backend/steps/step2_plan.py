@@ -67,6 +67,11 @@ USER_RESEARCH_PLANNER_INSTRUCTION = """
 """.strip()
 
 
+PLAN_SCHEMA = {
+    "sections": list,
+}
+
+
 # =========================
 # 2) 核心函数
 # =========================
@@ -93,7 +98,12 @@ def generate_research_plan(
         },
     ]
 
-    raw_plan = gateway.ask_json(messages, timeout=60.0)
+    raw_plan = gateway.ask_json(
+        messages,
+        timeout=60.0,
+        schema=PLAN_SCHEMA,
+        task="plan",
+    )
 
     # =========================
     # 3) 系统级裁决与兜底
@@ -18,7 +18,7 @@ Step 3: Sub-goals Generation（子研究目标拆分）
 - Step 3 一般不需要接口化（Orchestrator 内部），但返回结构可直接序列化为 JSON
 
 依赖：
-- core.llm_gateway.LLMGateway：只要求提供 ask_json(messages, timeout=...)
+- core.llm_gateway.LLMGateway：只要求提供 ask_json(messages, timeout=..., schema=..., task=...)
 """
 
 from __future__ import annotations
@@ -29,6 +29,7 @@ import re
 import uuid
 
 from core.llm_gateway import LLMGateway
+from interface_DB.doc_summary import format_doc_summaries
 
 
 # =========================
@@ -121,6 +122,14 @@ plan（已裁决，sections 里包含 section_id/title/intent_hint）：
 """.strip()
 
 
+DOC_SUMMARIES_HINT = "知识库文献摘要（仅用于确定检索方向与措辞，query_hints 尽量使用其中的术语）："
+
+
+SUBGOALS_SCHEMA = {
+    "sub_goals": list,
+}
+
+
 # =========================
 # 2) 对外数据结构（可序列化）
 # =========================
@@ -177,24 +186,32 @@ def _ask_llm_for_subgoals(
     plan: Dict[str, Any],
     min_n: int,
     max_n: int,
+    doc_summaries: Optional[List[Dict[str, str]]] = None,
 ) -> Dict[str, Any]:
     """
     调用 LLM 生成候选 sub_goals（仅候选）。
     注意：后续还要经过系统裁决/过滤/规范化。
+    doc_summaries：知识库入库摘要（可选），帮助 query_hints 贴近库内文献的措辞。
     """
+    content = USER_SUBGOAL_DECOMPOSER_INSTRUCTION.format(
+        min_n=min_n,
+        max_n=max_n,
+        requirements_json=requirements,  # 你 gateway.ask_json 里会处理 dict -> str 或由你自己处理
+        plan_json=plan,
+    )
+    summaries_block = format_doc_summaries(doc_summaries)
+    if summaries_block:
+        content += f"\n\n{DOC_SUMMARIES_HINT}\n{summaries_block}"
     messages = [
         {"role": "system", "content": SYSTEM_SUBGOAL_DECOMPOSER},
-        {
-            "role": "user",
-            "content": USER_SUBGOAL_DECOMPOSER_INSTRUCTION.format(
-                min_n=min_n,
-                max_n=max_n,
-                requirements_json=requirements,  # 你 gateway.ask_json 里会处理 dict -> str 或由你自己处理
-                plan_json=plan,
-            ),
-        },
+        {"role": "user", "content": content},
     ]
-    return gateway.ask_json(messages, timeout=60.0)
+    return gateway.ask_json(
+        messages,
+        timeout=60.0,
+        schema=SUBGOALS_SCHEMA,
+        task="subgoals",
+    )
 
 
 # =========================
@@ -270,11 +287,13 @@ def generate_sub_goals(
     min_per_section: int = DEFAULT_MIN_SUBGOALS_PER_SECTION,
     max_per_section: int = DEFAULT_MAX_SUBGOALS_PER_SECTION,
     max_fallback_level: int = DEFAULT_MAX_FALLBACK_LEVEL,
+    doc_summaries: Optional[List[Dict[str, str]]] = None,
 ) -> Dict[str, Any]:
     """
     输入：
       - requirements：Step1 输出（已裁决）
       - plan：Step2 输出（已裁决）
+      - doc_summaries：知识库入库摘要（可选，见 interface_DB/doc_summary.py）
 
     输出（稳定 contract）：
     {
@@ -298,7 +317,7 @@ def generate_sub_goals(
 
     # 1) 先让 LLM 生成候选
     try:
-        raw = _ask_llm_for_subgoals(gateway, requirements, plan, min_per_section, max_per_section)
+        raw = _ask_llm_for_subgoals(gateway, requirements, plan, min_per_section, max_per_section, doc_summaries)
         raw_list = raw.get("sub_goals", [])
         if not isinstance(raw_list, list):
             raw_list = []
@@ -1,6 +1,7 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from core.llm_gateway import LLMGateway
+from interface_DB.doc_summary import format_doc_summaries
 
 # =========================
 # 1) Prompt（Step 4 用于生成更宽泛的表达） 
@@ -40,6 +41,15 @@ USER_INTENT_EXPANDER_INSTRUCTION = """
 """.strip()
 
 
+DOC_SUMMARIES_HINT = "知识库文献摘要（扩展方向应落在这些文献覆盖的范围内，检索词尽量使用其中的术语）："
+
+
+EXPANDED_INTENT_SCHEMA = {
+    "current_intent": str,
+    "query_hints": list,
+}
+
+
 # =========================
 # 2) 核心函数
 # =========================
@@ -48,28 +58,36 @@ def generate_expanded_intent(
     gateway: LLMGateway,
     current_intent: str,
     current_query_hints: List[str],
+    doc_summaries: Optional[List[Dict[str, str]]] = None,
 ) -> Dict[str, Any]:
     """
     输入：
       - current_intent: 当前研究意图
       - current_query_hints: 当前的检索词
+      - doc_summaries: 知识库入库摘要（可选，已缓存，无额外 LLM 调用）
 
     输出：
       - 扩展后的研究意图和检索词
     """
     # 构建输入消息
+    content = USER_INTENT_EXPANDER_INSTRUCTION.format(
+        intent_json=f'{{"current_intent": "{current_intent}", "query_hints": {current_query_hints}}}'
+    )
+    summaries_block = format_doc_summaries(doc_summaries)
+    if summaries_block:
+        content += f"\n\n{DOC_SUMMARIES_HINT}\n{summaries_block}"
     messages = [
         {"role": "system", "content": SYSTEM_INTENT_EXPANDER},
-        {
-            "role": "user",
-            "content": USER_INTENT_EXPANDER_INSTRUCTION.format(
-                intent_json=f'{{"current_intent": "{current_intent}", "query_hints": {current_query_hints}}}'
-            ),
-        },
+        {"role": "user", "content": content},
     ]
 
     # 获取模型的响应
-    expanded_result = gateway.ask_json(messages, timeout=60.0)
+    expanded_result = gateway.ask_json(
+        messages,
+        timeout=60.0,
+        schema=EXPANDED_INTENT_SCHEMA,
+        task="expand",
+    )
 
     # 处理模型返回的结果
     return expanded_result
@@ -1,11 +1,38 @@
 # steps/step4_retrieve.py
 
-from typing import Dict, Any, List
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 from core.retriever_gateway import RetrievalGateway
 from steps.step4_select import run_retrieval_for_subgoal
 from steps.step4_eval import evaluate_evidence_pool
 from steps.step4_replaner import generate_expanded_intent
 from steps.step5_adjudicator import evaluate_subgoal_support_with_llm
+from core.evidence_rerank import get_reranker, rerank_evidence_pool
+from core.doc_text_store import expand_contexts
+from core.query_broker import QueryBroker
+from core.chunk_store import SessionChunkStore
+from core.retrieval_controller import RetrievalController
+
+# Step 5 流水线模式：启发式预判较弱时，意图扩展与 LLM 裁决并发执行（裁决为 sufficient 则丢弃扩展结果）
+STEP4_PIPELINED_EXPANSION = os.getenv("STEP4_PIPELINED_EXPANSION", "0") == "1"
+STEP4_EXPANSION_WORKERS = int(os.getenv("STEP4_EXPANSION_WORKERS", "4"))
+
+_expansion_executor: Optional[ThreadPoolExecutor] = None
+_expansion_lock = threading.Lock()
+
+
+def _get_expansion_executor() -> ThreadPoolExecutor:
+    """进程级单例（各 sub-goal 共用）"""
+    global _expansion_executor
+    with _expansion_lock:
+        if _expansion_executor is None:
+            _expansion_executor = ThreadPoolExecutor(
+                max_workers=STEP4_EXPANSION_WORKERS, thread_name_prefix="step4-expand",
+            )
+        return _expansion_executor
+
 
 def run_step4_for_subgoal(
     *,
@@ -13,32 +40,80 @@ def run_step4_for_subgoal(
     sub_goal: Dict[str, Any],
     kb_ids,
     # aspects: List[str],
-    max_rounds: int = 3,
-    size: int = 10,
+    max_rounds: Optional[int] = None,
+    size: Optional[int] = None,
     coverage_threshold: float = 0.8,
+    doc_summaries: Optional[List[Dict[str, str]]] = None,
+    broker: Optional[QueryBroker] = None,
+    chunk_store: Optional[SessionChunkStore] = None,
+    controller: Optional[RetrievalController] = None,
+    pipelined: bool = STEP4_PIPELINED_EXPANSION,
 ) -> Dict[str, Any]:
     """
     Step 4: Sub-goal Driven Retrieval
     - 仅检索 + 裁决
     - 不写作、不总结、不生成结论
+    - 每轮 size / 是否继续由 RetrievalController 按新增 chunk 决定（size 显式给出时固定）
+    - pipelined=True 时，启发式预判不足的轮次在裁决的同时预先生成扩展意图
     """
 
     trace = []
+    controller = controller or RetrievalController()
+    max_rounds = max_rounds or controller.policy.max_rounds
+    pipeline = {"launched": 0, "used": 0, "discarded": 0}
+
+    def _round_size() -> int:
+        if size is not None:
+            return size
+        queries = sub_goal.get("query_hints") or [sub_goal["current_intent"]]
+        return controller.size_for(len(queries), len(kb_ids))
+
+    def _observe(r: int, retrieval_result: Dict[str, Any], round_size: int) -> Dict[str, Any]:
+        new_pool = retrieval_result["evidence_pool"]
+        return controller.observe(
+            r,
+            contexts=new_pool["contexts"],
+            size=round_size,
+            per_query=new_pool["retrieval_trace"].get("per_query"),
+            saturated=new_pool["retrieval_trace"].get("truncated"),
+        )
+
+    def _rank(pool: Dict[str, Any]) -> Dict[str, Any]:
+        # ===== 本地重排：裁决 / 写作只看最相关的一小部分 =====
+        # pool 本身保留全部候选（下一轮继续合并），ranked_pool 只用于 prompt
+        query_hints = [sub_goal["current_intent"], *sub_goal.get("query_hints", [])]
+        ranked_pool = rerank_evidence_pool(
+            pool,
+            intent=pool.get("intent", ""),
+            query_hints=query_hints,
+            reranker=get_reranker(),
+        )
+        # 命中 chunk 扩展为相邻 chunk 窗口（本地全文缓存，无网络请求）
+        ranked_pool["contexts"] = expand_contexts(
+            ranked_pool["contexts"],
+            intent=pool.get("intent", ""),
+            query_hints=query_hints,
+        )
+        return ranked_pool
     #  ====================步骤4=====================
     for r in range(1, max_rounds + 1):
         print(f"==============================\nStep 4: Round {r} Retrieval")
 
         # ===== Step 4A: Retrieve =====
+        round_size = _round_size()
         retrieval_result = run_retrieval_for_subgoal(
             # gateway=gateway,
             kb_ids=kb_ids,
             sub_goal=sub_goal,
-            size=size,
+            size=round_size,
+            broker=broker,
+            chunk_store=chunk_store,
         )
         # "contexts": result.get("contexts", []),
         # "evidences": result.get("evidences", []),
         # "meta": result.get("meta", {}),
         print(retrieval_result.keys())  # 打印检索结果结构，检查 'evidence_pool' 是否存在
+        retrieval_record = _observe(r, retrieval_result, round_size)
 
         if r == 1 :
             pool = retrieval_result["evidence_pool"]
@@ -79,6 +154,7 @@ def run_step4_for_subgoal(
         trace.append({
             "round": r, # 仅一轮
             "total_chunks": pool.get("meta", {}).get("total_chunks", 0),
+            "retrieval": retrieval_record,
         })
 
         # ===== Step 4B: Evaluate =====
@@ -97,6 +173,10 @@ def run_step4_for_subgoal(
             # }
             break
 
+        # 新增 chunk 过少：再扩展意图 / 检索收益不大，直接进入裁决
+        if retrieval_record["stop"]:
+            break
+
 
 
         # 流程级终止（不在此做 query rewrite）
@@ -106,7 +186,9 @@ def run_step4_for_subgoal(
             current_query_hints = sub_goal["query_hints"]
 
             # 假设 gateway 是已创建的 LLMGateway 实例
-            expanded_intent = generate_expanded_intent(gateway, current_intent, current_query_hints)
+            expanded_intent = generate_expanded_intent(
+                gateway, current_intent, current_query_hints, doc_summaries=doc_summaries,
+            )
 
             print(expanded_intent)
 
@@ -125,20 +207,26 @@ def run_step4_for_subgoal(
     #  ====================步骤4=====================
     #  ====================步骤5=====================
     print("+++++++++++++++++++++++++++")
-    for r in range(11, max_rounds + 11):
+    # 本轮合并后尚未重排时为 None（裁决轮数为 0 / 提前终止），返回前按最终 pool 重排
+    ranked_pool: Optional[Dict[str, Any]] = None
+    for r in range(11, controller.policy.max_adjudication_rounds + 11):
         print(f"==============================\nStep 5: Round {r-10} Evidence Adjudication")
         if r != 11:
             # ===== Step 4A: Retrieve =====
+            round_size = _round_size()
             retrieval_result = run_retrieval_for_subgoal(
                 # gateway=gateway,
                 kb_ids=kb_ids,
                 sub_goal=sub_goal,
-                size=size,
+                size=round_size,
+                broker=broker,
+                chunk_store=chunk_store,
             )
             # "contexts": result.get("contexts", []),
             # "evidences": result.get("evidences", []),
             # "meta": result.get("meta", {}),
             print(retrieval_result.keys())  # 打印检索结果结构，检查 'evidence_pool' 是否存在
+            retrieval_record = _observe(r, retrieval_result, round_size)
 
         # if r == 1 :
         #     pool = retrieval_result["evidence_pool"]
@@ -179,27 +267,61 @@ def run_step4_for_subgoal(
             trace.append({
                 "round": r, # 仅一轮
                 "total_chunks": pool.get("meta", {}).get("total_chunks", 0),
+                "retrieval": retrieval_record,
             })
 
+            # 扩展后的意图几乎没有带来新 chunk：再裁决一次结论不会变，沿用上一轮裁决结果
+            # （本轮新增 chunk 仍在返回前随最终 pool 一起重排）
+            if retrieval_record["stop"]:
+                ranked_pool = None
+                break
+
         # # ===== Step 4B: Evaluate =====
         # evaluation = evaluate_evidence_pool(
         #     evidence_pool=pool,
         #     # aspects=aspects,
         #     coverage_threshold=coverage_threshold,
         # )
+        ranked_pool = _rank(pool)
+        # ===== 流水线：预判较弱时，扩展意图与裁决并发（最后一轮不预取）=====
+        expansion_future: Optional[Future] = None
+        if (
+            pipelined
+            and r < controller.policy.max_adjudication_rounds + 10
+            and evaluate_evidence_pool(
+                evidence_pool=pool, coverage_threshold=coverage_threshold,
+            )["decision"] != "sufficient"
+        ):
+            expansion_future = _get_expansion_executor().submit(
+                generate_expanded_intent,
+                gateway,
+                sub_goal["current_intent"],
+                list(sub_goal["query_hints"]),
+                doc_summaries=doc_summaries,
+            )
+            pipeline["launched"] += 1
+
         evaluation = evaluate_subgoal_support_with_llm(
             gateway=gateway,
-            sub_goal=pool,
-            retrieval_result=pool,
+            sub_goal=ranked_pool,
+            retrieval_result=ranked_pool,
         )
         print(evaluation)
 
+        # 非 insufficient 时不需要扩展：丢弃预取结果（已开始的调用在后台结束）
+        if expansion_future is not None and evaluation["decision"] != "insufficient":
+            expansion_future.cancel()
+            expansion_future = None
+            pipeline["discarded"] += 1
+
         if evaluation["decision"] == "sufficient":
             return {
                 "status": "completed",
-                "pool": pool,
+                "pool": ranked_pool,
                 "evaluation": evaluation,
                 "trace": trace,
+                "retrieval": controller.summary(),
+                "pipeline": pipeline,
             }
 
 
@@ -211,7 +333,13 @@ def run_step4_for_subgoal(
             current_query_hints = sub_goal["query_hints"]
 
             # 假设 gateway 是已创建的 LLMGateway 实例
-            expanded_intent = generate_expanded_intent(gateway, current_intent, current_query_hints)
+            if expansion_future is not None:
+                expanded_intent = expansion_future.result()
+                pipeline["used"] += 1
+            else:
+                expanded_intent = generate_expanded_intent(
+                    gateway, current_intent, current_query_hints, doc_summaries=doc_summaries,
+                )
 
             print(expanded_intent)
 
@@ -223,11 +351,15 @@ def run_step4_for_subgoal(
 
 
     #  ====================步骤5=====================
+    if ranked_pool is None:
+        ranked_pool = _rank(pool)
     return {
         "status": "unresolved",
-        "pool": pool,
+        "pool": ranked_pool,
         "evaluation": evaluation,
         "trace": trace,
+        "retrieval": controller.summary(),
+        "pipeline": pipeline,
         "reason": "coverage_insufficient",
     }
 
@@ -240,14 +372,18 @@ def run_step4(
     gateway: RetrievalGateway,
     sub_goals: List[Dict[str, Any]],
     # aspect_map: Dict[str, List[str]],
+    doc_summaries: Optional[List[Dict[str, str]]] = None,
 ) -> Dict[str, Any]:
     """
     Step 4（整体）：
     - 对每一个 sub_goal 独立执行证据检索与评估
-    - 不做跨 sub_goal 合并
+    - 不做跨 sub_goal 合并（检索请求经会话级 QueryBroker 去重，结果仍各自归属）
+    - chunk 正文存于会话级 SessionChunkStore，各 pool 只保存引用
     """
 
     results = []
+    broker = QueryBroker()
+    chunk_store = SessionChunkStore()
 
     for sg in sub_goals:
         print("\n\n==============================")
@@ -259,7 +395,12 @@ def run_step4(
             gateway=gateway,
             sub_goal=sg,
             # aspects=aspect_map.get(sg_id, []),
+            doc_summaries=doc_summaries,
+            broker=broker,
+            chunk_store=chunk_store,
         )
+        result["query_broker"] = broker.snapshot(owner=sg_id)
+        print(f"[QUERY BROKER] {sg_id}: {result['query_broker']}")
 
         results.append({
             "sub_goal_id": sg_id,
@@ -271,4 +412,6 @@ def run_step4(
     return {
         "step": "step4",
         "sub_goal_results": results,
+        "query_broker": broker.snapshot(),
+        "chunk_store": chunk_store.snapshot(),
     }
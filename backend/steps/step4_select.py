@@ -2,12 +2,10 @@
 # Step 4A: Sub-goal Retrieval（仅查询，不评估）
 # =========================================================
 
-from typing import Dict, Any, List
-import os
+from typing import Dict, Any, List, Optional
 
-print(os.getcwd())
 # from interface_DB.ragflow import search_list_ragflow
-from tests.test_ragflow_interface import search_list_ragflow
+from interface_DB.ragflow_search import search_list_ragflow
 
 # =========================================================
 # Step 4A: Sub-goal Retrieval（仅查询，不评估）
@@ -18,7 +16,9 @@ def run_retrieval_for_subgoal(
     sub_goal: Dict[str, Any],
     kb_ids:list,
     search_fn = search_list_ragflow,                     # 已绑定权限 / 会话上下文的搜索函数
-    size: int = 10,
+    size: Optional[int] = None,                          # None = search_fn 默认大小
+    broker=None,                                         # 会话级 QueryBroker（可选）
+    chunk_store=None,                                    # 会话级 SessionChunkStore（可选）
 ) -> Dict[str, Any]:
     """
     对单个 sub-goal 执行一次“完整查询”：
@@ -38,10 +38,16 @@ def run_retrieval_for_subgoal(
     # - 权限控制下的 KB 选择
     # - adapter 统一
     # print(queries)
+    # broker 非空时跨 sub-goal 去重，按 sub_goal_id 记账
+    extra = {"broker": broker, "owner": sub_goal_id} if broker is not None else {}
+    # chunk_store 非空时 contexts / evidences 为共享正文的引用记录
+    if chunk_store is not None:
+        extra["chunk_store"] = chunk_store
     result = search_fn(
         kb_ids=kb_ids,
         query_hints=queries,
         size=size,
+        **extra,
     )
 
     # ---------- 2. 构造 EvidencePool ----------
@@ -59,6 +65,8 @@ def run_retrieval_for_subgoal(
         "retrieval_trace": {
             "queries": queries,
             "total_chunks": result.get("meta", {}).get("total_chunks", 0),
+            "per_query": result.get("meta", {}).get("per_query", {}),
+            "truncated": result.get("meta", {}).get("truncated"),
         }
     }
 
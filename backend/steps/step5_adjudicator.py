@@ -82,6 +82,13 @@ from typing import Dict, Any
 from core.llm_gateway import LLMGateway
 
 
+ADJUDICATION_SCHEMA = {
+    "decision": str,
+    "rationale": str,
+    "confidence": (int, float),
+}
+
+
 # def evaluate_subgoal_support_with_llm(
 #     *,
 #     gateway: LLMGateway,
@@ -187,7 +194,12 @@ def evaluate_subgoal_support_with_llm(
         },
     ]
     # print(messages)
-    result = gateway.ask_json(messages, timeout=60.0)
+    result = gateway.ask_json(
+        messages,
+        timeout=60.0,
+        schema=ADJUDICATION_SCHEMA,
+        task="adjudicate",
+    )
 
     return {
         "decision": result.get("decision"),
@@ -66,6 +66,11 @@ USER_EVIDENCE_BOUND_WRITER = """
 # 2) 核心函数
 # =========================
 
+PARAGRAPH_SCHEMA = {
+    "content": str,
+}
+
+
 def write_evidence_bound_paragraph(
     gateway: LLMGateway,
     section_title: str,
@@ -109,7 +114,12 @@ def write_evidence_bound_paragraph(
     ]
 
     # -------- 3. 按 Step2 规范调用 Gateway --------
-    result = gateway.ask_json(messages, timeout=timeout)
+    result = gateway.ask_json(
+        messages,
+        timeout=timeout,
+        schema=PARAGRAPH_SCHEMA,
+        task="draft",
+    )
 
     paragraph_text = result.get("content", "").strip()
 
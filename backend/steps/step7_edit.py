@@ -168,7 +168,8 @@ from core.llm_gateway import LLMGateway
 
 from core.llm_gateway import build_qwen_gateway_from_env
 from steps.step6_draft import write_evidence_bound_paragraph,generate_paragraphs_for_sub_goals
-from utils.pickle_csp import load_result,save_result,pretty
+from utils.pickle_csp import pretty
+from utils.step_cache import load_result,save_result
 
 SYSTEM_GLOBAL_EDITOR = """
 你是“全局学术编辑器（Global Academic Editor）”。
@@ -269,6 +270,7 @@ def run_step7_global_edit(
     requirements: Dict[str, Any],
     plan: Dict[str, Any],
     draft_paragraphs: List[Dict[str, Any]],
+    mode: str = "single",
 ) -> Dict[str, Any]:
     """
     Step 7: 全局整合与风格统一（不新增内容）
@@ -277,10 +279,20 @@ def run_step7_global_edit(
       - requirements：Step1 的初步研究需求
       - plan：Step2 生成并裁决后的研究结构
       - draft_paragraphs：Step6 生成的小段草稿列表
+      - mode："single"（整篇一次调用）| "map_reduce"（按章节并发编辑）
 
     输出：
       - final_markdown_doc
     """
+    if mode == "map_reduce":
+        return run_step7_map_reduce_edit(
+            gateway=gateway,
+            requirements=requirements,
+            plan=plan,
+            draft_paragraphs=draft_paragraphs,
+        )
+    if mode != "single":
+        raise ValueError(f"Unknown step7 edit mode: {mode}")
 
     # -------- 1. 章节结构序列化 --------
     sections_outline = []
@@ -320,6 +332,8 @@ def run_step7_global_edit(
     result = gateway.ask_json(
         messages=messages,
         timeout=120.0,
+        schema={"markdown": str},
+        task="edit",
     )
     markdown_text = result["markdown"]
     return {
@@ -328,6 +342,263 @@ def run_step7_global_edit(
         "content": markdown_text.strip(),
     }
 
+
+# =========================================================
+# Step 7（map-reduce 模式）：按章节并发编辑 + 轻量终稿拼接
+# =========================================================
+# 单次整篇编辑的耗时随报告长度线性增长，长报告容易截断或超时。
+# map 阶段：每个章节只带本章草稿与本章上下文，并发编辑；
+# reduce 阶段：只把章节标题与节选交给 LLM，生成全文标题与概述段落，
+# 章节正文由系统按研究结构顺序拼接，不再回传整篇文档。
+
+SYSTEM_SECTION_EDITOR = """
+你是“章节学术编辑器（Section Academic Editor）”。
+
+你的任务是对【某一个章节】的分段草稿进行整合与编辑，
+输出该章节的 Markdown 正文。
+
+你必须遵守以下规则：
+1. 只能使用输入草稿中已经存在的内容
+2. 不得引入任何新的事实、结论、数据或观点
+3. 允许对已有内容进行重排、合并、压缩或语言统一
+4. 不删除已有的实质性段落内容
+5. 统一学术写作风格，保持章节内部逻辑连贯
+6. 不要输出章节标题（章节标题由系统添加），如需小节标题使用 `###`
+7. 不要出现 S1 / SG- 等系统标识，不得保留任何方括号标记
+8. 不得使用 ``` 或任何代码块包裹输出
+
+输出必须是严格 JSON，格式如下（字段不可增减）：
+
+{
+  "markdown": "<本章节 Markdown 正文>"
+}
+""".strip()
+
+
+USER_SECTION_EDITOR = """
+【用户研究目标】
+- 主题：{topic}
+- 研究目标：{goal}
+- 目标读者：{audience}
+- 深度要求：{depth}
+- 语言：{language}
+
+【当前章节】
+- 标题：{section_title}
+- 章节意图：{intent_hint}
+
+【本章节的段落草稿（请勿新增内容）】
+{draft_paragraphs}
+""".strip()
+
+
+SYSTEM_DOC_FINALIZER = """
+你是“全局学术编辑器（Global Academic Editor）”。
+
+各章节正文已经编辑完成，你只需要：
+1. 给出全文标题：使用研究主题或研究目标中的表述，不得自行扩展含义
+2. 撰写一个【概述段落】：
+   - 仅概括全文的章节结构与各章节已有内容
+   - 不得引入新的事实或结论
+   - 语气为中性、综述性说明
+
+输出必须是严格 JSON，格式如下（字段不可增减）：
+
+{
+  "title": "<全文标题，不含 # 号>",
+  "overview": "<概述段落>"
+}
+""".strip()
+
+
+USER_DOC_FINALIZER = """
+【用户研究目标】
+- 主题：{topic}
+- 研究目标：{goal}
+- 目标读者：{audience}
+- 语言：{language}
+
+【各章节标题与正文节选（按顺序）】
+{section_digests}
+""".strip()
+
+
+# reduce 阶段每个章节只送节选，保证终稿调用的输入长度与报告总长度无关
+SECTION_DIGEST_CHARS = 300
+
+
+def _group_drafts_by_section(
+    plan: Dict[str, Any],
+    draft_paragraphs: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    按研究结构顺序把草稿段落归入章节：
+    - 跳过无正文的段落（Step 6 skipped）
+    - 不在 plan 中的 parent_section_id 追加在末尾，保证内容不丢
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for sec in plan.get("sections", []):
+        groups[sec["section_id"]] = {
+            "section_id": sec["section_id"],
+            "title": sec.get("title", ""),
+            "intent_hint": sec.get("intent_hint", ""),
+            "paragraphs": [],
+        }
+
+    for p in draft_paragraphs:
+        if not (p.get("content") or "").strip():
+            continue
+        sid = p.get("parent_section_id") or ""
+        if sid not in groups:
+            groups[sid] = {
+                "section_id": sid,
+                "title": p.get("section_title", ""),
+                "intent_hint": "",
+                "paragraphs": [],
+            }
+        groups[sid]["paragraphs"].append(p)
+
+    return [g for g in groups.values() if g["paragraphs"]]
+
+
+def _edit_section(
+    gateway: LLMGateway,
+    requirements: Dict[str, Any],
+    section: Dict[str, Any],
+    timeout: float,
+) -> str:
+    """
+    map：单章节编辑，只携带本章草稿与本章上下文
+    """
+    draft_text = "\n\n".join(
+        f"[{p['sub_goal_id']} | {p['section_title']}]\n{p['content']}"
+        for p in section["paragraphs"]
+    )
+    messages = [
+        {"role": "system", "content": SYSTEM_SECTION_EDITOR},
+        {
+            "role": "user",
+            "content": USER_SECTION_EDITOR.format(
+                topic=requirements.get("topic"),
+                goal=requirements.get("goal"),
+                audience=requirements.get("audience"),
+                depth=requirements.get("depth"),
+                language=requirements.get("language"),
+                section_title=section["title"],
+                intent_hint=section["intent_hint"],
+                draft_paragraphs=draft_text,
+            ),
+        },
+    ]
+    result = gateway.ask_json(
+        messages=messages,
+        timeout=timeout,
+        schema={"markdown": str},
+        task="edit",
+    )
+    return (result.get("markdown") or "").strip()
+
+
+def _finalize_document(
+    gateway: LLMGateway,
+    requirements: Dict[str, Any],
+    sections: List[Dict[str, Any]],
+    timeout: float,
+) -> Dict[str, str]:
+    """
+    reduce：只根据章节标题与节选生成全文标题与概述段落
+    """
+    digests = "\n\n".join(
+        f"## {sec['title']}\n{sec['markdown'][:SECTION_DIGEST_CHARS]}"
+        for sec in sections
+    )
+    messages = [
+        {"role": "system", "content": SYSTEM_DOC_FINALIZER},
+        {
+            "role": "user",
+            "content": USER_DOC_FINALIZER.format(
+                topic=requirements.get("topic"),
+                goal=requirements.get("goal"),
+                audience=requirements.get("audience"),
+                language=requirements.get("language"),
+                section_digests=digests,
+            ),
+        },
+    ]
+    result = gateway.ask_json(
+        messages=messages,
+        timeout=timeout,
+        schema={"title": str, "overview": str},
+        task="edit",
+    )
+    return {
+        "title": (result.get("title") or "").strip().lstrip("#").strip(),
+        "overview": (result.get("overview") or "").strip(),
+    }
+
+
+def run_step7_map_reduce_edit(
+    gateway: LLMGateway,
+    requirements: Dict[str, Any],
+    plan: Dict[str, Any],
+    draft_paragraphs: List[Dict[str, Any]],
+    *,
+    max_workers: int = 4,
+    section_timeout: float = 60.0,
+    finalize_timeout: float = 60.0,
+) -> Dict[str, Any]:
+    """
+    Step 7（map-reduce）：章节级并发编辑 + 终稿拼接
+
+    - map：各章节并发调用 LLM，墙钟时间取决于最长章节而非全文
+    - reduce：一次短调用生成标题与概述，章节正文由系统拼接
+    - 单章节失败时回退为该章原始草稿，不影响其他章节
+
+    输出 contract 与 run_step7_global_edit 一致
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    sections = _group_drafts_by_section(plan, draft_paragraphs)
+
+    # -------- 1. map：章节并发编辑 --------
+    def _edit_or_fallback(section: Dict[str, Any]) -> str:
+        try:
+            markdown = _edit_section(gateway, requirements, section, section_timeout)
+            if markdown:
+                return markdown
+        except Exception as e:
+            print(f"[STEP7 SECTION FAILED] section_id={section['section_id']} error={e}")
+        return "\n\n".join(p["content"].strip() for p in section["paragraphs"])
+
+    if sections:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sections)))) as pool:
+            edited = list(pool.map(_edit_or_fallback, sections))
+        for sec, markdown in zip(sections, edited):
+            sec["markdown"] = markdown
+
+    # -------- 2. reduce：标题与概述 --------
+    try:
+        header = _finalize_document(gateway, requirements, sections, finalize_timeout)
+    except Exception as e:
+        print(f"[STEP7 FINALIZE FAILED] error={e}")
+        header = {"title": "", "overview": ""}
+    title = header["title"] or (requirements.get("topic") or "").strip()
+
+    # -------- 3. 拼接（系统负责结构，保证章节顺序与标题） --------
+    blocks = []
+    if title:
+        blocks.append(f"# {title}")
+    if header["overview"]:
+        blocks.append(header["overview"])
+    for sec in sections:
+        blocks.append(f"## {sec['title']}\n{sec['markdown']}")
+
+    return {
+        "status": "completed",
+        "format": "markdown",
+        "content": "\n\n".join(blocks).strip(),
+    }
+
 if __name__ == "__main__":
     # gateway = LLMGateway()
     # result = load_result("cache/step4se_result.pkl")
@@ -340,7 +611,7 @@ if __name__ == "__main__":
     # )
     # save_result(paragraphs, "cache/step6_test_paragraphs.pkl")
 
-    step1_requirements = load_result("cache/step1_requirements.pkl")
+    step1_requirements = load_result("cache/step1_requirements.jsonl.gz")
     # pretty(step1_requirements)
     step1_little = {
         "goal": step1_requirements["goal"],
@@ -356,7 +627,7 @@ if __name__ == "__main__":
     print()
     print()
     print()
-    step2_plan = load_result("cache/step2_plan.pkl")
+    step2_plan = load_result("cache/step2_plan.jsonl.gz")
     step2_little = {
         "sections": step2_plan["sections"],
         "assumptions": step2_plan["assumptions"],
@@ -367,7 +638,7 @@ if __name__ == "__main__":
     print()
     print()
     print()
-    step3_subgoals = load_result("cache/step3_subgoals.pkl")
+    step3_subgoals = load_result("cache/step3_subgoals.jsonl.gz")
     step3_little = {
         "sub_goals": step3_subgoals["sub_goals"],
     }
@@ -378,7 +649,7 @@ if __name__ == "__main__":
     print()
     print()
 
-    step6_paragraphs = load_result("cache/step6_paragraphs.pkl")
+    step6_paragraphs = load_result("cache/step6_paragraphs.jsonl.gz")
     gateway = build_qwen_gateway_from_env()
     pretty(step6_paragraphs)
     ress = run_step7_global_edit(
@@ -393,7 +664,7 @@ if __name__ == "__main__":
     print()
     print()
     pretty(ress["content"])
-    save_result(ress, "cache/step7_final_doc.pkl")
+    save_result(ress, "cache/step7_final_doc.jsonl.gz")
     # for paragraph in paragraphs:
     #     print("\n=== Generated Paragraph ===\n")
     #     for i in paragraph.keys():
@@ -0,0 +1,28 @@
+# tests/conftest.py
+"""
+测试统一使用嵌入式 SQLite（每次 pytest 会话一个临时库）
+
+interface_DB.MySQL_db 在导入时按 DB_BACKEND 建 engine，所以环境变量在 conftest 导入时
+（早于收集任何测试模块）强制设置，不受开发者 shell 中 DB_BACKEND=mysql 等配置影响。
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_SQLITE_DIR = tempfile.mkdtemp(prefix="deepresearch-test-")
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(_SQLITE_DIR, "test.db")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def sqlite_db():
+    """建表一次，会话结束删除临时库；返回库文件路径"""
+    from interface_DB.MySQL_db import engine, init_db
+
+    init_db()
+    yield os.environ["SQLITE_PATH"]
+    engine.dispose()
+    shutil.rmtree(_SQLITE_DIR, ignore_errors=True)
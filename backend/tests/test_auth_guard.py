@@ -0,0 +1,90 @@
+# tests/test_auth_guard.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from interface_DB.auth_guard import (
+    HashPoolBusyError,
+    LoginThrottle,
+    LoginThrottledError,
+    PasswordHasher,
+    parse_trusted_proxies,
+    resolve_client_ip,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_user_locked_after_repeated_failures_and_unlocks():
+    clock = Clock()
+    throttle = LoginThrottle(max_failures_per_user=3, max_failures_per_ip=100, window=60, lockout=30, clock=clock)
+
+    for _ in range(3):
+        throttle.check("Alice", "1.1.1.1")
+        throttle.record_failure("Alice", "1.1.1.1")
+
+    with pytest.raises(LoginThrottledError) as exc:
+        throttle.check("alice", "2.2.2.2")
+    assert exc.value.retry_after == 30
+    # 其他用户不受影响
+    throttle.check("bob", "1.1.1.1")
+
+    clock.now += 31
+    throttle.check("alice", "1.1.1.1")
+
+
+def test_failures_outside_window_do_not_lock():
+    clock = Clock()
+    throttle = LoginThrottle(max_failures_per_user=2, window=10, lockout=30, clock=clock)
+    throttle.record_failure("u", None)
+    clock.now += 11
+    throttle.record_failure("u", None)
+    throttle.check("u", None)
+
+
+def test_hash_pool_rejects_when_full_and_offloads_work():
+    release = threading.Event()
+
+    def slow_hash(password):
+        release.wait(5)
+        return f"h:{password}"
+
+    hasher = PasswordHasher(slow_hash, lambda p, h: h == f"h:{p}", max_workers=1, max_pending=1)
+
+    async def main():
+        first = asyncio.create_task(hasher.hash("a"))
+        second = asyncio.create_task(hasher.hash("b"))
+        await asyncio.sleep(0.05)
+        # 事件循环未被阻塞，且第三个请求因排队已满被拒绝
+        with pytest.raises(HashPoolBusyError):
+            await hasher.hash("c")
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(main()) == ["h:a", "h:b"]
+    assert asyncio.run(hasher.verify("a", "h:a"))
+    stats = hasher.snapshot()
+    assert stats["hash_calls"] == 2 and stats["verify_calls"] == 1 and stats["rejected"] == 1
+
+
+def test_client_ip_taken_from_forwarded_for_only_behind_trusted_proxy():
+    trusted = parse_trusted_proxies("10.0.0.0/8, 127.0.0.1")
+
+    # LB 后：右往左跳过可信代理
+    assert resolve_client_ip("10.0.0.5", "203.0.113.7, 10.0.0.9", trusted) == "203.0.113.7"
+    # 客户端伪造的最左值不被采用
+    assert resolve_client_ip("10.0.0.5", "1.2.3.4, 198.51.100.2", trusted) == "198.51.100.2"
+    # 直连（非可信代理）时忽略请求头
+    assert resolve_client_ip("198.51.100.9", "1.2.3.4", trusted) == "198.51.100.9"
+    assert resolve_client_ip("10.0.0.5", None, trusted) == "10.0.0.5"
+    # 未配置代理：保持按直连地址
+    assert resolve_client_ip("10.0.0.5", "203.0.113.7", parse_trusted_proxies("")) == "10.0.0.5"
@@ -0,0 +1,55 @@
+import pickle
+
+from core.chunk_store import ChunkRef, SessionChunkStore
+from core.doc_text_store import DocTextStore, ChunkText, expand_contexts
+from core.evidence_rerank import LexicalReranker, rerank_contexts
+
+
+def test_refs_share_text_and_behave_like_dicts():
+    store = SessionChunkStore()
+    a = store.context(text="桡骨远端骨折 康复", source="a.pdf", doc_id="d1", chunk_id="c1")
+    b = store.context(text="桡骨远端骨折 康复", source="a.pdf", doc_id="d1", chunk_id="c1")
+    ev = store.evidence(
+        text="桡骨远端骨折 康复", doc_name="a.pdf", doc_id="d1", chunk_id="c1",
+        hit_count=2, similarity=0.9, vector_similarity=0.8,
+    )
+    assert a.key == b.key == ev.key
+    assert store.snapshot()["chunks"] == 1
+    assert a["text"] == "桡骨远端骨折 康复" and a.get("source") == "a.pdf"
+    assert dict(a) == {"text": "桡骨远端骨折 康复", "source": "a.pdf", "doc_id": "d1", "chunk_id": "c1"}
+    assert ev["excerpt"] == "桡骨远端骨折 康复" and ev["hit_count"] == 2
+
+    scored = a.replace(rerank_score=0.5)
+    assert isinstance(scored, ChunkRef) and scored.key == a.key and scored["rerank_score"] == 0.5
+    window = a.replace(text="前文\n桡骨远端骨折 康复", expanded=True)
+    assert window.key != a.key and a["text"] == "桡骨远端骨折 康复"
+
+
+def test_pickle_stores_each_text_once():
+    store = SessionChunkStore()
+    text = "桡骨远端骨折合并腕骨骨折的发病率。" * 50
+    pools = [
+        {"contexts": [store.context(text=text, source="a.pdf", chunk_id="c1")]}
+        for _ in range(5)
+    ]
+    plain = [{"contexts": [{"text": text + str(i), "source": "a.pdf"}]} for i in range(5)]
+    restored = pickle.loads(pickle.dumps(pools))
+    assert restored[3]["contexts"][0]["text"] == text
+    assert len(pickle.dumps(pools)) * 3 < len(pickle.dumps(plain))
+
+
+def test_rerank_and_expand_keep_references(tmp_path):
+    store = SessionChunkStore()
+    contexts = [
+        store.context(text="腕骨骨折 康复 训练", source="a.pdf", doc_id="d1", chunk_id="c2"),
+        store.context(text="无关 内容", source="b.pdf", doc_id="d2", chunk_id="x1"),
+    ]
+    kept, _ = rerank_contexts(contexts, intent="腕骨骨折康复", query_hints=[], reranker=LexicalReranker())
+    assert all(isinstance(c, ChunkRef) for c in kept)
+
+    text_store = DocTextStore(str(tmp_path))
+    text_store.write("d1", [ChunkText("c1", "腕骨骨折 术后"), ChunkText("c2", "腕骨骨折 康复 训练")])
+    expanded = expand_contexts(kept, intent="腕骨骨折", query_hints=[], store=text_store)
+    hit = next(c for c in expanded if c["chunk_id"] == "c2")
+    assert isinstance(hit, ChunkRef) and hit["expanded"] is True
+    assert hit["text"].startswith("腕骨骨折 术后")
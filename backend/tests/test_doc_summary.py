@@ -0,0 +1,62 @@
+# tests/test_doc_summary.py
+"""
+入库摘要：生成一次、内容不变不重复生成、同内容文档直接复用（SQLite 后端）
+"""
+
+from core.doc_text_store import ChunkText, DocTextStore
+from interface_DB.MySQL_db import SessionLocal
+
+
+class FakeGateway:
+    def __init__(self):
+        self.calls = []
+
+    def ask_json(self, messages, **kwargs):
+        self.calls.append(kwargs)
+        return {"summary": "桡骨远端骨折合并腕骨骨折的回顾性研究。", "keywords": ["桡骨远端骨折", "腕骨骨折"]}
+
+
+def test_summaries_are_generated_once_per_content_hash(tmp_path):
+    from interface_DB.MySQL_user import User
+    from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+    from interface_DB.MySQL_document import Document
+    from interface_DB.doc_summary import DocumentSummarizer, format_doc_summaries, get_summaries_for_datasets
+
+    db = SessionLocal()
+    try:
+        user = User(username="summary_user", password_hash="x")
+        db.add(user)
+        db.commit()
+        ks = KnowledgeSpace(name="ks", owner_id=user.id, ragflow_knowledge_id="ds-summary")
+        db.add(ks)
+        db.commit()
+        docs = [
+            Document(knowledge_space_id=ks.id, filename=f"f{i}.pdf", storage_uri="x",
+                     ragflow_document_id=f"rf{i}", content_hash="h" * 64, status="parsed")
+            for i in range(2)
+        ]
+        db.add_all(docs)
+        db.commit()
+        ids = [d.id for d in docs]
+    finally:
+        db.close()
+
+    store = DocTextStore(str(tmp_path))
+    store.write("rf0", [ChunkText("c0", "桡骨远端骨折合并腕骨骨折的发病率及危险因素分析", page=1)])
+    gateway = FakeGateway()
+    summarizer = DocumentSummarizer(gateway_factory=lambda: gateway, text_store=store)
+
+    assert summarizer.summarize(ids[0]) == "generated"
+    assert summarizer.summarize(ids[0]) == "skipped"
+    assert summarizer.summarize(ids[1]) == "reused"
+    assert len(gateway.calls) == 1 and gateway.calls[0]["task"] == "summarize"
+
+    db = SessionLocal()
+    try:
+        summaries = get_summaries_for_datasets(db, ragflow_dataset_ids=["ds-summary"])
+    finally:
+        db.close()
+    assert [s["filename"] for s in summaries] == ["f1.pdf", "f0.pdf"]
+    assert "关键词：桡骨远端骨折、腕骨骨折" in summaries[0]["summary"]
+    assert format_doc_summaries(summaries).startswith("- 《f1.pdf》：")
+    summarizer.shutdown()
@@ -0,0 +1,43 @@
+# tests/test_doc_text_store.py
+
+from core.doc_text_store import ChunkText, DocTextStore, expand_contexts
+
+
+CHUNKS = [
+    ChunkText("c0", "摘要：本研究回顾桡骨远端骨折病例。", page=1),
+    ChunkText("c1", "医院简介与伦理审批说明。", page=1),
+    ChunkText("c2", "结果：术后 6 周 DASH 评分明显改善。", page=2),
+    ChunkText("c3", "DASH 评分与握力呈正相关。", page=2),
+    ChunkText("c4", "参考文献列表。", page=3),
+]
+
+
+def test_write_and_window_reads_neighbours_locally(tmp_path):
+    store = DocTextStore(str(tmp_path))
+    assert store.write("abcd1234", CHUNKS) == 5
+
+    assert store.window("abcd1234", "c2", radius=1) == "医院简介与伦理审批说明。\n结果：术后 6 周 DASH 评分明显改善。\nDASH 评分与握力呈正相关。"
+    assert store.window("abcd1234", "c2", radius=1, same_page=True) == "结果：术后 6 周 DASH 评分明显改善。\nDASH 评分与握力呈正相关。"
+    # 相邻 chunk 需与目标词重叠；不连续处用省略号连接
+    assert store.window("abcd1234", "c2", radius=2, query_terms={"骨折"}) == "摘要：本研究回顾桡骨远端骨折病例。\n……\n结果：术后 6 周 DASH 评分明显改善。"
+    assert store.window("abcd1234", "missing") is None
+    assert store.window("other", "c2") is None
+
+
+def test_expand_contexts_uses_store_and_skips_unknown(tmp_path):
+    store = DocTextStore(str(tmp_path))
+    store.write("abcd1234", CHUNKS)
+    contexts = [
+        {"text": "结果：术后 6 周 DASH 评分明显改善。", "source": "a.pdf", "doc_id": "abcd1234", "chunk_id": "c2"},
+        {"text": "旧格式 context", "source": "b.pdf"},
+    ]
+
+    out = expand_contexts(contexts, intent="DASH 评分", query_hints=["握力"], store=store)
+
+    assert out[0]["expanded"] is True
+    assert out[0]["text"].endswith("DASH 评分与握力呈正相关。")
+    assert "医院简介" not in out[0]["text"]
+    assert out[1] is contexts[1]
+
+    store.delete("abcd1234")
+    assert not store.has("abcd1234")
@@ -0,0 +1,113 @@
+# tests/test_evidence_rerank.py
+
+from collections import Counter
+
+from core.evidence_rerank import LexicalReranker, mmr_select, rerank_contexts, rerank_evidence_pool, tokenize
+
+
+CONTEXTS = [
+    {"text": "本院手术室的排班制度与护理人员管理流程。", "source": "管理规范.pdf"},
+    {"text": "桡骨远端骨折术后康复，DASH 评分与握力明显改善。", "source": "桡骨远端骨折康复.pdf"},
+    {"text": "腕关节活动度在康复训练 6 周后恢复至健侧 80%。", "source": "腕关节康复训练.pdf"},
+    {"text": "医院食堂的供餐时间调整通知。", "source": "通知.pdf"},
+]
+
+
+def test_tokenize_mixes_cjk_bigrams_and_latin_words():
+    assert tokenize("PM2.5 炎症") == ["pm2.5", "炎症"]
+    assert tokenize("骨折术后") == ["骨折", "折术", "术后"]
+
+
+def test_lexical_reranker_prefers_on_topic_chunks_and_trims():
+    kept, stats = rerank_contexts(
+        CONTEXTS,
+        intent="桡骨远端骨折 康复效果评估",
+        query_hints=["DASH 评分 握力", "腕关节 活动度 康复"],
+        reranker=LexicalReranker(),
+        top_k=3,
+        min_keep=1,
+    )
+
+    assert kept[0]["source"] == "桡骨远端骨折康复.pdf"
+    assert {c["source"] for c in kept} == {"桡骨远端骨折康复.pdf", "腕关节康复训练.pdf"}
+    assert all("rerank_score" in c for c in kept)
+    assert stats["candidates"] == 4 and stats["kept"] == 2
+    assert stats["chars_after"] < stats["chars_before"]
+
+
+def test_failing_reranker_keeps_original_pool():
+    class Broken:
+        name = "broken"
+
+        def score(self, **kwargs):
+            raise RuntimeError("model not installed")
+
+    pool = {"intent": "x", "contexts": CONTEXTS, "evidences": [{"chunk_id": "c1"}], "meta": {"docs_hit": 4}}
+    ranked = rerank_evidence_pool(pool, intent="x", query_hints=[], reranker=Broken())
+
+    assert [c["text"] for c in ranked["contexts"]] == [c["text"] for c in CONTEXTS]
+    assert ranked["evidences"] == pool["evidences"]
+    assert ranked["meta"]["docs_hit"] == 4 and ranked["meta"]["rerank"]["reranker"] == "none"
+    assert "rerank" not in pool["meta"]
+
+
+def test_mmr_caps_per_document_and_prefers_novel_chunks():
+    long_pdf = [
+        {"text": f"桡骨远端骨折 康复 评分 第{i}节", "source": "long.pdf"} for i in range(5)
+    ]
+    others = [
+        {"text": "腕关节 活动度 训练 结果", "source": "b.pdf"},
+        {"text": "握力 恢复 随访 数据", "source": "c.pdf"},
+    ]
+    passages = long_pdf + others
+    relevance = [1.0, 0.98, 0.97, 0.96, 0.95, 0.6, 0.5]
+
+    picked = mmr_select(passages, relevance, top_k=5, mmr_lambda=0.7, max_per_doc=2)
+
+    sources = [passages[i]["source"] for i in picked]
+    assert picked[0] == 0
+    assert sources.count("long.pdf") == 2
+    assert {"b.pdf", "c.pdf"} <= set(sources)
+    assert len(picked) == 4  # 其余候选全部受单文档上限限制
+
+
+def test_adapter_sources_and_per_doc_cap_follow_each_chunk():
+    from interface_DB.MySQL_db import SessionLocal
+    from interface_DB.MySQL_document_crud import create_document
+    from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+    from interface_DB.MySQL_user import User
+    from interface_DB.ragflow_search import RAGFlowAdapter
+
+    db = SessionLocal()
+    try:
+        user = User(username="rerank_adapter_user", password_hash="x")
+        db.add(user)
+        db.commit()
+        ks = KnowledgeSpace(name="rerank", owner_id=user.id)
+        db.add(ks)
+        db.commit()
+        for name in ("a", "b", "c"):
+            doc = create_document(db, knowledge_space_id=ks.id, filename=f"{name}.pdf", file_type="pdf",
+                                  storage_uri="x", uploaded_by=user.id)
+            doc.ragflow_document_id = f"rf-rerank-{name}"
+            db.commit()
+    finally:
+        db.close()
+
+    chunks = [
+        {"id": f"{name}{i}", "document_id": f"rf-rerank-{name}", "similarity": 0.9 - 0.01 * i,
+         "content": f"桡骨远端骨折 康复 {name} 第{i}段"}
+        for name in ("a", "b", "c") for i in range(4)
+    ]
+    result = RAGFlowAdapter(max_contexts=20).adapt(chunks)
+
+    assert {c["chunk_id"][0] + ".pdf" for c in result["contexts"]} == {c["source"] for c in result["contexts"]}
+    assert result["meta"]["docs_hit"] == 3
+
+    kept, stats = rerank_contexts(
+        result["contexts"], intent="桡骨远端骨折 康复", query_hints=[],
+        reranker=LexicalReranker(), top_k=9, min_keep=1, max_per_doc=3,
+    )
+    assert stats["docs_before"] == 3 and stats["docs_after"] == 3
+    assert len(kept) == 9
+    assert max(Counter(c["doc_id"] for c in kept).values()) == 3
@@ -0,0 +1,35 @@
+# tests/test_import_profile.py
+
+import os
+
+from utils.import_profile import find_lazy_violations, parse_importtime, profile_imports
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       212 |        212 |     beartype.claw
+import time:      1393 |      89408 |   requests
+import time:      1998 |     263905 |   ragflow_sdk
+import time:     35535 |    1506615 | inter_face
+"""
+
+
+def test_parse_importtime_reads_depth_and_times():
+    timings = parse_importtime(SAMPLE)
+
+    assert [t.module for t in timings] == ["beartype.claw", "requests", "ragflow_sdk", "inter_face"]
+    assert [t.depth for t in timings] == [2, 1, 1, 0]
+    assert timings[-1].cumulative_us == 1506615
+    assert find_lazy_violations(timings) == ["ragflow_sdk"]
+
+
+def test_api_import_does_not_load_heavy_sdks_or_tests(tmp_path):
+    timings = profile_imports(
+        "inter_face",
+        env={"DB_BACKEND": "sqlite", "SQLITE_PATH": str(tmp_path / "dr.db")},
+        cwd=BACKEND_DIR,
+    )
+
+    assert any(t.module == "inter_face" for t in timings)
+    assert find_lazy_violations(timings) == []
@@ -0,0 +1,167 @@
+# tests/test_llm_admission.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.llm_gateway import LLMAdmissionController, LLMAdmissionTimeoutError, LLMGateway, TokenBucket
+
+
+def _run_contended(controller, requests):
+    """
+    先占满令牌桶，再按顺序排队 requests=[(priority, user_id), ...]，
+    返回实际放行顺序。
+    """
+    controller.acquire(priority="clarify", user_id="warmup")
+    order = []
+    threads = []
+    for priority, user_id in requests:
+        queued_before = controller.snapshot()["priorities"][priority]["queued"]
+
+        def _worker(p=priority, u=user_id):
+            controller.acquire(priority=p, user_id=u)
+            order.append((p, u))
+
+        t = threading.Thread(target=_worker)
+        t.start()
+        threads.append(t)
+        # 保证入队顺序确定
+        while controller.snapshot()["priorities"][priority]["queued"] == queued_before:
+            time.sleep(0.001)
+    for t in threads:
+        t.join(timeout=5)
+    return order
+
+
+def test_higher_priority_is_admitted_first():
+    controller = LLMAdmissionController(
+        requests_per_minute=1200,
+        tokens_per_minute=1_000_000,
+        burst_requests=1,
+    )
+    order = _run_contended(controller, [("edit", "a"), ("draft", "a"), ("clarify", "b")])
+    assert order == [("clarify", "b"), ("draft", "a"), ("edit", "a")]
+
+
+def test_same_priority_round_robins_across_users():
+    controller = LLMAdmissionController(
+        requests_per_minute=1200,
+        tokens_per_minute=1_000_000,
+        burst_requests=1,
+    )
+    order = _run_contended(controller, [("draft", "a"), ("draft", "a"), ("draft", "a"), ("draft", "b")])
+    assert [u for _, u in order] == ["a", "b", "a", "a"]
+
+    metrics = controller.snapshot()["priorities"]["draft"]
+    assert metrics["admitted"] == 4
+    assert metrics["queued"] == 0
+    assert metrics["wait_seconds_max"] > 0
+
+
+def test_token_bucket_refills_and_reconciles():
+    now = [0.0]
+    bucket = TokenBucket(capacity=60, refill_per_sec=1, clock=lambda: now[0])
+
+    bucket.consume(60)
+    assert bucket.wait_time(10) == 10
+    now[0] = 10
+    assert bucket.wait_time(10) == 0
+
+    # 实际用量高于预估：补扣后余额可为负，需要更久才能放行
+    bucket.consume(10)
+    bucket.adjust(-20)
+    assert bucket.wait_time(1) == 21
+
+
+def test_gateway_charges_every_call_to_admission():
+    class EchoClient:
+        def complete(self, messages, *, timeout=None):
+            return '{"ok": true}'
+
+    controller = LLMAdmissionController(requests_per_minute=600, tokens_per_minute=1_000_000)
+    gateway = LLMGateway(client=EchoClient(), admission=controller, user_id=7)
+
+    assert gateway.ask_json([{"role": "user", "content": "q"}], priority="adjudicate") == {"ok": True}
+    assert controller.snapshot()["priorities"]["adjudicate"]["admitted"] == 1
+
+
+def test_retries_hedges_and_json_repairs_are_each_admitted():
+    from core.llm_gateway import ResilientLLMClient
+
+    class Unavailable(Exception):
+        status_code = 503
+
+    class ScriptedProvider:
+        def __init__(self, outcomes, delays=()):
+            self.outcomes = list(outcomes)
+            self.delays = list(delays)
+            self.calls = 0
+            self._lock = threading.Lock()
+
+        def complete(self, messages, *, timeout=None, max_tokens=None):
+            with self._lock:
+                idx = self.calls
+                self.calls += 1
+            if idx < len(self.delays):
+                time.sleep(self.delays[idx])
+            outcome = self.outcomes[idx]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+    def admitted(controller):
+        return controller.snapshot()["priorities"]["adjudicate"]["admitted"]
+
+    # 重试：2 次失败 + 1 次成功 = 3 次 provider 请求
+    controller = LLMAdmissionController(requests_per_minute=600, tokens_per_minute=1_000_000)
+    provider = ScriptedProvider([Unavailable(), Unavailable(), '{"ok": true}'])
+    client = ResilientLLMClient(inner=provider, max_retries=2, sleep=lambda s: None)
+    gateway = LLMGateway(client=client, admission=controller)
+    assert gateway.ask_json([{"role": "user", "content": "q"}], priority="adjudicate") == {"ok": True}
+    assert admitted(controller) == provider.calls == 3
+
+    # 对冲：慢请求 + 对冲请求各记一次
+    controller = LLMAdmissionController(requests_per_minute=600, tokens_per_minute=1_000_000)
+    provider = ScriptedProvider(['{"ok": true}', '{"ok": true}'], delays=[0.3, 0])
+    client = ResilientLLMClient(inner=provider, hedge_delay=0.05)
+    gateway = LLMGateway(client=client, admission=controller)
+    assert gateway.ask_json([{"role": "user", "content": "q"}], priority="adjudicate") == {"ok": True}
+    assert admitted(controller) == 2
+
+    # JSON 追问修复：原始请求 + 修复请求
+    controller = LLMAdmissionController(requests_per_minute=600, tokens_per_minute=1_000_000)
+    provider = ScriptedProvider(["not json at all", '{"ok": true}'])
+    gateway = LLMGateway(client=ResilientLLMClient(inner=provider), admission=controller)
+    assert gateway.ask_json([{"role": "user", "content": "q"}], priority="adjudicate") == {"ok": True}
+    assert admitted(controller) == provider.calls == 2
+
+
+def test_queue_wait_is_bounded_and_does_not_block_event_loop():
+    controller = LLMAdmissionController(
+        requests_per_minute=1, tokens_per_minute=1_000_000, burst_requests=1, max_wait=0.2,
+    )
+    controller.acquire(priority="draft", user_id="a")
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        try:
+            with pytest.raises(LLMAdmissionTimeoutError):
+                await asyncio.to_thread(controller.acquire, priority="clarify", user_id="b")
+        finally:
+            task.cancel()
+        return ticks
+
+    # 排队期间事件循环照常运行
+    assert asyncio.run(main()) >= 5
+    metrics = controller.snapshot()["priorities"]["clarify"]
+    assert metrics["timeouts"] == 1 and metrics["queued"] == 0 and metrics["admitted"] == 0
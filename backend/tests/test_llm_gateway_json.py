@@ -0,0 +1,102 @@
+# tests/test_llm_gateway_json.py
+
+import pytest
+
+from core.llm_gateway import (
+    JSONExtractor,
+    JSONSchemaError,
+    LLMGateway,
+    validate_json_schema,
+)
+
+
+class ScriptedClient:
+    """按顺序返回预设输出，并记录每次收到的 messages"""
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.calls = []
+
+    def complete(self, messages, *, timeout=None):
+        self.calls.append(messages)
+        return self.outputs.pop(0)
+
+
+def test_extract_repairs_common_model_mistakes():
+    extractor = JSONExtractor()
+
+    assert extractor.extract('```json\n{"a": 1, "b": [1, 2,],}\n```') == {"a": 1, "b": [1, 2]}
+    assert extractor.extract('{“decision”：“sufficient”，“confidence”：0.8}') == {
+        "decision": "sufficient",
+        "confidence": 0.8,
+    }
+    assert extractor.extract('{"content": "第一行\n第二行"}') == {"content": "第一行\n第二行"}
+    assert extractor.extract('{"content": "他说"你好"。", "x": 1}') == {"content": '他说"你好"。', "x": 1}
+
+
+def test_extract_closes_truncated_output():
+    extractor = JSONExtractor()
+
+    assert extractor.extract('{"markdown": "# 标题\n正文被截') == {"markdown": "# 标题\n正文被截"}
+    assert extractor.extract('{"a": 1, "b": {"c": [1, 2') == {"a": 1, "b": {"c": [1, 2]}}
+    assert extractor.extract('{"a": 1, "b') == {"a": 1, "b": None}
+
+
+def test_extract_without_repair_raises():
+    with pytest.raises(ValueError):
+        JSONExtractor(repair=False).extract('{"a": 1,}')
+
+
+def test_validate_json_schema_reports_missing_and_wrong_types():
+    schema = {"decision": str, "confidence": (int, float), "meta": {"docs": list}}
+
+    validate_json_schema({"decision": "partial", "confidence": 1, "meta": {"docs": []}}, schema)
+
+    with pytest.raises(JSONSchemaError) as exc:
+        validate_json_schema({"decision": 1, "confidence": True, "meta": {}}, schema)
+    message = str(exc.value)
+    assert "decision" in message
+    assert "confidence" in message
+    assert "meta.docs: missing" in message
+
+
+def test_ask_json_uses_fix_followup_before_regenerating():
+    client = ScriptedClient(['{"decision": "sufficient"}', '{"decision": "sufficient", "confidence": 0.9}'])
+    gateway = LLMGateway(client=client)
+
+    result = gateway.ask_json(
+        [{"role": "user", "content": "很长的原始 prompt"}],
+        schema={"decision": str, "confidence": (int, float)},
+    )
+
+    assert result == {"decision": "sufficient", "confidence": 0.9}
+    assert len(client.calls) == 2
+    # 追问修复不携带原 prompt
+    assert "很长的原始 prompt" not in client.calls[1][1]["content"]
+
+
+def test_ask_json_regenerates_after_failed_fix_and_then_gives_up():
+    client = ScriptedClient(["not json", "still not json", '{"ok": true}'])
+    gateway = LLMGateway(client=client)
+    assert gateway.ask_json([{"role": "user", "content": "q"}]) == {"ok": True}
+    assert client.calls[2] == [{"role": "user", "content": "q"}]
+
+    client = ScriptedClient(["x", "x", "x", "x"])
+    gateway = LLMGateway(client=client)
+    with pytest.raises(ValueError):
+        gateway.ask_json([{"role": "user", "content": "q"}])
+    assert len(client.calls) == 4
+
+
+def test_clarify_accepts_partial_requirements_without_repair_calls():
+    from steps.step1_clarify import analyze_requirements
+
+    client = ScriptedClient([
+        '{"goal": null, "topic": "桡骨远端骨折康复", "domain": null, "output_type": null,'
+        ' "audience": null, "depth": null, "language": "zh",'
+        ' "missing_fields": ["goal", "audience"], "ambiguities": [], "next_questions": ["研究目标？"]}'
+    ])
+    req = analyze_requirements(LLMGateway(client), [{"role": "user", "content": "骨折康复"}])
+
+    assert req["goal"] is None and req["missing_fields"] == ["goal", "audience"]
+    assert len(client.calls) == 1
@@ -0,0 +1,76 @@
+# tests/test_llm_resilience.py
+
+import threading
+import time
+
+import pytest
+
+from core.llm_gateway import ResilientLLMClient, is_retryable_error
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FlakyClient:
+    """按顺序执行 outcomes：异常则抛出，字符串则返回；可选每次调用的延迟。"""
+
+    def __init__(self, outcomes, delays=None):
+        self.outcomes = list(outcomes)
+        self.delays = list(delays or [])
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, messages, *, timeout=None, max_tokens=None):
+        with self._lock:
+            idx = self.calls
+            self.calls += 1
+        if idx < len(self.delays):
+            time.sleep(self.delays[idx])
+        outcome = self.outcomes[idx]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def test_is_retryable_error():
+    assert is_retryable_error(_StatusError(503))
+    assert is_retryable_error(_StatusError(429))
+    assert not is_retryable_error(_StatusError(400))
+    assert is_retryable_error(TimeoutError())
+    assert not is_retryable_error(ValueError("bad"))
+
+
+def test_retries_transient_errors_with_backoff():
+    sleeps = []
+    inner = FlakyClient([_StatusError(502), _StatusError(503), "ok"])
+    client = ResilientLLMClient(inner=inner, max_retries=2, backoff_base=0.5, sleep=sleeps.append)
+
+    assert client.complete([{"role": "user", "content": "hi"}]) == "ok"
+    assert inner.calls == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.5 and 0 <= sleeps[1] <= 1.0
+    assert client.snapshot()["retries"] == 2
+
+
+def test_non_retryable_error_is_raised_immediately():
+    inner = FlakyClient([_StatusError(401), "ok"])
+    client = ResilientLLMClient(inner=inner, max_retries=3, sleep=lambda s: None)
+
+    with pytest.raises(_StatusError):
+        client.complete([])
+    assert inner.calls == 1
+    assert client.snapshot()["failures"] == 1
+
+
+def test_hedged_request_wins_when_primary_stalls():
+    inner = FlakyClient(["slow", "fast"], delays=[1.0, 0.0])
+    client = ResilientLLMClient(inner=inner, hedge_delay=0.05)
+
+    t0 = time.monotonic()
+    assert client.complete([]) == "fast"
+    assert time.monotonic() - t0 < 0.5
+    stats = client.snapshot()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
@@ -0,0 +1,55 @@
+# tests/test_llm_routing.py
+
+import pytest
+
+from core.llm_gateway import LLMGateway, LLMRouter, ModelRoute, load_llm_routes
+
+
+class RecordingClient:
+    def __init__(self, name, log, fail=False):
+        self.name = name
+        self.log = log
+        self.fail = fail
+
+    def complete(self, messages, *, timeout=None, max_tokens=None):
+        self.log.append((self.name, timeout, max_tokens))
+        if self.fail:
+            raise ConnectionError(f"{self.name} down")
+        return '{"ok": true}'
+
+
+def _router(log, failing=()):
+    return LLMRouter(
+        default=ModelRoute(model="strong"),
+        client_factory=lambda m: RecordingClient(m, log, fail=m in failing),
+        routes={
+            "adjudicate": ModelRoute(model="fast", timeout=10.0, max_tokens=256, fallbacks=["strong"]),
+        },
+    )
+
+
+def test_task_is_routed_to_configured_model():
+    log = []
+    router = _router(log)
+    gateway = LLMGateway(client=router.client_for("strong"), router=router)
+
+    gateway.ask_json([{"role": "user", "content": "x"}], timeout=60.0, task="adjudicate")
+    gateway.ask_json([{"role": "user", "content": "x"}], timeout=60.0, task="draft")
+
+    assert log == [("fast", 10.0, 256), ("strong", 60.0, None)]
+
+
+def test_fallback_chain_on_failure():
+    log = []
+    router = _router(log, failing={"fast"})
+    gateway = LLMGateway(client=router.client_for("strong"), router=router)
+
+    assert gateway.ask_json([], task="adjudicate") == {"ok": True}
+    assert [name for name, _, _ in log] == ["fast", "strong"]
+
+
+def test_load_llm_routes_rejects_unknown_task():
+    routes = load_llm_routes('{"expand": {"model": "m", "fallbacks": ["n"]}}')
+    assert routes["expand"].fallbacks == ["n"]
+    with pytest.raises(ValueError):
+        load_llm_routes('{"nope": {"model": "m"}}')
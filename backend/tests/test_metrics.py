@@ -0,0 +1,45 @@
+from core.metrics import MetricsRegistry, snapshot_families
+
+
+def test_counter_and_gauge_render_with_escaped_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs", ("status",))
+    counter.inc(status="ok")
+    counter.inc(2, status='bad "x"')
+    gauge = registry.gauge("in_flight", "In flight")
+    with gauge.track_inprogress():
+        assert "in_flight 1" in registry.render()
+
+    text = registry.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{status="ok"} 1' in text
+    assert 'jobs_total{status="bad \\"x\\""} 2' in text
+    assert "in_flight 0" in text
+    assert registry.counter("jobs_total", "Jobs", ("status",)) is counter
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    hist = registry.histogram("latency_seconds", "Latency", ("task",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        hist.observe(value, task="draft")
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{task="draft",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{task="draft",le="1"} 3' in text
+    assert 'latency_seconds_bucket{task="draft",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{task="draft"} 4' in text
+
+
+def test_collectors_export_snapshots_and_survive_failures():
+    registry = MetricsRegistry()
+    registry.register_collector(
+        "pool", lambda: snapshot_families("db_pool", {"size": 5, "busy": True, "dialect": "mysql", "q": {"depth": 2}}, "Pool"),
+    )
+    registry.register_collector("broken", lambda: 1 / 0)
+
+    text = registry.render()
+    assert "db_pool_size 5" in text
+    assert "db_pool_busy 1" in text
+    assert "db_pool_q_depth 2" in text
+    assert "dialect" not in text
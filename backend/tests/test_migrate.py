@@ -0,0 +1,40 @@
+# tests/test_migrate.py
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from interface_DB.migrate import DOCUMENT_COLUMNS, DOCUMENT_INDEXES, migrate
+
+
+def test_migrate_adds_missing_columns_backfills_stats_and_is_idempotent(tmp_path):
+    from interface_DB.MySQL_document_stats import get_status_counts
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        # 升级前的 documents 表结构
+        conn.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, knowledge_space_id BIGINT NOT NULL, "
+            "filename VARCHAR(255) NOT NULL, storage_uri VARCHAR(255) NOT NULL, status VARCHAR(32))"
+        ))
+        conn.execute(text(
+            "INSERT INTO documents VALUES (1, 1, 'a.pdf', 'x', 'parsed'), (2, 1, 'b.pdf', 'x', 'parsed'),"
+            " (3, 1, 'c.pdf', 'x', 'failed'), (4, 2, 'd.pdf', 'x', 'uploaded')"
+        ))
+
+    applied = migrate(engine)
+    assert len(applied) == len(DOCUMENT_COLUMNS) + len(DOCUMENT_INDEXES) + 2
+
+    insp = inspect(engine)
+    assert {"content_hash", "summary", "summary_hash"} <= {c["name"] for c in insp.get_columns("documents")}
+    assert {name for name, _ in DOCUMENT_INDEXES} <= {i["name"] for i in insp.get_indexes("documents")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT filename, content_hash FROM documents WHERE id = 1")).one() == ("a.pdf", None)
+        stats = conn.execute(text(
+            "SELECT knowledge_space_id, status, count FROM knowledge_space_document_stats"
+        )).all()
+    assert sorted(stats) == [(1, "failed", 1), (1, "parsed", 2), (2, "uploaded", 1)]
+
+    assert migrate(engine) == []
+    assert migrate(engine, rebuild_stats=True) == ["REBUILD knowledge_space_document_stats"]
+    with Session(engine) as db:
+        assert get_status_counts(db, knowledge_space_id=1) == {"parsed": 2, "failed": 1}
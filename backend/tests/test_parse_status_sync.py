@@ -0,0 +1,184 @@
+# tests/test_parse_status_sync.py
+"""
+解析状态同步：diff / 批量写回（含计数表）/ 单个 dataset 失败隔离 / 全文缓存补齐重试
+"""
+
+import uuid
+
+from interface_DB.MySQL_db import SessionLocal
+from interface_DB import parse_status_sync
+from interface_DB.parse_status_sync import ParseStatusSyncService, apply_status_updates, diff_parse_status
+
+
+def _make_docs(n, *, status="parsing"):
+    """新建知识库（绑定唯一 dataset）及 n 个文档，返回 (ks_id, dataset_id, [(doc_id, ragflow_id)])"""
+    from interface_DB.MySQL_document import Document
+    from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+    from interface_DB.MySQL_user import User
+
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        user = User(username=f"sync-{tag}", password_hash="x")
+        db.add(user)
+        db.commit()
+        ks = KnowledgeSpace(name=tag, owner_id=user.id, ragflow_knowledge_id=f"ds-{tag}")
+        db.add(ks)
+        db.commit()
+        docs = [
+            Document(knowledge_space_id=ks.id, filename=f"{i}.pdf", storage_uri="x",
+                     status=status, ragflow_document_id=f"rf-{tag}-{i}")
+            for i in range(n)
+        ]
+        db.add_all(docs)
+        db.commit()
+        return ks.id, ks.ragflow_knowledge_id, [(d.id, d.ragflow_document_id) for d in docs]
+    finally:
+        db.close()
+
+
+def test_diff_parse_status_maps_terminal_runs_only():
+    local = [(1, "a"), (2, "b"), (3, "c"), (4, "missing")]
+    remote = {"a": ("DONE", ""), "b": ("FAIL", "bad pdf"), "c": ("RUNNING", "50%")}
+
+    assert diff_parse_status(local, remote) == [
+        {"id": 1, "status": "parsed", "error_message": None},
+        {"id": 2, "status": "failed", "error_message": "bad pdf"},
+    ]
+    assert diff_parse_status([(5, "d")], {"d": ("CANCEL", "")})[0]["error_message"] == "RAGFlow run=CANCEL"
+
+
+def test_apply_status_updates_writes_rows_and_stats():
+    from interface_DB.MySQL_document import Document
+    from interface_DB.MySQL_document_stats import get_status_counts
+
+    ks_id, _, docs = _make_docs(3)
+    db = SessionLocal()
+    try:
+        apply_status_updates(db, [
+            {"id": docs[0][0], "status": "parsed", "error_message": None},
+            {"id": docs[1][0], "status": "failed", "error_message": "bad"},
+        ])
+        db.expire_all()
+        assert db.get(Document, docs[1][0]).error_message == "bad"
+        assert get_status_counts(db, knowledge_space_id=ks_id) == {"parsed": 1, "failed": 1, "parsing": 1}
+    finally:
+        db.close()
+
+
+class FakeTextStore:
+    def __init__(self):
+        self.docs = set()
+
+    def has(self, document_id):
+        return document_id in self.docs
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, document_id):
+        self.submitted.append(document_id)
+        return True
+
+
+def test_sync_isolates_failing_dataset_and_retries_text_ingest(monkeypatch):
+    _, ds_ok, ok_docs = _make_docs(2)
+    _, ds_bad, bad_docs = _make_docs(1)
+
+    def fake_fetch(rag, dataset_id, wanted_ids, *, page_size):
+        return {rid: ("DONE", "") for rid in wanted_ids}, 1
+
+    real_apply = parse_status_sync.apply_status_updates
+
+    def flaky_apply(db, updates):
+        if any(u["id"] == bad_docs[0][0] for u in updates):
+            raise RuntimeError("deadlock")
+        real_apply(db, updates)
+
+    store = FakeTextStore()
+    ingest_calls = []
+
+    def fake_ingest(rag, text_store, dataset_id, document_id):
+        ingest_calls.append(document_id)
+        # 第一次写入失败，之后成功
+        if ingest_calls.count(document_id) == 1:
+            raise ConnectionError("ragflow timeout")
+        text_store.docs.add(document_id)
+        return 1
+
+    monkeypatch.setattr(parse_status_sync, "fetch_dataset_run_status", fake_fetch)
+    monkeypatch.setattr(parse_status_sync, "apply_status_updates", flaky_apply)
+    monkeypatch.setattr(parse_status_sync, "ingest_document_text", fake_ingest)
+
+    pushed = []
+    summarizer = FakeSummarizer()
+    service = ParseStatusSyncService(
+        client_factory=lambda: object(), on_change=pushed.append,
+        text_store=store, summarizer=summarizer,
+    )
+    service._backlog_scanned = True  # 共享测试库中的其他文档不参与
+
+    service.sync_once()
+    ok_ids = {doc_id for doc_id, _ in ok_docs}
+    pushed_ids = {c["document_id"] for c in pushed}
+    assert ok_ids <= pushed_ids and bad_docs[0][0] not in pushed_ids
+    assert service.snapshot()["errors"] == 1
+    assert ok_ids <= set(service._ingest_pending) and not ok_ids & set(summarizer.submitted)
+
+    # 状态已是 parsed，不会再被 parsing 扫描选中；全文写入仍在下一轮重试
+    service.sync_once()
+    assert {rid for _, rid in ok_docs} <= store.docs
+    assert ok_ids <= set(summarizer.submitted)
+    assert service.snapshot()["text_pending"] == 0
+
+
+def test_first_sync_backfills_parsed_documents_missing_text(monkeypatch):
+    _, _, docs = _make_docs(2, status="parsed")
+    store = FakeTextStore()
+    store.docs.add(docs[0][1])
+
+    monkeypatch.setattr(
+        parse_status_sync, "ingest_document_text",
+        lambda rag, text_store, dataset_id, document_id: text_store.docs.add(document_id) or 1,
+    )
+    service = ParseStatusSyncService(client_factory=lambda: object(), text_store=store)
+    service.sync_once()
+
+    assert docs[1][1] in store.docs
+    assert not {doc_id for doc_id, _ in docs} & set(service._ingest_pending)
+
+
+def test_document_deleted_in_ragflow_is_failed_after_full_scan(monkeypatch):
+    from types import SimpleNamespace
+    from ragflow_sdk.modules.dataset import DataSet
+    from interface_DB.MySQL_document import Document
+
+    ks_id, dataset_id, docs = _make_docs(2)
+    (kept_id, kept_rf), (gone_id, gone_rf) = docs
+    pages = {1: [SimpleNamespace(id=kept_rf, run="RUNNING", progress_msg=""), SimpleNamespace(id="other", run="DONE")],
+             2: [SimpleNamespace(id="another", run="DONE")]}
+    requested = []
+
+    def fake_list_documents(self, *, page, page_size):
+        requested.append((self.id, page))
+        return pages.get(page, []) if self.id == dataset_id else []
+
+    monkeypatch.setattr(DataSet, "list_documents", fake_list_documents)
+    remote, calls = parse_status_sync.fetch_dataset_run_status(object(), dataset_id, {kept_rf, gone_rf}, page_size=2)
+    assert calls == 2 and remote[gone_rf] == (parse_status_sync.RAGFLOW_RUN_MISSING,
+                                               parse_status_sync.RAGFLOW_MISSING_MESSAGE)
+    assert kept_rf in remote
+
+    service = ParseStatusSyncService(client_factory=lambda: object(), page_size=2)
+    changes = [c for c in service.sync_once() if c["knowledge_space_id"] == ks_id]
+    assert changes == [{"document_id": gone_id, "knowledge_space_id": ks_id, "status": "failed",
+                        "error_message": parse_status_sync.RAGFLOW_MISSING_MESSAGE}]
+
+    db = SessionLocal()
+    try:
+        assert db.get(Document, gone_id).status == "failed"
+        assert db.get(Document, kept_id).status == "parsing"
+    finally:
+        db.close()
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from core.query_broker import QueryBroker, normalize_query
+
+
+def test_normalize_query_ignores_case_width_and_whitespace_only():
+    assert normalize_query("  腕骨骨折\t DASH评分 ") == normalize_query("腕骨骨折 dash评分")
+    assert normalize_query("ＰＭ２.５ 炎症") == normalize_query("pm2.5 炎症")
+    assert normalize_query("腕骨骨折 康复") != normalize_query("腕骨骨折 手术")
+    # 词序 / 重复词影响检索语义，不合并
+    assert normalize_query("effect of age on recovery") != normalize_query("effect of recovery on age")
+    assert normalize_query("康复 腕骨骨折") != normalize_query("腕骨骨折 康复")
+
+
+def test_broker_shares_results_and_attributes_per_owner():
+    broker = QueryBroker()
+    calls = []
+
+    def fetch(q, kb):
+        calls.append((q, kb))
+        return [f"{kb}:{q}"]
+
+    assert broker.fetch("腕骨骨折 康复", "kb1", fetch, owner="SG-1") == ["kb1:腕骨骨折 康复"]
+    assert broker.fetch("腕骨骨折  康复", "kb1", fetch, owner="SG-2") == ["kb1:腕骨骨折 康复"]
+    broker.fetch("腕骨骨折 康复", "kb2", fetch, owner="SG-2")
+
+    assert len(calls) == 2
+    assert broker.snapshot(owner="SG-2")["cache_hits"] == 1
+    total = broker.snapshot()
+    assert total["requests"] == 3 and total["unique_queries"] == 2
+    assert total["saved_ratio"] == pytest.approx(0.333)
+
+
+def test_broker_coalesces_in_flight_and_does_not_cache_failures():
+    broker = QueryBroker()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch(q, kb):
+        calls.append(q)
+        started.set()
+        release.wait(5)
+        return ["chunk"]
+
+    out = []
+    leader = threading.Thread(target=lambda: out.append(broker.fetch("q", "kb", slow_fetch)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: out.append(broker.fetch("Q", "kb", slow_fetch)))
+    follower.start()
+    deadline = time.time() + 5
+    while broker.snapshot()["requests"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+    assert out == [["chunk"], ["chunk"]] and len(calls) == 1
+    assert broker.snapshot()["coalesced"] == 1
+
+    def failing(q, kb):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        broker.fetch("other", "kb", failing)
+    assert broker.fetch("other", "kb", lambda q, kb: ["ok"]) == ["ok"]
+    assert broker.snapshot()["failures"] == 1
@@ -0,0 +1,36 @@
+from core.retrieval_controller import RetrievalController, RetrievalPolicy, default_retrieval_size
+
+
+def _contexts(ids):
+    return [{"chunk_id": f"c{i}", "doc_id": f"d{i % 3}", "text": f"t{i}"} for i in ids]
+
+
+def test_default_size_matches_legacy_formula():
+    assert default_retrieval_size(3, 2) == int(0.8 * 3 * 2 * 10)
+
+
+def test_controller_grows_on_saturated_gain_and_stops_on_repeat():
+    controller = RetrievalController(RetrievalPolicy(adaptive=True, per_query_size=8, patience=1))
+    size = controller.size_for(1, 1)
+    first = controller.observe(1, contexts=_contexts(range(8)), size=size, per_query={"q": [f"c{i}" for i in range(8)]})
+    assert first["new_chunks"] == 8 and first["new_docs"] == 3 and not first["stop"]
+    assert controller.per_query_size == 12
+
+    # 同样的 query 再查一遍：没有新增 → 缩小并停止
+    again = controller.observe(2, contexts=_contexts(range(8)), size=controller.size_for(1, 1), per_query={"q": []})
+    assert again["gain"] == 0.0 and again["stop"]
+    assert controller.per_query_size == 6
+    assert controller.summary()["stopped_early"]
+
+
+def test_non_adaptive_policy_keeps_size_and_never_stops():
+    controller = RetrievalController(RetrievalPolicy(adaptive=False, per_query_size=8))
+    controller.observe(1, contexts=_contexts(range(8)), size=8)
+    record = controller.observe(2, contexts=_contexts(range(8)), size=8)
+    assert not record["stop"] and controller.per_query_size == 8
+
+
+def test_unsaturated_page_does_not_grow():
+    controller = RetrievalController(RetrievalPolicy(adaptive=True, per_query_size=8))
+    controller.observe(1, contexts=_contexts(range(8)), size=8, saturated=False)
+    assert controller.per_query_size == 8
@@ -0,0 +1,194 @@
+# tests/test_run_db.py
+"""
+run_db（DB 线程池）与 RAGFlow I/O 线程池分离：
+慢上传不占 DB 线程 / 连接，上传结果经短事务写回
+"""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from interface_DB.MySQL_db import SessionLocal, db_pool_snapshot, run_db
+from interface_DB import knowledge_service
+
+
+def _make_space(dataset_id="rf-ds"):
+    from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+    from interface_DB.MySQL_user import User
+
+    db = SessionLocal()
+    try:
+        user = User(username=f"u-{uuid.uuid4().hex[:8]}", password_hash="x")
+        db.add(user)
+        db.commit()
+        ks = KnowledgeSpace(name="ks", owner_id=user.id, ragflow_knowledge_id=dataset_id)
+        db.add(ks)
+        db.commit()
+        return user.id, ks.id
+    finally:
+        db.close()
+
+
+def test_run_db_runs_on_db_threads_and_records_stats():
+    before = db_pool_snapshot()["run_db_calls"]
+
+    def job(db, value):
+        return threading.current_thread().name, db.execute(text("SELECT :v"), {"v": value}).scalar()
+
+    name, value = asyncio.run(run_db(job, 7))
+    assert name.startswith("db") and value == 7
+    assert db_pool_snapshot()["run_db_calls"] == before + 1
+
+
+def test_slow_ragflow_io_does_not_block_run_db():
+    release = threading.Event()
+
+    async def main():
+        slow = [
+            asyncio.ensure_future(knowledge_service.run_ragflow(release.wait, 5))
+            for _ in range(knowledge_service.RAGFLOW_IO_WORKERS)
+        ]
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        await asyncio.gather(*(run_db(lambda db: db.execute(text("SELECT 1")).scalar()) for _ in range(20)))
+        elapsed = time.monotonic() - started
+        release.set()
+        await asyncio.gather(*slow)
+        return elapsed
+
+    assert asyncio.run(main()) < 1.0
+
+
+def test_upload_service_calls_ragflow_outside_db_session(monkeypatch, tmp_path):
+    user_id, ks_id = _make_space()
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF")
+    calls = []
+
+    def fake_upload(dataset_id, files):
+        calls.append((threading.current_thread().name, db_pool_snapshot()["checked_out"]))
+        return [{"id": "rf-doc-1"}]
+
+    monkeypatch.setattr(knowledge_service, "_upload_files_to_ragflow", fake_upload)
+    row = asyncio.run(knowledge_service.upload_document_service(
+        knowledge_space_id=ks_id, filename="a.pdf", file_type="pdf",
+        storage_uri=str(path), uploaded_by=user_id, content_hash="h-a",
+    ))
+
+    assert row["status"] == "indexed" and row["error"] is None
+    assert calls == [(calls[0][0], 0)] and calls[0][0].startswith("ragflow")
+
+
+def test_upload_service_marks_failed_and_raises(monkeypatch, tmp_path):
+    user_id, ks_id = _make_space()
+
+    def fake_upload(dataset_id, files):
+        raise ConnectionError("ragflow down")
+
+    monkeypatch.setattr(knowledge_service, "_upload_files_to_ragflow", fake_upload)
+    with pytest.raises(ValueError, match="ragflow down"):
+        asyncio.run(knowledge_service.upload_document_service(
+            knowledge_space_id=ks_id, filename="b.pdf", file_type="pdf",
+            storage_uri=str(tmp_path / "b.pdf"), uploaded_by=user_id, content_hash="h-b",
+        ))
+
+    from interface_DB.MySQL_document import Document
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.knowledge_space_id == ks_id).one()
+        assert doc.status == "failed" and "ragflow down" in doc.error_message
+    finally:
+        db.close()
+
+
+def test_duplicate_lookup_and_release_keep_shared_blob(monkeypatch, tmp_path):
+    from interface_DB.MySQL_document_crud import delete_document
+    from utils.upload_stream import store_blob
+
+    monkeypatch.setattr(knowledge_service, "_upload_files_to_ragflow", lambda dataset_id, files: [{"id": "rf"}])
+    content_hash = uuid.uuid4().hex
+    spaces, doc_ids = [], []
+    for name in ("a.pdf", "b.pdf"):
+        user_id, ks_id = _make_space()
+        tmp = tmp_path / name
+        tmp.write_bytes(b"%PDF shared")
+        path = store_blob(str(tmp), content_hash, ".pdf", str(tmp_path / "blobs"))
+        row = asyncio.run(knowledge_service.upload_document_service(
+            knowledge_space_id=ks_id, filename=name, file_type="pdf",
+            storage_uri=path, uploaded_by=user_id, content_hash=content_hash,
+        ))
+        spaces.append((user_id, ks_id))
+        doc_ids.append(row["id"])
+
+    db = SessionLocal()
+    try:
+        user_id, ks_id = spaces[0]
+        dup = knowledge_service.find_duplicate_document_service(
+            db, knowledge_space_id=ks_id, owner_id=user_id, content_hash=content_hash,
+        )
+        assert dup.id == doc_ids[0]
+
+        # 两个知识库共享同一 blob：删一个保留文件，全部删除后才释放
+        delete_document(db, document_id=doc_ids[0], knowledge_space_id=ks_id)
+        assert not knowledge_service.release_local_file_service(db, storage_uri=path)
+        assert os.path.exists(path)
+        delete_document(db, document_id=doc_ids[1], knowledge_space_id=spaces[1][1])
+        assert knowledge_service.release_local_file_service(db, storage_uri=path)
+        assert not os.path.exists(path)
+    finally:
+        db.close()
+
+
+def test_batch_upload_dedups_and_isolates_failed_ragflow_batch(monkeypatch, tmp_path):
+    from utils.upload_stream import store_blob
+
+    user_id, ks_id = _make_space()
+    tag = uuid.uuid4().hex[:8]
+
+    def blob(name, content):
+        tmp = tmp_path / f"tmp-{name}"
+        tmp.write_bytes(content.encode())
+        return {
+            "filename": name,
+            "file_type": "pdf",
+            "storage_uri": store_blob(str(tmp), f"{tag}-{content}", ".pdf", str(tmp_path / "blobs")),
+            "content_hash": f"{tag}-{content}",
+        }
+
+    # 库内已有文档 x
+    monkeypatch.setattr(knowledge_service, "_upload_files_to_ragflow", lambda dataset_id, files: [{"id": "rf-x"}])
+    existing = blob("x.pdf", "x")
+    existing_row = asyncio.run(knowledge_service.upload_document_service(
+        knowledge_space_id=ks_id, uploaded_by=user_id, **existing,
+    ))
+
+    # 2 个一批：[a, b] 成功，[c] 失败
+    sent = []
+
+    def fake_upload(dataset_id, files):
+        sent.append([name for name, _ in files])
+        if len(sent) == 2:
+            raise ConnectionError("ragflow down")
+        return [{"id": f"rf-{name}"} for name, _ in files]
+
+    monkeypatch.setattr(knowledge_service, "_upload_files_to_ragflow", fake_upload)
+    monkeypatch.setattr(knowledge_service, "RAGFLOW_UPLOAD_BATCH_SIZE", 2)
+    files = [blob("a.pdf", "a"), blob("b.pdf", "b"), blob("a2.pdf", "a"),
+             blob("x2.pdf", "x"), blob("c.pdf", "c"), blob("c2.pdf", "c")]
+    results = asyncio.run(knowledge_service.upload_documents_batch_service(
+        knowledge_space_id=ks_id, uploaded_by=user_id, files=files,
+    ))
+
+    assert sent == [["a.pdf", "b.pdf"], ["c.pdf"]]
+    assert [r["status"] for r in results] == ["indexed", "indexed", "deduplicated", "deduplicated", "failed", "failed"]
+    assert results[2]["id"] == results[0]["id"]
+    assert results[3]["id"] == existing_row["id"]
+    assert results[5]["id"] == results[4]["id"] and "ragflow down" in results[5]["error"]
+    # 仅被失败文档引用的 blob 删除，其余保留
+    assert os.path.exists(files[0]["storage_uri"]) and os.path.exists(existing["storage_uri"])
+    assert not os.path.exists(files[4]["storage_uri"])
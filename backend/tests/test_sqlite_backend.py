@@ -0,0 +1,150 @@
+# tests/test_sqlite_backend.py
+"""
+嵌入式 SQLite 后端：建表 + WAL + 计数表 / keyset 分页在 SQLite 上同样可用
+"""
+
+from sqlalchemy import inspect, text
+
+from interface_DB.MySQL_db import SessionLocal, engine, init_db
+
+
+def test_bootstrap_creates_schema_in_wal_mode():
+    init_db()
+    tables = set(inspect(engine).get_table_names())
+    assert {"users", "knowledge_spaces", "knowledge_space_permissions", "documents",
+            "knowledge_space_document_stats"} <= tables
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+
+
+def test_document_listing_and_counts_on_sqlite():
+    from interface_DB.MySQL_user import User
+    from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+    from interface_DB.MySQL_document_crud import (
+        PAGE_SIZE,
+        count_documents,
+        create_document,
+        delete_document,
+        list_documents,
+        update_document_status,
+    )
+
+    db = SessionLocal()
+    try:
+        user = User(username="sqlite_user", password_hash="x")
+        db.add(user)
+        db.commit()
+        ks = KnowledgeSpace(name="ks", owner_id=user.id)
+        db.add(ks)
+        db.commit()
+
+        docs = [
+            create_document(db, knowledge_space_id=ks.id, filename=f"f{i}.pdf", file_type="pdf",
+                            storage_uri="x", uploaded_by=user.id)
+            for i in range(PAGE_SIZE + 5)
+        ]
+        update_document_status(db, document_id=docs[0].id, status="parsing")
+        delete_document(db, document_id=docs[1].id, knowledge_space_id=ks.id)
+        assert count_documents(db, knowledge_space_id=ks.id) == PAGE_SIZE + 4
+
+        first = list_documents(db, knowledge_space_id=ks.id)
+        rest = list_documents(db, knowledge_space_id=ks.id, cursor=first[-1].id)
+        ids = [d.id for d in first + rest]
+        assert len(ids) == PAGE_SIZE + 4
+        assert ids == sorted(ids, reverse=True)
+    finally:
+        db.close()
+
+
+def _new_space(db, name):
+    from interface_DB.MySQL_user import User
+    from interface_DB.MySQL_knowledge_space import KnowledgeSpace
+
+    user = User(username=name, password_hash="x")
+    db.add(user)
+    db.commit()
+    ks = KnowledgeSpace(name=name, owner_id=user.id)
+    db.add(ks)
+    db.commit()
+    return user, ks
+
+
+def test_document_stats_follow_status_changes_and_deletes():
+    from sqlalchemy import func, select
+
+    from interface_DB.MySQL_document import Document
+    from interface_DB.MySQL_document_crud import create_document, delete_document, update_document_status
+    from interface_DB.MySQL_document_stats import get_status_counts
+
+    db = SessionLocal()
+    try:
+        user, ks = _new_space(db, "stats_user")
+        docs = [
+            create_document(db, knowledge_space_id=ks.id, filename=f"s{i}.pdf", file_type="pdf",
+                            storage_uri="x", uploaded_by=user.id)
+            for i in range(4)
+        ]
+        update_document_status(db, document_id=docs[0].id, status="parsing")
+        update_document_status(db, document_id=docs[0].id, status="parsed")
+        update_document_status(db, document_id=docs[1].id, status="failed", error_message="boom")
+        # 状态不变的写入不产生增量
+        update_document_status(db, document_id=docs[2].id, status="uploaded")
+        delete_document(db, document_id=docs[1].id, knowledge_space_id=ks.id)
+        # ORM 直接修改属性同样会被计数
+        docs[3].status = "indexed"
+        db.commit()
+
+        actual = dict(db.execute(
+            select(Document.status, func.count())
+            .where(Document.knowledge_space_id == ks.id)
+            .group_by(Document.status)
+        ).all())
+        assert get_status_counts(db, knowledge_space_id=ks.id) == actual == {
+            "parsed": 1, "uploaded": 1, "indexed": 1,
+        }
+    finally:
+        db.close()
+
+
+def test_counts_fall_back_to_documents_when_space_has_no_stats_rows():
+    from sqlalchemy import delete
+
+    from interface_DB.MySQL_document_crud import count_documents, create_document
+    from interface_DB.MySQL_document_stats import KnowledgeSpaceDocumentStats, rebuild_document_stats
+
+    db = SessionLocal()
+    try:
+        user, ks = _new_space(db, "legacy_user")
+        for i in range(3):
+            create_document(db, knowledge_space_id=ks.id, filename=f"l{i}.pdf", file_type="pdf",
+                            storage_uri="x", uploaded_by=user.id)
+        # 模拟升级前写入、尚未回填的知识库
+        db.execute(delete(KnowledgeSpaceDocumentStats).where(KnowledgeSpaceDocumentStats.knowledge_space_id == ks.id))
+        db.commit()
+        assert count_documents(db, knowledge_space_id=ks.id) == 3
+
+        rebuild_document_stats(db, knowledge_space_id=ks.id)
+        assert db.query(KnowledgeSpaceDocumentStats).filter_by(knowledge_space_id=ks.id).one().count == 3
+    finally:
+        db.close()
+
+
+def test_stats_use_update_then_insert_on_dialects_without_upsert(monkeypatch):
+    from interface_DB import MySQL_document_stats
+    from interface_DB.MySQL_document_crud import create_document, update_document_status
+    from interface_DB.MySQL_document_stats import get_status_counts
+
+    # 模拟没有 UPSERT 语法的方言：ORM flush 仍能维护计数
+    monkeypatch.setattr(MySQL_document_stats, "_upsert_stmt", lambda dialect_name, rows: None)
+    db = SessionLocal()
+    try:
+        user, ks = _new_space(db, "portable_user")
+        docs = [
+            create_document(db, knowledge_space_id=ks.id, filename=f"p{i}.pdf", file_type="pdf",
+                            storage_uri="x", uploaded_by=user.id)
+            for i in range(2)
+        ]
+        update_document_status(db, document_id=docs[0].id, status="parsed")
+        assert get_status_counts(db, knowledge_space_id=ks.id) == {"uploaded": 1, "parsed": 1}
+    finally:
+        db.close()
@@ -0,0 +1,155 @@
+# tests/test_step4_rounds.py
+"""
+Step 4 / Step 5 轮次控制：提前终止时的最终 pool、流水线扩展的使用 / 丢弃
+（检索与 LLM 均为假实现，不需要 RAGFlow / 模型服务）
+"""
+
+import threading
+
+import steps.step4_se_ev as step4
+from core.retrieval_controller import RetrievalController, RetrievalPolicy
+
+
+class FakeGateway:
+    """按 task 返回预设 JSON：adjudicate 依次弹出裁决，expand 返回新意图"""
+
+    def __init__(self, decisions):
+        self.decisions = list(decisions)
+        self.tasks = []
+        self._lock = threading.Lock()
+
+    def ask_json(self, messages, *, timeout=None, schema=None, task=None):
+        with self._lock:
+            self.tasks.append(task)
+            if task == "adjudicate":
+                return {"decision": self.decisions.pop(0), "rationale": "r", "confidence": 0.5}
+        return {"current_intent": "aspirin dosage", "query_hints": ["aspirin dosage"]}
+
+
+def _fake_retrieval(rounds):
+    """第 n 次调用返回 rounds[n] 中的 chunk 编号"""
+    calls = iter(rounds)
+
+    def run_retrieval_for_subgoal(*, sub_goal, kb_ids, size=None, broker=None, chunk_store=None):
+        ids = next(calls)
+        contexts = [
+            {
+                "chunk_id": f"c{i}",
+                "source": f"doc{i}.pdf",
+                "text": "aspirin dosage trial results" if i == 10 else f"aspirin background note {i}",
+            }
+            for i in ids
+        ]
+        return {
+            "status": "retrieved",
+            "evidence_pool": {
+                "intent": sub_goal["current_intent"],
+                "contexts": contexts,
+                "evidences": [{"chunk_id": c["chunk_id"]} for c in contexts],
+                "meta": {"total_chunks": len(contexts)},
+                "retrieval_trace": {"queries": sub_goal["query_hints"], "per_query": {}},
+            },
+        }
+
+    return run_retrieval_for_subgoal
+
+
+def _sub_goal():
+    return {
+        "sub_goal_id": "SG-1",
+        "current_intent": "aspirin dosage",
+        "query_hints": ["aspirin"],
+        "fallback_history": [],
+    }
+
+
+def test_stop_in_adjudication_reranks_final_pool(monkeypatch):
+    # 第 3 次检索只带来 1 个新 chunk（增益 < min_gain）→ 停止，但该 chunk 必须出现在返回的 pool 中
+    monkeypatch.setattr(step4, "run_retrieval_for_subgoal", _fake_retrieval([range(5), range(5, 10), range(11)]))
+    gateway = FakeGateway(["insufficient", "insufficient"])
+    controller = RetrievalController(
+        RetrievalPolicy(adaptive=True, patience=1, min_gain=0.15, max_rounds=1, max_adjudication_rounds=3)
+    )
+
+    result = step4.run_step4_for_subgoal(
+        gateway=gateway, sub_goal=_sub_goal(), kb_ids=["kb"], controller=controller, pipelined=False,
+    )
+
+    assert result["status"] == "unresolved"
+    assert gateway.tasks.count("adjudicate") == 2
+    assert "c10" in {c["chunk_id"] for c in result["pool"]["contexts"]}
+
+
+def test_zero_adjudication_rounds_returns_ranked_pool(monkeypatch):
+    monkeypatch.setattr(step4, "run_retrieval_for_subgoal", _fake_retrieval([range(5)]))
+    gateway = FakeGateway([])
+    controller = RetrievalController(RetrievalPolicy(max_rounds=1, max_adjudication_rounds=0))
+
+    result = step4.run_step4_for_subgoal(
+        gateway=gateway, sub_goal=_sub_goal(), kb_ids=["kb"], controller=controller, pipelined=False,
+    )
+
+    assert result["status"] == "unresolved"
+    assert result["pool"]["meta"]["rerank"]["candidates"] == 5
+    assert "adjudicate" not in gateway.tasks
+
+
+def test_pipelined_expansion_used_and_discarded(monkeypatch):
+    # 第 1 轮裁决 insufficient → 使用预取扩展；第 2 轮 partial → 丢弃；最后一轮不预取
+    monkeypatch.setattr(step4, "run_retrieval_for_subgoal", _fake_retrieval([range(3), range(3, 6), range(6, 9)]))
+    thresholds = []
+    evaluate = step4.evaluate_evidence_pool
+
+    def recording_evaluate(*, evidence_pool, coverage_threshold=0.8):
+        thresholds.append(coverage_threshold)
+        return evaluate(evidence_pool=evidence_pool, coverage_threshold=coverage_threshold)
+
+    monkeypatch.setattr(step4, "evaluate_evidence_pool", recording_evaluate)
+    gateway = FakeGateway(["insufficient", "partial", "sufficient"])
+    controller = RetrievalController(RetrievalPolicy(adaptive=False, max_rounds=1, max_adjudication_rounds=3))
+
+    result = step4.run_step4_for_subgoal(
+        gateway=gateway, sub_goal=_sub_goal(), kb_ids=["kb"], controller=controller,
+        coverage_threshold=0.5, pipelined=True,
+    )
+
+    assert result["status"] == "completed"
+    assert result["pipeline"] == {"launched": 2, "used": 1, "discarded": 1}
+    assert thresholds and set(thresholds) == {0.5}
+    # Step 4 自身一次 + 使用的预取一次（丢弃的预取可能已在后台执行）
+    assert 2 <= gateway.tasks.count("expand") <= 3
+
+
+class PagedRAGFlow:
+    """假 RAGFlow 客户端：每次返回 page_size 个全新 chunk，记录请求的 page_size"""
+
+    def __init__(self):
+        self.page_sizes = []
+        self._next = 0
+
+    def retrieve(self, *, dataset_ids, question, page_size=30, keyword=False):
+        self.page_sizes.append(page_size)
+        chunks = []
+        for _ in range(page_size):
+            self._next += 1
+            chunks.append({"id": f"rc{self._next}", "document_id": f"rd{self._next}",
+                           "content": f"aspirin dosage {self._next}", "similarity": 0.9})
+        return chunks
+
+
+def test_adaptive_size_reaches_ragflow_page_size(monkeypatch):
+    import interface_DB.ragflow_search as ragflow_search
+
+    rag = PagedRAGFlow()
+    monkeypatch.setattr(ragflow_search, "_get_ragflow_client", lambda: rag)
+    controller = RetrievalController(
+        RetrievalPolicy(adaptive=True, per_query_size=8, max_rounds=2, max_adjudication_rounds=0)
+    )
+
+    step4.run_step4_for_subgoal(
+        gateway=FakeGateway([]), sub_goal=_sub_goal(), kb_ids=["kb"], controller=controller, pipelined=False,
+    )
+
+    # 第 1 轮取满 8 条且全是新 chunk → 第 2 轮请求 12 条
+    assert rag.page_sizes == [8, 12]
+    assert [r["size"] for r in controller.history] == [8, 12]
@@ -0,0 +1,66 @@
+# tests/test_step7_edit.py
+
+import re
+import threading
+
+from steps.step7_edit import SYSTEM_DOC_FINALIZER, SYSTEM_SECTION_EDITOR, run_step7_map_reduce_edit
+
+
+class SectionGateway:
+    """章节编辑按标题回显草稿；标题含“失败”的章节抛错；终稿调用记录收到的节选"""
+
+    def __init__(self):
+        self.sections = []
+        self.finalize_inputs = []
+        self._lock = threading.Lock()
+
+    def ask_json(self, messages, *, timeout=None, schema=None, task=None):
+        system, user = messages[0]["content"], messages[1]["content"]
+        if system == SYSTEM_SECTION_EDITOR:
+            title = re.search(r"- 标题：(.*)", user).group(1)
+            with self._lock:
+                self.sections.append(title)
+            if "失败" in title:
+                raise TimeoutError("section timeout")
+            drafts = re.findall(r"\]\n(.*)", user)
+            return {"markdown": f"edited {' + '.join(drafts)}"}
+        assert system == SYSTEM_DOC_FINALIZER
+        self.finalize_inputs.append(user)
+        return {"title": "# 报告标题", "overview": "概述段落"}
+
+
+def _draft(section_id, title, content, sub_goal_id="SG-1"):
+    return {"parent_section_id": section_id, "sub_goal_id": sub_goal_id, "section_title": title, "content": content}
+
+
+def test_map_reduce_maps_drafts_to_sections_and_merges_in_plan_order():
+    plan = {"sections": [
+        {"section_id": "S1", "title": "背景", "intent_hint": "h1"},
+        {"section_id": "S2", "title": "失败章节", "intent_hint": "h2"},
+        {"section_id": "S3", "title": "无草稿", "intent_hint": "h3"},
+    ]}
+    drafts = [
+        _draft("S2", "失败章节", "s2 原文"),
+        _draft("S1", "背景", "s1 第一段"),
+        _draft("S9", "计划外", "s9 内容"),
+        _draft("S1", "背景", "s1 第二段", sub_goal_id="SG-2"),
+        _draft("S3", "无草稿", "   "),
+    ]
+    gateway = SectionGateway()
+
+    result = run_step7_map_reduce_edit(gateway, {"topic": "主题"}, plan, drafts)
+
+    # map：每个有正文的章节一次调用，空草稿章节跳过
+    assert sorted(gateway.sections) == sorted(["背景", "失败章节", "计划外"])
+    # reduce：只收到各章节标题与节选，顺序与研究结构一致
+    [digest] = gateway.finalize_inputs
+    assert digest.index("## 背景") < digest.index("## 失败章节") < digest.index("## 计划外")
+
+    assert result["status"] == "completed"
+    assert result["content"] == "\n\n".join([
+        "# 报告标题",
+        "概述段落",
+        "## 背景\nedited s1 第一段 + s1 第二段",
+        "## 失败章节\ns2 原文",
+        "## 计划外\nedited s9 内容",
+    ])
@@ -0,0 +1,64 @@
+import gzip
+import json
+
+import pytest
+
+from core.chunk_store import ChunkRef, SessionChunkStore
+from utils.step_cache import StepCacheError, iter_records, load_result, read_header, save_result
+
+
+def _step4_result():
+    store = SessionChunkStore()
+    text = "桡骨远端骨折合并腕骨骨折的发病率。" * 20
+    results = []
+    for i in range(3):
+        ctx = store.context(text=text, source="a.pdf", doc_id="d1", chunk_id="c1")
+        ev = store.evidence(
+            text=text, doc_name="a.pdf", doc_id="d1", chunk_id="c1",
+            hit_count=1, similarity=0.9, vector_similarity=0.8,
+        )
+        results.append({
+            "sub_goal_id": f"SG-{i}",
+            "result": {"pool": {"intent": f"意图{i}", "contexts": [ctx.replace(rerank_score=0.5)], "evidences": [ev]}},
+        })
+    return {"step": "step4", "sub_goal_results": results}, text
+
+
+def test_round_trip_keeps_shape_and_writes_text_once(tmp_path):
+    path = str(tmp_path / "step4_result.jsonl.gz")
+    obj, text = _step4_result()
+    save_result(obj, path)
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert f.read().count("桡骨远端骨折合并腕骨骨折的发病率。" * 20) == 1
+
+    header = read_header(path)
+    assert header["records_key"] == "sub_goal_results" and header["records"] == 3
+
+    restored = load_result(path)
+    assert restored["step"] == "step4"
+    ctx = restored["sub_goal_results"][2]["result"]["pool"]["contexts"][0]
+    assert isinstance(ctx, ChunkRef)
+    assert dict(ctx) == {"text": text, "source": "a.pdf", "doc_id": "d1", "chunk_id": "c1", "rerank_score": 0.5}
+    assert restored["sub_goal_results"][0]["result"]["pool"]["evidences"][0]["excerpt"] == text[:300]
+
+    plain = [{"a": 1}, {"b": [1, 2]}]
+    save_result(plain, str(tmp_path / "list.jsonl"))
+    assert load_result(str(tmp_path / "list.jsonl")) == plain
+
+
+def test_iter_records_streams_and_filters(tmp_path):
+    path = str(tmp_path / "step4_result.jsonl.gz")
+    obj, text = _step4_result()
+    save_result(obj, path)
+    picked = list(iter_records(path, where=lambda r: r["sub_goal_id"] == "SG-1"))
+    assert [r["sub_goal_id"] for r in picked] == ["SG-1"]
+    # 正文在 SG-0 之前写出，过滤掉 SG-0 后引用仍可解析
+    assert picked[0]["result"]["pool"]["contexts"][0]["text"] == text
+
+
+def test_rejects_unknown_version(tmp_path):
+    path = tmp_path / "bad.jsonl"
+    path.write_text(json.dumps({"format": "step-cache", "version": 99}) + "\n", encoding="utf-8")
+    with pytest.raises(StepCacheError):
+        load_result(str(path))
@@ -0,0 +1,115 @@
+# tests/test_upload_stream.py
+
+import asyncio
+import email
+import hashlib
+import os
+
+import pytest
+
+from utils import upload_stream
+from utils.upload_stream import (
+    MultipartFileStream,
+    UploadTooLargeError,
+    remove_blob_if_unreferenced,
+    save_upload_stream,
+    store_blob,
+    unpin_blob,
+)
+
+
+class FakeUpload:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    async def read(self, n: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+
+def test_save_upload_stream_hashes_while_writing(tmp_path):
+    data = b"x" * 2500 + b"tail"
+    dest = tmp_path / "u" / "a.pdf"
+
+    stored = asyncio.run(save_upload_stream(FakeUpload(data), str(dest), max_size=10_000, chunk_size=1000))
+
+    assert dest.read_bytes() == data
+    assert stored.size == len(data)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_save_upload_stream_aborts_over_limit(tmp_path):
+    dest = tmp_path / "big.pdf"
+    upload = FakeUpload(b"x" * 5000)
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_upload_stream(upload, str(dest), max_size=2000, chunk_size=1000))
+
+    assert not dest.exists()
+    # 超限后立即停止读取，不会把剩余内容读完
+    assert upload.pos == 3000
+
+
+def test_multipart_stream_round_trip(tmp_path):
+    a = tmp_path / "a.pdf"
+    b = tmp_path / "b.txt"
+    a.write_bytes(b"%PDF-1.4 " + bytes(range(256)) * 10)
+    b.write_bytes("中文内容".encode("utf-8"))
+
+    body = MultipartFileStream([("file", "a.pdf", str(a)), ("file", "报告.txt", str(b))], chunk_size=100)
+    raw = b""
+    while True:
+        chunk = body.read(333)
+        if not chunk:
+            break
+        raw += chunk
+    assert len(raw) == len(body)
+
+    msg = email.message_from_bytes(f"Content-Type: {body.content_type}\r\n\r\n".encode() + raw)
+    parts = msg.get_payload()
+    assert [p.get_payload(decode=True) for p in parts] == [a.read_bytes(), b.read_bytes()]
+
+
+def test_store_blob_shares_identical_content(tmp_path):
+    data = b"same pdf"
+    sha = hashlib.sha256(data).hexdigest()
+    root = tmp_path / "blobs"
+    first, second = tmp_path / "t1.pdf", tmp_path / "t2.pdf"
+    first.write_bytes(data)
+    second.write_bytes(data)
+
+    p1 = store_blob(str(first), sha, ".PDF", str(root))
+    p2 = store_blob(str(second), sha, ".pdf", str(root))
+
+    assert p1 == p2 and p1.endswith(f"{sha}.pdf")
+    assert not first.exists() and not second.exists()
+    assert len(list(root.rglob("*.pdf"))) == 1
+
+
+def test_release_keeps_blob_while_identical_upload_is_in_flight(tmp_path):
+    data = b"shared pdf"
+    sha = hashlib.sha256(data).hexdigest()
+    root = tmp_path / "blobs"
+    first, second = tmp_path / "t1.pdf", tmp_path / "t2.pdf"
+    first.write_bytes(data)
+    second.write_bytes(data)
+
+    path = store_blob(str(first), sha, ".pdf", str(root))
+    # 已落盘、尚未建行：pin 住，不删
+    assert not remove_blob_if_unreferenced(path, lambda: False)
+    unpin_blob(path)
+
+    def other_upload_lands_during_check():
+        # 引用计数已查为 0 之后，同内容上传完成 store_blob + 建行
+        store_blob(str(second), sha, ".pdf", str(root))
+        unpin_blob(path)
+        return False
+
+    assert not remove_blob_if_unreferenced(path, other_upload_lands_during_check)
+    assert os.path.exists(path)
+
+    assert remove_blob_if_unreferenced(path, lambda: False)
+    assert not os.path.exists(path)
+    assert path not in upload_stream._blob_generation and path not in upload_stream._blob_pins
@@ -0,0 +1,61 @@
+# tests/test_user_cache.py
+
+import pytest
+
+from interface_DB.user_cache import UserSnapshot, UserSnapshotCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _setup(ttl=60.0):
+    clock = Clock()
+    cache = UserSnapshotCache(ttl=ttl, clock=clock)
+    calls = {"decode": 0, "load": 0}
+
+    def decode(token):
+        calls["decode"] += 1
+        if token == "bad":
+            raise ValueError("Invalid token")
+        return int(token.split("-")[0]), clock.now + 3600
+
+    def load(user_id):
+        calls["load"] += 1
+        return UserSnapshot(id=user_id, username=f"u{user_id}", email=None, role="user", status="active")
+
+    return cache, clock, calls, decode, load
+
+
+def test_repeated_token_skips_decode_and_db():
+    cache, clock, calls, decode, load = _setup()
+
+    for _ in range(3):
+        assert cache.resolve("7-a", decode=decode, load=load).id == 7
+    # 同一用户的新 token：只验签，不查库
+    cache.resolve("7-b", decode=decode, load=load)
+
+    assert calls == {"decode": 2, "load": 1}
+
+
+def test_user_snapshot_expires_after_ttl():
+    cache, clock, calls, decode, load = _setup(ttl=30)
+    cache.resolve("1-a", decode=decode, load=load)
+    clock.now += 31
+    cache.resolve("1-a", decode=decode, load=load)
+    assert calls["load"] == 2
+
+
+def test_invalidate_user_and_bad_token():
+    cache, clock, calls, decode, load = _setup()
+    cache.resolve("3-a", decode=decode, load=load)
+    cache.invalidate_user(3)
+    cache.resolve("3-a", decode=decode, load=load)
+    assert calls == {"decode": 2, "load": 2}
+
+    with pytest.raises(ValueError):
+        cache.resolve("bad", decode=decode, load=load)
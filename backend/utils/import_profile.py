@@ -0,0 +1,127 @@
+# import_profile.py
+"""
+接口进程冷启动的导入耗时报告（基于 python -X importtime）
+
+用法（在 backend 目录下）：
+    python -m utils.import_profile                 # 默认分析 inter_face
+    python -m utils.import_profile inter_face --top 30
+
+- 在子进程中导入目标模块，解析 stderr 的 importtime 输出
+- 按累计耗时列出最慢的顶层依赖
+- 检查是否导入了不应在启动时加载的模块（重型 SDK / 测试模块），
+  命中时退出码为 1，可直接用作 CI 检查
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# 启动时不应被导入的模块前缀（首次使用时再懒加载）
+LAZY_MODULE_PREFIXES = ("ragflow_sdk", "openai", "tests.", "ragflow_adapter")
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # 缩进层级，0 = 由目标模块直接触发的顶层导入
+
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """
+    解析形如
+        import time:       212 |      74179 |   beartype.claw
+    的行（表头 / 其他输出忽略）
+    """
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 表头行
+        name = parts[2].rstrip()
+        stripped = name.lstrip(" ")
+        timings.append(ImportTiming(
+            module=stripped,
+            self_us=self_us,
+            cumulative_us=cumulative_us,
+            depth=(len(name) - len(stripped) - 1) // 2,
+        ))
+    return timings
+
+
+def find_lazy_violations(
+    timings: List[ImportTiming],
+    prefixes=LAZY_MODULE_PREFIXES,
+) -> List[str]:
+    return sorted({
+        t.module for t in timings
+        if any(t.module == p.rstrip(".") or t.module.startswith(p) for p in prefixes)
+    })
+
+
+def profile_imports(
+    module: str = "inter_face",
+    *,
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+) -> List[ImportTiming]:
+    """在干净的子进程中导入 module，返回全部导入耗时"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, **(env or {})},
+        cwd=cwd,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def format_report(module: str, timings: List[ImportTiming], *, top: int = 20) -> str:
+    total = next((t.cumulative_us for t in timings if t.module == module), 0)
+    lines = [f"import {module}: {total / 1000:.1f} ms ({len(timings)} modules)", ""]
+
+    # 只看 depth <= 1：目标模块本身 + 它直接触发的依赖，避免同一耗时被层层重复计入
+    heavy = sorted(
+        (t for t in timings if t.depth <= 1 and t.module != module),
+        key=lambda t: t.cumulative_us,
+        reverse=True,
+    )[:top]
+    lines.append(f"{'cumulative(ms)':>14}  {'self(ms)':>8}  module")
+    for t in heavy:
+        lines.append(f"{t.cumulative_us / 1000:>14.1f}  {t.self_us / 1000:>8.1f}  {t.module}")
+
+    violations = find_lazy_violations(timings)
+    lines.append("")
+    if violations:
+        lines.append("❌ 启动时导入了应懒加载的模块：")
+        lines.extend(f"  - {m}" for m in violations)
+    else:
+        lines.append("✅ 未导入重型 SDK / 测试模块")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import-time profile report")
+    parser.add_argument("module", nargs="?", default="inter_face")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    timings = profile_imports(args.module)
+    print(format_report(args.module, timings, top=args.top))
+    return 1 if find_lazy_violations(timings) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,8 @@
+"""
+旧的 pickle 步骤缓存：仅 fake_worker_copy 与旧测试脚本仍在使用；
+研究流程（fake_worker_copy1 / step7_edit）已改用 utils/step_cache.py
+"""
+
 import json
 import pickle
 from pathlib import Path
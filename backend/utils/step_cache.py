@@ -0,0 +1,252 @@
+# step_cache.py
+"""
+研究流程各步骤的结果缓存（替代 pickle_csp 的 pickle 缓存）
+
+格式：JSON Lines，按扩展名压缩（.gz = gzip；.zst = zstd，需安装 zstandard；其他 = 不压缩）
+- 第 1 行为头部：{"format": "step-cache", "version": 1, "kind": "dict" | "list",
+                   "records_key": ..., "records": N}
+- 第 2 行为 {"$meta": {...}}
+- 之后每行一条记录：列表结果的每个元素 / dict 结果中最大的“字典列表”字段
+  （如 step4 的 sub_goal_results，一个 sub-goal 一行）的每个元素；dict 的其余字段放在 meta
+- 会话 chunk 存储（core/chunk_store）中的正文在首次被引用前以 {"$text": key, "text": ...}
+  单独写一行，引用记录只写 key 与元数据 —— 同一 chunk 正文在文件中只出现一次
+
+读取：
+- load_result(path)：完整还原
+- read_header(path)：只读第一行（版本 / 记录数）
+- iter_records(path, where=...)：流式逐条读取，只构造需要的记录
+
+纯 JSON，加载不执行任何代码（pickle 从共享卷加载不安全）。
+
+用法（在 backend 目录下，把旧 pickle 缓存转换为新格式）：
+    python -m utils.step_cache convert cache/step4_result.pkl cache/step4_result.jsonl.gz
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO
+
+from core.chunk_store import ChunkRef, EvidenceRef, SessionChunkStore
+
+FORMAT = "step-cache"
+SCHEMA_VERSION = 1
+
+
+class StepCacheError(ValueError):
+    pass
+
+
+# =========================
+# 压缩方式（按扩展名）
+# =========================
+def _open_text(path: str, mode: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    if path.endswith(".zst"):
+        import zstandard  # 可选依赖，仅 .zst 文件需要
+        if mode == "w":
+            raw = zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb"), closefd=True)
+        else:
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# =========================
+# 拆分：头部 + 记录
+# =========================
+def _records_key(obj: Dict[str, Any]) -> Optional[str]:
+    """dict 中最长的“字典列表”字段（无则整个 dict 放进 meta）"""
+    best, best_len = None, 0
+    for key, value in obj.items():
+        if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+            if len(value) > best_len:
+                best, best_len = key, len(value)
+    return best
+
+
+# =========================
+# 写入
+# =========================
+class _Encoder:
+    """把 ChunkRef / EvidenceRef 编码为引用，并在首次出现时先输出正文行"""
+
+    def __init__(self):
+        self.written: set = set()
+        self.pending: List[str] = []
+
+    def _text(self, ref) -> str:
+        key = ref.key
+        if key not in self.written:
+            self.written.add(key)
+            self.pending.append(json.dumps({"$text": key, "text": ref.store.text(key)}, ensure_ascii=False))
+        return key
+
+    def default(self, o: Any) -> Any:
+        if isinstance(o, ChunkRef):
+            return {
+                "$chunk": self._text(o),
+                "chunk_id": o.chunk_id,
+                "doc_id": o.doc_id,
+                "source": o.source,
+                "extra": o.extra,
+            }
+        if isinstance(o, EvidenceRef):
+            return {
+                "$evidence": self._text(o),
+                **{k: getattr(o, k) for k in EvidenceRef._KEYS if k != "excerpt"},
+            }
+        if isinstance(o, (set, frozenset, tuple)):
+            return list(o)
+        raise TypeError(f"Object of type {type(o).__name__} is not step-cache serializable")
+
+    def lines(self, record: Any) -> List[str]:
+        line = json.dumps(record, ensure_ascii=False, default=self.default)
+        out, self.pending = self.pending + [line], []
+        return out
+
+
+def save_result(obj: Any, cache_path: str) -> None:
+    """写入临时文件后 os.replace，中途失败不会留下半个缓存"""
+    if isinstance(obj, list):
+        kind, records_key, meta, records = "list", None, {}, obj
+    elif isinstance(obj, dict):
+        records_key = _records_key(obj)
+        kind = "dict"
+        meta = {k: v for k, v in obj.items() if k != records_key}
+        records = obj[records_key] if records_key else []
+    else:
+        raise StepCacheError(f"Unsupported result type: {type(obj).__name__}")
+
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    encoder = _Encoder()
+    header = {
+        "format": FORMAT,
+        "version": SCHEMA_VERSION,
+        "kind": kind,
+        "records_key": records_key,
+        "records": len(records),
+    }
+    tmp_path = cache_path + ".tmp" + os.path.splitext(cache_path)[1]
+    with _open_text(tmp_path, "w") as f:
+        # meta 中也可能含引用：正文行必须在头部之后，因此头部与 meta 分两行
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for line in encoder.lines({"$meta": meta}):
+            f.write(line + "\n")
+        for record in records:
+            for line in encoder.lines(record):
+                f.write(line + "\n")
+    os.replace(tmp_path, cache_path)
+
+
+# =========================
+# 读取
+# =========================
+def _check_header(line: str, cache_path: str) -> Dict[str, Any]:
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise StepCacheError(f"Not a step cache file: {cache_path}")
+    if header.get("version") != SCHEMA_VERSION:
+        raise StepCacheError(
+            f"Unsupported step cache version {header.get('version')} (expected {SCHEMA_VERSION}): {cache_path}"
+        )
+    return header
+
+
+def read_header(cache_path: str) -> Dict[str, Any]:
+    with _open_text(cache_path, "r") as f:
+        return _check_header(f.readline(), cache_path)
+
+
+def _stream(cache_path: str) -> Iterator[tuple]:
+    """依次产出 ("header", dict) / ("meta", dict) / ("record", obj)；正文行在内部消化"""
+    store = SessionChunkStore()
+
+    def hook(d: Dict[str, Any]) -> Any:
+        if "$chunk" in d:
+            return ChunkRef(store, d["$chunk"], d["chunk_id"], d["doc_id"], d["source"], d.get("extra"))
+        if "$evidence" in d:
+            return EvidenceRef(
+                store, d["$evidence"], d["chunk_id"], d["doc_id"], d["doc_name"],
+                d["hit_count"], d["similarity"], d["vector_similarity"],
+            )
+        return d
+
+    with _open_text(cache_path, "r") as f:
+        yield "header", _check_header(f.readline(), cache_path)
+        for line in f:
+            if line.startswith('{"$text"'):
+                d = json.loads(line)
+                store.restore(d["$text"], d["text"])
+                continue
+            obj = json.loads(line, object_hook=hook)
+            if isinstance(obj, dict) and "$meta" in obj:
+                yield "meta", obj["$meta"]
+            else:
+                yield "record", obj
+
+
+def iter_records(
+    cache_path: str,
+    *,
+    where: Optional[Callable[[Any], bool]] = None,
+) -> Iterator[Any]:
+    """流式读取记录（如 step4 的每个 sub-goal 结果）；where 为过滤条件"""
+    for kind, obj in _stream(cache_path):
+        if kind == "record" and (where is None or where(obj)):
+            yield obj
+
+
+def load_result(cache_path: str) -> Any:
+    header: Dict[str, Any] = {}
+    meta: Dict[str, Any] = {}
+    records = []
+    for kind, obj in _stream(cache_path):
+        if kind == "header":
+            header = obj
+        elif kind == "meta":
+            meta = obj
+        else:
+            records.append(obj)
+
+    if header["kind"] == "list":
+        return records
+    if header["records_key"]:
+        return {**meta, header["records_key"]: records}
+    return meta
+
+
+# =========================
+# 命令行：旧 pickle 缓存转换
+# =========================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Step cache tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="pickle → step cache（仅用于本地生成的可信文件）")
+    convert.add_argument("src")
+    convert.add_argument("dst")
+    info = sub.add_parser("info", help="打印头部信息")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        import pickle
+        with open(args.src, "rb") as f:
+            obj = pickle.load(f)
+        save_result(obj, args.dst)
+        print(f"{args.src} ({os.path.getsize(args.src)} B) → {args.dst} ({os.path.getsize(args.dst)} B)")
+    else:
+        print(json.dumps(read_header(args.path), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# upload_stream.py
+"""
+上传文件的流式处理：
+
+- save_upload_stream：边接收边落盘，超限立即中止，同时增量计算 sha256
+- store_blob：按内容哈希落到全局 blob 目录，相同内容只存一份
+- remove_blob_if_unreferenced：无引用时删除 blob（与进行中的同内容上传互斥）
+- MultipartFileStream：直接从磁盘文件构造 multipart/form-data 请求体，
+  交给 requests 按块读取发送（不在内存中拼完整 body）
+
+整个上传链路内存占用只与 chunk_size 相关，与文件大小无关。
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+async def save_upload_stream(
+    upload,
+    dest_path: str,
+    *,
+    max_size: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> StoredUpload:
+    """
+    upload 只需提供 async read(n)（FastAPI UploadFile 即可）。
+    超过 max_size 时删除已写入的部分文件并抛出 UploadTooLargeError。
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(dest_path, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(f"File too large (max {max_size // (1024 * 1024)}MB)")
+                digest.update(chunk)
+                # 磁盘写放到线程池，避免阻塞事件循环
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+
+    return StoredUpload(path=dest_path, size=size, sha256=digest.hexdigest())
+
+
+def blob_path(blob_root: str, sha256: str, ext: str = "") -> str:
+    """内容寻址路径：<root>/<sha 前两位>/<sha><ext>"""
+    return os.path.join(blob_root, sha256[:2], f"{sha256}{ext.lower()}")
+
+
+# =========================
+# blob 引用保护（进程内）
+# =========================
+# store_blob 之后、documents 行写入之前，blob 还没有任何行引用它；
+# 此时同内容的另一请求 release（上传失败 / 删除文档）按引用计数会删掉共享 blob。
+# - store_blob 为路径加 pin，调用方建行后 unpin_blob
+# - remove_blob_if_unreferenced 跳过被 pin 的路径；引用检查期间有新的 pin 时同样不删
+_blob_lock = threading.Lock()
+_blob_pins: Counter = Counter()         # 已落盘、尚未建行的上传数
+_blob_releasing: Counter = Counter()    # 正在检查引用的 release 数
+_blob_generation: Counter = Counter()   # 累计 pin 次数（仅在 pin / release 进行中保留）
+
+
+def _forget_blob(path: str) -> None:
+    """调用方持有 _blob_lock；无 pin 且无 release 进行中时清理记账"""
+    if not _blob_pins[path] and not _blob_releasing[path]:
+        _blob_pins.pop(path, None)
+        _blob_releasing.pop(path, None)
+        _blob_generation.pop(path, None)
+
+
+def unpin_blob(path: str) -> None:
+    """documents 行已写入（或上传放弃）后释放 store_blob 加的 pin；未 pin 的路径忽略"""
+    with _blob_lock:
+        if _blob_pins[path]:
+            _blob_pins[path] -= 1
+        _forget_blob(path)
+
+
+def store_blob(tmp_path: str, sha256: str, ext: str, blob_root: str) -> str:
+    """
+    把已落盘的临时文件移入内容寻址的 blob 目录，返回最终路径（已 pin，建行后需 unpin_blob）。
+    相同内容已存在时直接删除临时文件并复用已有 blob。
+    """
+    path = blob_path(blob_root, sha256, ext)
+    # 先 pin 再检查是否存在：pin 之后并发的 release 不会再删除该 blob
+    with _blob_lock:
+        _blob_pins[path] += 1
+        _blob_generation[path] += 1
+    try:
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 同一文件系统内原子替换；并发写入同一内容时后者覆盖前者，内容一致
+        os.replace(tmp_path, path)
+        return path
+    except BaseException:
+        unpin_blob(path)
+        raise
+
+
+def remove_blob_if_unreferenced(path: str, is_referenced: Callable[[], bool]) -> bool:
+    """
+    is_referenced()（如查询 documents 引用数）为假且期间没有同内容上传进入时删除 blob。
+    引用检查不持锁（可能是 DB 查询）；返回是否真正删除了文件。
+    """
+    with _blob_lock:
+        if _blob_pins[path]:
+            return False
+        _blob_releasing[path] += 1
+        generation = _blob_generation[path]
+    try:
+        referenced = is_referenced()
+    except BaseException:
+        with _blob_lock:
+            _blob_releasing[path] -= 1
+            _forget_blob(path)
+        raise
+    with _blob_lock:
+        _blob_releasing[path] -= 1
+        changed = bool(_blob_pins[path]) or _blob_generation[path] != generation
+        _forget_blob(path)
+        if referenced or changed:
+            return False
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class MultipartFileStream:
+    """
+    只读 file-like 对象：按需从磁盘读取，生成 multipart/form-data 请求体。
+
+    用法：
+        body = MultipartFileStream([("file", "a.pdf", "/path/a.pdf"), ...])
+        requests.post(url, data=body, headers={"Content-Type": body.content_type})
+
+    实现了 __len__，requests 会带上 Content-Length 并分块读取发送。
+    """
+
+    def __init__(
+        self,
+        files: List[Tuple[str, str, str]],
+        *,
+        boundary: Optional[str] = None,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+    ):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        # 片段：bytes（头部 / 分隔符）或 str（待读取的文件路径）
+        self._parts: List[object] = []
+        self._length = 0
+
+        for field_name, filename, path in files:
+            safe_name = filename.replace('"', "%22").replace("\r", "").replace("\n", "")
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{field_name}"; filename="{safe_name}"\r\n'
+                f"Content-Type: application/octet-stream\r\n\r\n"
+            ).encode("utf-8")
+            self._add(header)
+            self._parts.append(path)
+            self._length += os.path.getsize(path)
+            self._add(b"\r\n")
+        self._add(f"--{self.boundary}--\r\n".encode("utf-8"))
+
+        self._index = 0
+        self._current = None  # 当前打开的文件 / 内存片段的剩余字节
+
+    def _add(self, data: bytes) -> None:
+        self._parts.append(data)
+        self._length += len(data)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _read_part(self, size: int) -> bytes:
+        """从当前片段读至多 size 字节；当前片段读完返回 b""（并切换到下一片段）"""
+        while self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                if self._current is None:
+                    self._current = part
+                data, self._current = self._current[:size], self._current[size:]
+                if not self._current:
+                    self._current = None
+                    self._index += 1
+                if data:
+                    return data
+                continue
+
+            if self._current is None:
+                self._current = open(part, "rb")
+            data = self._current.read(size)
+            if data:
+                return data
+            self._current.close()
+            self._current = None
+            self._index += 1
+        return b""
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            out = bytearray()
+            while True:
+                data = self._read_part(self.chunk_size)
+                if not data:
+                    return bytes(out)
+                out += data
+        return self._read_part(size)
+
+    def close(self) -> None:
+        if self._current is not None and not isinstance(self._current, bytes):
+            self._current.close()
+        self._current = None
+        self._index = len(self._parts)